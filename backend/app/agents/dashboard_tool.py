@@ -1,11 +1,13 @@
 from langchain.tools import StructuredTool
 from langchain.pydantic_v1 import BaseModel, Field
-import plotly.graph_objects as go
-import plotly.express as px
 import pandas as pd
 import json
 import logging
-from typing import Dict, List, Any, Optional
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Union
+
+if TYPE_CHECKING:
+    # Plotly is only imported when a full figure is requested, it slows down worker startup
+    import plotly.graph_objects as go
 
 logger = logging.getLogger(__name__)
 
@@ -20,22 +22,27 @@ class VisualizationInput(BaseModel):
         default="auto",
         description="Type of chart: 'auto', 'bar', 'line', 'pie', or 'scatter'"
     )
+    full_figure: bool = Field(
+        default=False,
+        description="Also return a complete Plotly figure; the frontend only needs the chart config"
+    )
 
 
-def detect_chart_type(data: List[Dict[str, Any]]) -> str:
+def detect_chart_type(data: Union[List[Dict[str, Any]], pd.DataFrame]) -> str:
     """
     Auto-detect the best chart type based on data structure
     
     Args:
-        data: List of dictionaries containing the data
+        data: List of dictionaries or a DataFrame containing the data
         
     Returns:
         Chart type: 'bar', 'line', 'pie', 'scatter'
     """
-    if not data or len(data) == 0:
+    if data is None or len(data) == 0:
         return "bar"
     
-    df = pd.DataFrame(data)
+    # Frames from QueryResult.to_frame() are used as-is, with their dates typed
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
     
     # Check number of columns
     num_cols = len(df.columns)
@@ -61,7 +68,37 @@ def detect_chart_type(data: List[Dict[str, Any]]) -> str:
         return "bar"  # Default
 
 
-def create_plotly_chart(data: List[Dict[str, Any]], chart_type: str = "auto") -> go.Figure:
+def build_chart_config(data: Union[List[Dict[str, Any]], pd.DataFrame], chart_type: str) -> Dict[str, Any]:
+    """
+    Create the chart spec the frontend ChartRenderer draws from
+    
+    Args:
+        data: List of dictionaries or a DataFrame containing the data
+        chart_type: Type of chart, or 'auto' to detect it
+        
+    Returns:
+        Dict with type, x_axis, y_axis and title
+    """
+    # Detect chart type if auto
+    final_chart_type = chart_type if chart_type != "auto" else detect_chart_type(data)
+    
+    # Determine axes from data
+    if isinstance(data, pd.DataFrame):
+        columns = list(data.columns)
+    else:
+        columns = list(data[0].keys()) if data else []
+    x_axis = columns[0] if len(columns) > 0 else "x"
+    y_axis = columns[1] if len(columns) > 1 else columns[0] if len(columns) > 0 else "y"
+    
+    return {
+        "type": final_chart_type,
+        "x_axis": x_axis,
+        "y_axis": y_axis,
+        "title": f"{y_axis.replace('_', ' ').title()} by {x_axis.replace('_', ' ').title()}"
+    }
+
+
+def create_plotly_chart(data: List[Dict[str, Any]], chart_type: str = "auto") -> "go.Figure":
     """
     Create a Plotly chart from data
     
@@ -72,6 +109,9 @@ def create_plotly_chart(data: List[Dict[str, Any]], chart_type: str = "auto") ->
     Returns:
         Plotly Figure object
     """
+    import plotly.graph_objects as go
+    import plotly.express as px
+    
     if not data:
         # Return empty figure
         fig = go.Figure()
@@ -214,16 +254,17 @@ def create_plotly_chart(data: List[Dict[str, Any]], chart_type: str = "auto") ->
         return fig
 
 
-def generate_visualization(data: List[Dict[str, Any]], chart_type: str = "auto") -> str:
+def generate_visualization(data: List[Dict[str, Any]], chart_type: str = "auto", full_figure: bool = False) -> str:
     """
-    Generate interactive chart from data
+    Generate chart configuration from data
     
     Args:
         data: List of dictionaries containing the data to visualize
         chart_type: Type of chart ('auto', 'bar', 'line', 'pie', 'scatter')
+        full_figure: Also include a complete Plotly figure
         
     Returns:
-        JSON string with chart configuration
+        JSON string with chart configuration and data
     """
     try:
         logger.info(f"Dashboard Tool received {len(data)} data points, chart_type: {chart_type}")
@@ -235,22 +276,25 @@ def generate_visualization(data: List[Dict[str, Any]], chart_type: str = "auto")
                 "chart": None
             })
         
-        # Create chart
-        fig = create_plotly_chart(data, chart_type)
-        
-        # Convert to JSON
-        chart_json = fig.to_json()
+        # Same spec query_and_visualize returns, detected once
+        chart_config = build_chart_config(data, chart_type)
         
         response = {
             "success": True,
-            "chart": json.loads(chart_json),
-            "chart_type": chart_type if chart_type != "auto" else detect_chart_type(data),
+            "chart_config": chart_config,
+            "data": data,
+            "chart_type": chart_config["type"],
             "tool": "dashboard_tool"
         }
         
         logger.info(f"Dashboard Tool created {response['chart_type']} chart")
         
-        return json.dumps(response)
+        if not full_figure:
+            return json.dumps(response)
+        
+        # Splice the figure JSON in as-is instead of parsing and re-serializing it
+        fig = create_plotly_chart(data, chart_config["type"])
+        return json.dumps(response)[:-1] + ', "chart": ' + fig.to_json() + "}"
         
     except Exception as e:
         logger.error(f"Dashboard Tool error: {e}")
@@ -272,8 +316,8 @@ def create_dashboard_tool() -> StructuredTool:
         name="data_visualizer",
         description="""
         Use this tool to create interactive visualizations from data.
-        This tool takes structured data (usually from SQL queries) and generates
-        appropriate charts (bar, line, pie, scatter).
+        This tool takes structured data (usually from SQL queries) and returns
+        a chart configuration (bar, line, pie, scatter) for the frontend.
         
         Use this when:
         - User asks to visualize data
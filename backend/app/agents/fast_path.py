@@ -0,0 +1,377 @@
+from app.agents.sql_viz_tool import fetch_rows, afetch_rows
+from app.agents.dashboard_tool import build_chart_config
+from app.services.sql_cache import normalize_question
+from app.services.columnar import Plan
+from app.resources import get_registry
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import asyncio
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Words users use for each sales column, mapped to (column, default aggregate)
+METRICS = {
+    "total sales": ("total", "sum"),
+    "sales": ("total", "sum"),
+    "revenue": ("total", "sum"),
+    "income": ("total", "sum"),
+    "amount": ("total", "sum"),
+    "total": ("total", "sum"),
+    "quantity sold": ("quantity", "sum"),
+    "quantity": ("quantity", "sum"),
+    "units sold": ("quantity", "sum"),
+    "units": ("quantity", "sum"),
+    "items sold": ("quantity", "sum"),
+    "ratings": ("rating", "avg"),
+    "rating": ("rating", "avg"),
+    "customer rating": ("rating", "avg"),
+    "satisfaction": ("rating", "avg"),
+    "unit price": ("unit_price", "avg"),
+    "price": ("unit_price", "avg"),
+    "transactions": ("*", "count"),
+    "orders": ("*", "count"),
+    "purchases": ("*", "count"),
+}
+
+DIMENSIONS = {
+    "branches": "branch",
+    "branch": "branch",
+    "stores": "branch",
+    "store": "branch",
+    "product lines": "product_line",
+    "product line": "product_line",
+    "products": "product_line",
+    "product": "product_line",
+    "categories": "product_line",
+    "category": "product_line",
+    "customer types": "customer_type",
+    "customer type": "customer_type",
+    "membership": "customer_type",
+    "genders": "gender",
+    "gender": "gender",
+    "payment methods": "payment",
+    "payment method": "payment",
+    "payment types": "payment",
+    "payment type": "payment",
+    "payment": "payment",
+    "days": "day",
+    "day": "day",
+    "dates": "day",
+    "date": "day",
+    "weeks": "week",
+    "week": "week",
+    "months": "month",
+    "month": "month",
+}
+
+AGGREGATES = {
+    "total": "sum",
+    "sum of": "sum",
+    "sum": "sum",
+    "average": "avg",
+    "avg": "avg",
+    "mean": "avg",
+    "number of": "count",
+    "count of": "count",
+}
+
+PERIODS = {"daily": "day", "weekly": "week", "monthly": "month"}
+
+CHART_TYPES = {"bar": "bar", "line": "line", "pie": "pie", "scatter": "scatter"}
+
+
+def _alternation(words) -> str:
+    # Longest first so "product lines" wins over "product"
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+METRIC = f"(?:(?P<agg>{_alternation(AGGREGATES)}) )?(?P<metric>{_alternation(METRICS)})"
+DIMENSION = f"(?P<dim>{_alternation(DIMENSIONS)})"
+GROUP_WORDS = "by|per|for each|for every|across|grouped by|broken down by|in each"
+
+CHART_PREFIX = re.compile(
+    r"^(?:(?:visualize|visualise|plot|chart|graph|display|show|draw)(?: me)? )?"
+    r"(?:a |an )?(?:(?P<chart>bar|line|pie|scatter) )?(?:chart|graph|plot|visualization)?(?: of| for)? ?"
+)
+PATTERNS = {
+    "top_n": re.compile(
+        rf"^(?P<rank>top|bottom|best|worst|highest|lowest) (?P<n>\d{{1,3}}) {DIMENSION} "
+        rf"(?:by|in terms of|ranked by|for) {METRIC}$"
+    ),
+    "group_by": re.compile(rf"^{METRIC} (?:{GROUP_WORDS}) {DIMENSION}$"),
+    "dimension_by": re.compile(rf"^{DIMENSION} by {METRIC}$"),
+    "period": re.compile(rf"^(?P<period>{_alternation(PERIODS)}) {METRIC}$"),
+    "over_time": re.compile(rf"^{METRIC} over time$"),
+}
+
+
+@dataclass
+class Intent:
+    """A question shape the fast path can answer without an LLM"""
+    shape: str
+    metric: str  # sales column, or * for row counts
+    aggregate: str  # sum, avg or count
+    dimension: str  # sales column, or day/week/month for time series
+    limit: Optional[int] = None
+    descending: bool = True
+    chart_type: str = "auto"
+
+    @property
+    def is_time_series(self) -> bool:
+        return self.dimension in ("day", "week", "month")
+
+    @property
+    def is_chronological(self) -> bool:
+        """Time series in date order; a ranked time series ("top 5 months") sorts by the metric"""
+        return self.is_time_series and self.limit is None
+
+    @property
+    def metric_alias(self) -> str:
+        if self.aggregate == "count":
+            return "transactions"
+        prefix = "total" if self.aggregate == "sum" else "avg"
+        metric = "sales" if self.metric == "total" else self.metric
+        return f"{prefix}_{metric}"
+
+    @property
+    def dimension_alias(self) -> str:
+        return "date" if self.dimension == "day" else self.dimension
+
+    def to_sql(self) -> str:
+        """SQL built only from whitelisted column names and an integer limit"""
+        if self.dimension == "day":
+            dim_expr = "date"
+        elif self.is_time_series:
+            dim_expr = f"CAST(DATE_TRUNC('{self.dimension}', date) AS DATE)"
+        else:
+            dim_expr = self.dimension
+
+        if self.aggregate == "count":
+            agg_expr = "COUNT(*)"
+        elif self.aggregate == "avg":
+            agg_expr = f"ROUND(AVG({self.metric}), 2)"
+        else:
+            agg_expr = f"SUM({self.metric})"
+
+        if self.is_chronological:
+            order = "1"
+        else:
+            order = f"2 {'DESC' if self.descending else 'ASC'}"
+
+        if dim_expr != self.dimension_alias:
+            dim_expr = f"{dim_expr} AS {self.dimension_alias}"
+
+        sql = (
+            f"SELECT {dim_expr}, {agg_expr} AS {self.metric_alias} "
+            f"FROM sales GROUP BY 1 ORDER BY {order}"
+        )
+        if self.limit is not None:
+            sql += f" LIMIT {self.limit}"
+        return sql
+
+    def to_plan(self) -> Plan:
+        """Same query as to_sql, for the columnar store"""
+        return Plan(
+            group_by=self.dimension,
+            metric=self.metric,
+            aggregate=self.aggregate,
+            metric_alias=self.metric_alias,
+            dimension_alias=self.dimension_alias,
+            descending=self.descending,
+            limit=self.limit
+        )
+
+
+def match_question(question: str) -> Optional[Intent]:
+    """Match a question against the known shapes; None means ask the agent"""
+    text = normalize_question(question)
+    text = re.sub(r"\bthe\b", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+
+    chart_type = "auto"
+    prefix = CHART_PREFIX.match(text)
+    if prefix and prefix.group(0):
+        chart_type = CHART_TYPES.get(prefix.group("chart") or "", "auto")
+        text = text[prefix.end():].strip()
+
+    for shape, pattern in PATTERNS.items():
+        match = pattern.match(text)
+        if not match:
+            continue
+        groups = match.groupdict()
+
+        metric, default_aggregate = METRICS[groups["metric"]]
+        aggregate = AGGREGATES.get(groups.get("agg") or "", default_aggregate)
+        if metric == "*":
+            aggregate = "count"
+        elif aggregate == "count":
+            # "number of sales" counts rows rather than summing a column
+            metric = "*"
+
+        if shape == "period":
+            dimension = PERIODS[groups["period"]]
+        elif shape == "over_time":
+            dimension = "day"
+        else:
+            dimension = DIMENSIONS[groups["dim"]]
+
+        intent = Intent(
+            shape=shape,
+            metric=metric,
+            aggregate=aggregate,
+            dimension=dimension,
+            chart_type=chart_type
+        )
+        if shape == "top_n":
+            intent.limit = int(groups["n"])
+            intent.descending = groups["rank"] in ("top", "best", "highest")
+        if intent.is_chronological and chart_type == "auto":
+            intent.chart_type = "line"
+        return intent
+
+    return None
+
+
+def _format_value(value: Any) -> str:
+    return f"{value:,.2f}" if isinstance(value, float) else str(value)
+
+
+def _describe(intent: Intent, data: List[Dict[str, Any]]) -> str:
+    """Templated answer text, so no LLM is needed"""
+    x, y = intent.dimension_alias, intent.metric_alias
+    label = y.replace("_", " ")
+
+    if intent.is_chronological:
+        peak = max(data, key=lambda row: row[y] or 0)
+        return (
+            f"{label.capitalize()} by {intent.dimension} from {data[0][x]} to {data[-1][x]} "
+            f"({len(data)} periods). The peak was {_format_value(peak[y])} on {peak[x]}."
+        )
+
+    ranked = ", ".join(f"{row[x]} ({_format_value(row[y])})" for row in data[:5])
+    more = f", and {len(data) - 5} more" if len(data) > 5 else ""
+    direction = "highest" if intent.descending else "lowest"
+    return (
+        f"{label.capitalize()} by {x.replace('_', ' ')}, {direction} first: {ranked}{more}."
+    )
+
+
+def _build_result(intent: Intent, data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not data:
+        return {
+            "message": "No data found for your query.",
+            "success": True,
+            "tool_used": "fast_path"
+        }
+    chart_config = build_chart_config(data, intent.chart_type)
+    chart_config["title"] = (
+        f"{intent.metric_alias.replace('_', ' ').title()} by {intent.dimension_alias.replace('_', ' ').title()}"
+    )
+    return {
+        "message": _describe(intent, data),
+        "success": True,
+        "tool_used": "fast_path",
+        "chart_config": chart_config,
+        "chart_data": data,
+        "sources": None
+    }
+
+
+class FastPath:
+    """
+    Answers common analytic question shapes with templated SQL
+
+    Runs in front of the ManagerAgent and never calls an LLM. Questions
+    that do not fully match a known shape fall through to the agent.
+    With the columnar store enabled, queries run in memory and only go
+    to the database if that fails.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.columnar_hits = 0
+        self.seconds_total = 0.0
+
+    def answer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Answer the question, or None if the agent has to handle it"""
+        intent = self._match(question)
+        if intent is None:
+            return None
+        started = time.perf_counter()
+        try:
+            data = self._columnar_rows(intent)
+            if data is None:
+                data = fetch_rows(intent.to_sql())
+            result = _build_result(intent, data)
+        except Exception as e:
+            return self._failed(e)
+        return self._record(intent, result, started)
+
+    async def aanswer(self, question: str) -> Optional[Dict[str, Any]]:
+        """Async version of answer"""
+        intent = self._match(question)
+        if intent is None:
+            return None
+        started = time.perf_counter()
+        try:
+            data = await asyncio.to_thread(self._columnar_rows, intent)
+            if data is None:
+                data = await afetch_rows(intent.to_sql())
+            result = _build_result(intent, data)
+        except Exception as e:
+            return self._failed(e)
+        return self._record(intent, result, started)
+
+    def stats(self) -> Dict[str, Any]:
+        """Coverage and latency of the fast path"""
+        matched = self.hits + self.errors
+        questions = matched + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "columnar_hits": self.columnar_hits,
+            "coverage": matched / questions if questions else 0.0,
+            "avg_latency_ms": round(self.seconds_total / self.hits * 1000, 2) if self.hits else 0.0
+        }
+
+    def _match(self, question: str) -> Optional[Intent]:
+        if not self.enabled:
+            return None
+        intent = match_question(question)
+        if intent is None:
+            self.misses += 1
+        return intent
+
+    def _columnar_rows(self, intent: Intent) -> Optional[List[Dict[str, Any]]]:
+        """Rows from the columnar store, or None to query the database"""
+        try:
+            store = get_registry().get_columnar_store()
+            if store is None:
+                return None
+            data = store.execute(intent.to_plan())
+        except Exception as e:
+            logger.error(f"Columnar query failed, using the database: {e}")
+            return None
+        self.columnar_hits += 1
+        return data
+
+    def _failed(self, e: Exception) -> None:
+        # Let the agent try instead
+        self.errors += 1
+        logger.error(f"Fast path error: {e}")
+        return None
+
+    def _record(self, intent: Intent, result: Dict[str, Any], started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        self.hits += 1
+        self.seconds_total += elapsed
+        logger.info(f"Fast path answered {intent.shape} question in {elapsed * 1000:.1f} ms")
+        return result
@@ -1,30 +1,36 @@
-from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_openai_functions_agent
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from app.agents.sql_agent_tool import create_sql_agent_tool
 from app.agents.rag_tool import create_rag_tool
 from app.agents.dashboard_tool import create_dashboard_tool
-from app.agents.sql_viz_tool import create_sql_viz_tool
+from app.agents.sql_viz_tool import create_sql_viz_tool, take_chart_rows
+from app.agents.tool_router import ToolRouter, RouteDecision, VIZ_TOOL
+from app.agents.fast_path import CHART_TYPES
+from langchain_core.agents import AgentAction
 from app.config import get_settings
+from app.resources import get_registry
+from app.database import engine, async_engine
+from app.services.session_memory import SessionMemoryStore, BoundedSessionMemory
 import json
+import re
 import logging
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional, Union
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Tag on the manager LLM so its tokens can be told apart from the tools' LLMs when streaming
+MANAGER_LLM_TAG = "manager_llm"
+
 
 class ManagerAgent:
     """Manager Agent that orchestrates SQL, RAG, and Dashboard tools"""
     
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.openai_model,
+        self.llm = get_registry().get_llm(
             temperature=0.7,
-            openai_api_key=settings.openai_api_key,
-            base_url=settings.openai_base_url,
-            streaming=True
+            streaming=True,
+            tags=(MANAGER_LLM_TAG,)
         )
         
         self.tools = [
@@ -40,7 +46,37 @@ class ManagerAgent:
             prompt=self.prompt
         )
         
-        self.memories: Dict[str, ConversationBufferMemory] = {}
+        # Built once; session memory is passed in per message
+        self.executor = AgentExecutor(
+            agent=self.agent,
+            tools=self.tools,
+            verbose=True,
+            handle_parsing_errors=True,
+            max_iterations=5,
+            return_intermediate_steps=True
+        )
+        
+        # Bounded per-session history; old turns are summarized by a non-streaming LLM
+        self.memory_store = SessionMemoryStore(
+            llm=get_registry().get_llm(temperature=0),
+            model_name=settings.openai_model,
+            max_sessions=settings.session_max_count,
+            idle_ttl_seconds=settings.session_idle_ttl_seconds,
+            max_token_limit=settings.session_history_max_tokens,
+            max_messages=settings.session_history_max_messages,
+            engine=engine,
+            async_engine=async_engine,
+            rehydrate_turns=settings.session_rehydrate_turns
+        )
+        
+        # Calls the tool directly when the choice is obvious, saving the manager LLM turn
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        self.router = ToolRouter(
+            enabled=settings.router_enabled,
+            confidence_threshold=settings.router_confidence_threshold,
+            min_score=settings.router_min_score,
+            min_data_terms=settings.router_min_data_terms
+        )
         logger.info("Manager Agent initialized")
     
     def _create_prompt(self) -> ChatPromptTemplate:
@@ -69,81 +105,161 @@ Always provide clear, helpful responses."""
             MessagesPlaceholder(variable_name="agent_scratchpad")
         ])
     
-    def _get_memory(self, session_id: str) -> ConversationBufferMemory:
-        """Get or create memory for session"""
-        if session_id not in self.memories:
-            self.memories[session_id] = ConversationBufferMemory(
-                memory_key="chat_history",
-                return_messages=True
-            )
-        return self.memories[session_id]
+    def _get_memory(self, session_id: str) -> BoundedSessionMemory:
+        """Get memory for session, rehydrated from the conversations table when missing"""
+        return self.memory_store.get(session_id)
+    
+    def _prepare_input(self, message: str, session_id: str) -> Dict[str, Any]:
+        """Build executor input with the session chat history (already loaded for this message)"""
+        return {
+            "input": message,
+            **self.memory_store.load(session_id)
+        }
+    
+    def save_turn(self, session_id: str, message: str, output: str):
+        """Append the exchange to the session memory"""
+        self._get_memory(session_id).save_context({"input": message}, {"output": output})
+    
+    async def asave_turn(self, session_id: str, message: str, output: str):
+        """Async version of save_turn; old turns are summarized in the background, after the response"""
+        memory = await self.memory_store.aget(session_id)
+        await memory.asave_context({"input": message}, {"output": output})
+    
+    def _route(self, message: str, session_id: str) -> RouteDecision:
+        """Run the local router and log its decision"""
+        memory = self.memory_store.peek(session_id)
+        has_history = bool(memory and memory.chat_memory.messages)
+        decision = self.router.route(message, has_history=has_history)
+        self.router.log_decision(message, decision, routed=self.router.is_confident(decision))
+        return decision
+    
+    def _tool_input(self, tool_name: str, message: str) -> Union[str, Dict[str, Any]]:
+        """Input for calling a tool directly with the user message"""
+        if tool_name != VIZ_TOOL:
+            return message
+        # "line chart", not "product line"
+        chart = re.search(rf"\b({'|'.join(CHART_TYPES)}) (?:chart|graph|plot)", message.lower())
+        return {"query": message, "chart_type": CHART_TYPES[chart.group(1)] if chart else "auto"}
+    
+    def _routed_result(self, decision: RouteDecision, message: str, observation: str) -> Dict[str, Any]:
+        """Shape a direct tool call like an executor result with one step"""
+        try:
+            output = json.loads(observation).get("answer", observation)
+        except json.JSONDecodeError:
+            output = observation
+        action = AgentAction(
+            tool=decision.tool,
+            tool_input=self._tool_input(decision.tool, message),
+            log=f"Routed locally (confidence {decision.confidence:.2f})"
+        )
+        return {"output": output, "intermediate_steps": [(action, observation)]}
+    
+    def _routed_response(self, decision: RouteDecision, result: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+        """Build the response for a routed message"""
+        response = self._build_response(result, session_id)
+        response["tool_used"] = decision.tool
+        return response
+    
+    @staticmethod
+    def _agent_tool(result: Dict[str, Any]) -> Optional[str]:
+        """Last tool the agent called, if any"""
+        steps = result.get("intermediate_steps") or []
+        return getattr(steps[-1][0], "tool", None) if steps else None
+    
+    def _build_response(self, result: Dict[str, Any], session_id: str) -> Dict[str, Any]:
+        """Build chat response from agent result"""
+        # Extract chart config, data, and sources from intermediate steps
+        chart_config = None
+        chart_data = None
+        tool_used = None
+        sources = None
+        metadata = {}
+        
+        for step in result.get("intermediate_steps", []):
+            if len(step) >= 2:
+                action, observation = step[0], step[1]
+                tool_name = action.tool if hasattr(action, 'tool') else None
+                
+                # Check if this is a visualization tool
+                if tool_name in ['query_and_visualize', 'data_visualizer']:
+                    tool_used = tool_name
+                    try:
+                        tool_output = json.loads(observation)
+                        if tool_output.get("chart_config"):
+                            chart_config = tool_output.get("chart_config")
+                            # The output only previews the rows, the tool kept all of them for the response
+                            chart_data = take_chart_rows(tool_output.get("chart_id")) or tool_output.get("data", [])
+                            logger.info("Extracted chart config and data from tool output")
+                        if tool_output.get("result"):
+                            # Handle for paging the full result via /api/results/{result_id}
+                            metadata["result"] = tool_output["result"]
+                    except json.JSONDecodeError:
+                        logger.warning("Could not parse tool output as JSON")
+                
+                # Check if this is a RAG/document search tool
+                if tool_name == 'document_search':
+                    tool_used = tool_name
+                    try:
+                        tool_output = json.loads(observation)
+                        if tool_output.get("sources"):
+                            sources = tool_output.get("sources", [])
+                            logger.info(f"Extracted {len(sources)} sources from RAG tool")
+                    except json.JSONDecodeError:
+                        logger.warning("Could not parse RAG tool output as JSON")
+        
+        # Clean up the message - remove embedded source references like [^filename^]
+        clean_message = re.sub(r'\[\^[^\]]+\^\]', '', result["output"]).strip()
+        
+        return {
+            "message": clean_message,
+            "session_id": session_id,
+            "success": True,
+            "tool_used": tool_used,
+            "chart_config": chart_config,
+            "chart_data": chart_data,
+            "sources": sources,
+            "metadata": metadata or None
+        }
     
     def process_message(self, message: str, session_id: str) -> Dict[str, Any]:
         """Process user message"""
         try:
-            memory = self._get_memory(session_id)
+            self._get_memory(session_id)
+            decision = self._route(message, session_id)
+            if self.router.is_confident(decision):
+                observation = self.tools_by_name[decision.tool].invoke(self._tool_input(decision.tool, message))
+                result = self._routed_result(decision, message, observation)
+                self.save_turn(session_id, message, result["output"])
+                return self._routed_response(decision, result, session_id)
             
-            executor = AgentExecutor(
-                agent=self.agent,
-                tools=self.tools,
-                memory=memory,
-                verbose=True,
-                handle_parsing_errors=True,
-                max_iterations=5,
-                return_intermediate_steps=True
-            )
+            result = self.executor.invoke(self._prepare_input(message, session_id))
+            self.router.log_agent_choice(message, decision, self._agent_tool(result))
+            self.save_turn(session_id, message, result["output"])
+            return self._build_response(result, session_id)
             
-            result = executor.invoke({"input": message})
-            
-            # Extract chart config, data, and sources from intermediate steps
-            chart_config = None
-            chart_data = None
-            tool_used = None
-            sources = None
-            
-            for step in result.get("intermediate_steps", []):
-                if len(step) >= 2:
-                    action, observation = step[0], step[1]
-                    tool_name = action.tool if hasattr(action, 'tool') else None
-                    
-                    # Check if this is a visualization tool
-                    if tool_name in ['query_and_visualize', 'data_visualizer']:
-                        tool_used = tool_name
-                        try:
-                            tool_output = json.loads(observation)
-                            if tool_output.get("chart_config"):
-                                chart_config = tool_output.get("chart_config")
-                                chart_data = tool_output.get("data", [])
-                                logger.info("Extracted chart config and data from tool output")
-                        except json.JSONDecodeError:
-                            logger.warning("Could not parse tool output as JSON")
-                    
-                    # Check if this is a RAG/document search tool
-                    if tool_name == 'document_search':
-                        tool_used = tool_name
-                        try:
-                            tool_output = json.loads(observation)
-                            if tool_output.get("sources"):
-                                sources = tool_output.get("sources", [])
-                                logger.info(f"Extracted {len(sources)} sources from RAG tool")
-                        except json.JSONDecodeError:
-                            logger.warning("Could not parse RAG tool output as JSON")
-            
-            # Clean up the message - remove embedded source references like [^filename^]
-            import re
-            clean_message = re.sub(r'\[\^[^\]]+\^\]', '', result["output"]).strip()
-            
-            response = {
-                "message": clean_message,
+        except Exception as e:
+            logger.error(f"Manager Agent error: {e}")
+            return {
+                "message": f"Error: {str(e)}",
                 "session_id": session_id,
-                "success": True,
-                "tool_used": tool_used,
-                "chart_config": chart_config,
-                "chart_data": chart_data,
-                "sources": sources
+                "success": False
             }
+    
+    async def aprocess_message(self, message: str, session_id: str) -> Dict[str, Any]:
+        """Process user message without blocking the event loop"""
+        try:
+            await self.memory_store.aget(session_id)
+            decision = self._route(message, session_id)
+            if self.router.is_confident(decision):
+                observation = await self.tools_by_name[decision.tool].ainvoke(self._tool_input(decision.tool, message))
+                result = self._routed_result(decision, message, observation)
+                await self.asave_turn(session_id, message, result["output"])
+                return self._routed_response(decision, result, session_id)
             
-            return response
+            result = await self.executor.ainvoke(self._prepare_input(message, session_id))
+            self.router.log_agent_choice(message, decision, self._agent_tool(result))
+            await self.asave_turn(session_id, message, result["output"])
+            return self._build_response(result, session_id)
             
         except Exception as e:
             logger.error(f"Manager Agent error: {e}")
@@ -152,3 +268,68 @@ Always provide clear, helpful responses."""
                 "session_id": session_id,
                 "success": False
             }
+    
+    async def astream_message(self, message: str, session_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the agent run as events
+        
+        Yields dicts with "event" and "data" keys:
+        - token: {"content": str} for each manager LLM token
+        - tool_start: {"tool": str, "input": Any}
+        - tool_end: {"tool": str}
+        - final: the same response dict returned by aprocess_message
+        - error: {"message": str, "session_id": str, "success": False}
+        """
+        try:
+            await self.memory_store.aget(session_id)
+            decision = self._route(message, session_id)
+            if self.router.is_confident(decision):
+                tool_input = self._tool_input(decision.tool, message)
+                yield {"event": "tool_start", "data": {"tool": decision.tool, "input": tool_input}}
+                observation = await self.tools_by_name[decision.tool].ainvoke(tool_input)
+                yield {"event": "tool_end", "data": {"tool": decision.tool}}
+                result = self._routed_result(decision, message, observation)
+                await self.asave_turn(session_id, message, result["output"])
+                yield {"event": "final", "data": self._routed_response(decision, result, session_id)}
+                return
+            
+            result = None
+            
+            async for event in self.executor.astream_events(
+                self._prepare_input(message, session_id),
+                version="v2"
+            ):
+                kind = event["event"]
+                
+                if kind == "on_chat_model_stream" and MANAGER_LLM_TAG in event.get("tags", []):
+                    content = event["data"]["chunk"].content
+                    if content:
+                        yield {"event": "token", "data": {"content": content}}
+                
+                elif kind == "on_tool_start":
+                    yield {
+                        "event": "tool_start",
+                        "data": {"tool": event["name"], "input": event["data"].get("input")}
+                    }
+                
+                elif kind == "on_tool_end":
+                    yield {"event": "tool_end", "data": {"tool": event["name"]}}
+                
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # Root run finished - this is the executor output
+                    result = event["data"]["output"]
+            
+            self.router.log_agent_choice(message, decision, self._agent_tool(result))
+            await self.asave_turn(session_id, message, result["output"])
+            yield {"event": "final", "data": self._build_response(result, session_id)}
+            
+        except Exception as e:
+            logger.error(f"Manager Agent error: {e}")
+            yield {
+                "event": "error",
+                "data": {
+                    "message": f"Error: {str(e)}",
+                    "session_id": session_id,
+                    "success": False
+                }
+            }
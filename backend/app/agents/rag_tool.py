@@ -1,147 +1,210 @@
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
+from langchain.prompts import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.tools import Tool
-from langchain.docstore.document import Document as LangChainDocument
 from app.config import get_settings
-import os
+from app.resources import get_registry
+from app.services.vector_segments import SegmentedVectorStore
+from app.services.ann_index import IndexSpec
+from app.services.hybrid_retriever import HybridRetriever, RetrievalStats
+from typing import Dict, List, Optional, Tuple
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Sources are shown separately, so the answer should not cite them
+NO_CITATIONS = "IMPORTANT: Answer the question directly without mentioning or citing the source document names, filenames, or where the information comes from. Do not say 'according to', 'sourced from', or similar phrases."
+
+# RetrievalQA's default prompt with the instruction after the question; the
+# retriever only sees the question, which keeps the instruction out of searches
+QA_PROMPT = PromptTemplate(
+    template=(
+        "Use the following pieces of context to answer the question at the end. If you don't know the answer, "
+        "just say that you don't know, don't try to make up an answer.\n\n{context}\n\n"
+        "Question: {question}\n\n" + NO_CITATIONS + "\nHelpful Answer:"
+    ),
+    input_variables=["context", "question"]
+)
+
 
 class RAGService:
     """Service for managing RAG operations"""
     
     def __init__(self):
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=settings.openai_api_key,
-            base_url=settings.openai_base_url
-        )
-        self.llm = ChatOpenAI(
-            model=settings.openai_model,
-            temperature=0,
-            openai_api_key=settings.openai_api_key,
-            base_url=settings.openai_base_url
+        registry = get_registry()
+        self.embeddings = registry.get_embeddings()
+        self.llm = registry.get_llm(temperature=0)
+        self.segments = SegmentedVectorStore(
+            settings.vector_store_dir,
+            self.embeddings,
+            max_segments=settings.vector_store_max_segments,
+            tombstone_ratio=settings.vector_store_tombstone_ratio,
+            index_spec=IndexSpec(
+                index_type=settings.vector_index_type,
+                min_chunks=settings.vector_index_min_chunks,
+                nlist=settings.vector_index_nlist,
+                pq_m=settings.vector_index_pq_m,
+                hnsw_m=settings.vector_index_hnsw_m,
+                nprobe=settings.vector_index_nprobe,
+                ef_search=settings.vector_index_ef_search
+            ),
+            lexical=settings.rag_retrieval_mode != "vector"
         )
-        self.vector_store_path = os.path.join(settings.vector_store_dir, "faiss_index")
-        self.vector_store = None
+        self._qa_chains: Dict[int, RetrievalQA] = {}
+        self.retrieval_stats = RetrievalStats()
         self._load_vector_store()
     
+    @property
+    def vector_store(self):
+        """Current in-memory index (None when empty); compaction can replace it"""
+        return self.segments.vector_store
+    
     def _load_vector_store(self):
-        """Load existing vector store or create empty one"""
+        """Load existing vector store segments, if any"""
         try:
-            if os.path.exists(self.vector_store_path):
-                self.vector_store = FAISS.load_local(
-                    self.vector_store_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                logger.info("Loaded existing FAISS vector store")
-            else:
+            if self.segments.load() is None:
                 logger.info("No existing vector store found")
         except Exception as e:
             logger.error(f"Error loading vector store: {e}")
-            self.vector_store = None
     
-    def add_documents(self, texts: list[str], metadatas: list[dict]):
-        """Add documents to vector store"""
+    async def aembed_documents(self, texts: list[str]) -> Optional[Tuple[List[List[float]], dict]]:
+        """Embed document chunks; returns the vectors and the embedding usage, or None on failure"""
         try:
-            # Create LangChain documents
-            documents = [
-                LangChainDocument(page_content=text, metadata=metadata)
-                for text, metadata in zip(texts, metadatas)
-            ]
-            
-            if self.vector_store is None:
-                # Create new vector store
-                self.vector_store = FAISS.from_documents(documents, self.embeddings)
-            else:
-                # Add to existing vector store
-                self.vector_store.add_documents(documents)
-            
-            # Save vector store
-            os.makedirs(os.path.dirname(self.vector_store_path), exist_ok=True)
-            self.vector_store.save_local(self.vector_store_path)
-            
-            logger.info(f"Added {len(documents)} documents to vector store")
+            # Only chunks missing from the embedding cache are sent to the endpoint
+            vectors, usage = await self.embeddings.aembed_documents_with_usage(texts)
+            logger.info(f"Embedded {len(texts)} documents ({usage['embedded']} embedded, {usage['saved']} from cache)")
+            return vectors, usage
+        except Exception as e:
+            logger.error(f"Error embedding documents: {e}")
+            return None
+    
+    def add_documents(self, texts: list[str], vectors: List[List[float]], metadatas: list[dict]) -> bool:
+        """Add embedded documents to vector store; returns whether they were added"""
+        try:
+            # Written as a new segment, the existing ones are not rewritten
+            self.segments.add(texts, vectors, metadatas)
+            logger.info(f"Added {len(texts)} documents to vector store")
             return True
-            
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
             return False
     
-    def query(self, question: str, k: int = 4) -> dict:
-        """Query the vector store"""
+    def delete_document(self, document_id: int) -> int:
+        """Remove a document's chunks from search; returns how many were removed, raises if the store could not"""
         try:
-            if self.vector_store is None:
-                return {
-                    "answer": "No documents have been uploaded yet. Please upload documents first.",
-                    "sources": [],
-                    "success": False
-                }
-            
-            # Create retrieval QA chain
-            qa_chain = RetrievalQA.from_chain_type(
+            return self.segments.delete_document(document_id)
+        except Exception as e:
+            logger.error(f"Error deleting document chunks: {e}")
+            raise
+    
+    def delete_source(self, source: str) -> int:
+        """Remove chunks uploaded before document ids were recorded, by file name; returns how many, raises on failure"""
+        try:
+            return self.segments.delete_source(source)
+        except Exception as e:
+            logger.error(f"Error deleting document chunks: {e}")
+            raise
+    
+    def _get_qa_chain(self, k: int) -> RetrievalQA:
+        """Get retrieval QA chain over the vector store, built once per k"""
+        if k not in self._qa_chains:
+            self._qa_chains[k] = RetrievalQA.from_chain_type(
                 llm=self.llm,
                 chain_type="stuff",
-                retriever=self.vector_store.as_retriever(
-                    search_kwargs={"k": k}
+                retriever=HybridRetriever(
+                    store=self.segments,
+                    embeddings=self.embeddings,
+                    k=k,
+                    fetch_k=settings.rag_fetch_k,
+                    mode=settings.rag_retrieval_mode,
+                    keyword_only=settings.rag_keyword_only,
+                    keyword_max_df=settings.rag_keyword_max_df,
+                    stats=self.retrieval_stats
                 ),
+                chain_type_kwargs={"prompt": QA_PROMPT},
                 return_source_documents=True
             )
+        return self._qa_chains[k]
+    
+    def _format_result(self, result: dict) -> dict:
+        """Format QA chain result with deduplicated sources"""
+        sources = []
+        seen_sources = set()  # Track unique source+chunk combinations
+        
+        for doc in result.get("source_documents", []):
+            # Create unique key from source file and chunk number
+            source_file = doc.metadata.get("source", "unknown")
+            chunk_num = doc.metadata.get("chunk", 0)
+            source_key = f"{source_file}_{chunk_num}"
             
-            # Run query with instruction to not cite sources (they're shown separately)
-            modified_query = f"{question}\n\nIMPORTANT: Answer the question directly without mentioning or citing the source document names, filenames, or where the information comes from. Do not say 'according to', 'sourced from', or similar phrases."
-            result = qa_chain.invoke({"query": modified_query})
-            
-            # Extract sources with deduplication
-            sources = []
-            seen_sources = set()  # Track unique source+chunk combinations
-            
-            for doc in result.get("source_documents", []):
-                # Create unique key from source file and chunk number
-                source_file = doc.metadata.get("source", "unknown")
-                chunk_num = doc.metadata.get("chunk", 0)
-                source_key = f"{source_file}_{chunk_num}"
-                
-                # Skip if we've already seen this source+chunk
-                if source_key in seen_sources:
-                    continue
-                seen_sources.add(source_key)
-                
-                sources.append({
-                    "content": doc.page_content[:200] + "...",
-                    "metadata": doc.metadata
-                })
-            
-            return {
-                "answer": result["result"],
-                "sources": sources,
-                "success": True,
-                "tool": "rag_tool"
-            }
+            # Skip if we've already seen this source+chunk
+            if source_key in seen_sources:
+                continue
+            seen_sources.add(source_key)
+            
+            sources.append({
+                "content": doc.page_content[:200] + "...",
+                "metadata": doc.metadata
+            })
+        
+        return {
+            "answer": result["result"],
+            "sources": sources,
+            "success": True,
+            "tool": "rag_tool"
+        }
+    
+    def _no_documents_result(self) -> dict:
+        """Result returned when the vector store is empty"""
+        return {
+            "answer": "No documents have been uploaded yet. Please upload documents first.",
+            "sources": [],
+            "success": False
+        }
+    
+    def _error_result(self, e: Exception) -> dict:
+        """Result returned when querying fails"""
+        logger.error(f"Error querying vector store: {e}")
+        return {
+            "answer": f"Error querying documents: {str(e)}",
+            "sources": [],
+            "success": False,
+            "error": str(e)
+        }
+    
+    def query(self, question: str, k: int = 4) -> dict:
+        """Query the vector store"""
+        try:
+            if self.vector_store is None:
+                return self._no_documents_result()
+            
+            qa_chain = self._get_qa_chain(k)
+            result = qa_chain.invoke({"query": question})
+            return self._format_result(result)
             
         except Exception as e:
-            logger.error(f"Error querying vector store: {e}")
-            return {
-                "answer": f"Error querying documents: {str(e)}",
-                "sources": [],
-                "success": False,
-                "error": str(e)
-            }
+            return self._error_result(e)
+    
+    async def aquery(self, question: str, k: int = 4) -> dict:
+        """Query the vector store without blocking the event loop"""
+        try:
+            if self.vector_store is None:
+                return self._no_documents_result()
+            
+            qa_chain = self._get_qa_chain(k)
+            result = await qa_chain.ainvoke({"query": question})
+            return self._format_result(result)
+            
+        except Exception as e:
+            return self._error_result(e)
     
     def delete_all(self):
         """Delete all documents from vector store"""
         try:
-            if os.path.exists(self.vector_store_path):
-                import shutil
-                shutil.rmtree(os.path.dirname(self.vector_store_path))
-            self.vector_store = None
+            self.segments.clear()
+            self._qa_chains.clear()
             logger.info("Deleted all documents from vector store")
             return True
         except Exception as e:
@@ -185,9 +248,39 @@ def create_rag_tool() -> Tool:
             }
             return json.dumps(error_response)
     
+    async def arun_rag_query(query: str) -> str:
+        """
+        Async version of run_rag_query used by the async agent path
+        
+        Args:
+            query: Question about the uploaded documents
+            
+        Returns:
+            JSON string with answer and source citations
+        """
+        try:
+            logger.info(f"RAG Tool received query: {query}")
+            
+            result = await rag_service.aquery(query)
+            
+            logger.info(f"RAG Tool response: {result['answer'][:200]}...")
+            
+            return json.dumps(result)
+            
+        except Exception as e:
+            logger.error(f"RAG Tool error: {str(e)}")
+            error_response = {
+                "answer": f"Error processing your question: {str(e)}",
+                "sources": [],
+                "success": False,
+                "error": str(e)
+            }
+            return json.dumps(error_response)
+    
     return Tool(
         name="document_search",
         func=run_rag_query,
+        coroutine=arun_rag_query,
         description="""
         Use this tool to answer questions about uploaded documents.
         This tool searches through the document knowledge base and provides
@@ -1,10 +1,6 @@
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import create_sql_agent
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentType
 from langchain.tools import Tool
-from sqlalchemy import create_engine
 from app.config import get_settings
+from app.resources import get_registry
 import json
 import logging
 
@@ -18,27 +14,8 @@ def create_sql_agent_tool() -> Tool:
     Uses the latest LangChain SQL agent implementation
     """
     
-    # Create database connection
-    engine = create_engine(settings.database_url)
-    db = SQLDatabase(engine, include_tables=["sales"])
-    
-    # Create ChatOpenAI instance
-    llm = ChatOpenAI(
-        model=settings.openai_model,
-        temperature=0,
-        openai_api_key=settings.openai_api_key,
-        base_url=settings.openai_base_url
-    )
-    
-    # Create SQL agent
-    sql_agent = create_sql_agent(
-        llm=llm,
-        db=db,
-        agent_type=AgentType.OPENAI_FUNCTIONS,
-        verbose=True,
-        handle_parsing_errors=True,
-        max_iterations=10
-    )
+    # Shared, prebuilt SQL agent
+    sql_agent = get_registry().get_sql_agent()
     
     def run_sql_query(query: str) -> str:
         """
@@ -80,10 +57,47 @@ def create_sql_agent_tool() -> Tool:
             }
             return json.dumps(error_response)
     
+    async def arun_sql_query(query: str) -> str:
+        """
+        Async version of run_sql_query used by the async agent path
+        
+        Args:
+            query: Natural language question about sales data
+            
+        Returns:
+            JSON string with query results and metadata
+        """
+        try:
+            logger.info(f"SQL Agent received query: {query}")
+            
+            result = await sql_agent.ainvoke({"input": query})
+            output = result.get("output", "")
+            
+            response = {
+                "answer": output,
+                "tool": "sql_agent",
+                "success": True
+            }
+            
+            logger.info(f"SQL Agent response: {output[:200]}...")
+            
+            return json.dumps(response)
+            
+        except Exception as e:
+            logger.error(f"SQL Agent error: {str(e)}")
+            error_response = {
+                "answer": f"I encountered an error while querying the database: {str(e)}",
+                "tool": "sql_agent",
+                "success": False,
+                "error": str(e)
+            }
+            return json.dumps(error_response)
+    
     # Create and return the tool
     return Tool(
         name="sql_database_query",
         func=run_sql_query,
+        coroutine=arun_sql_query,
         description="""
         Use this tool to answer questions about sales data. 
         The database contains a 'sales' table with columns: 
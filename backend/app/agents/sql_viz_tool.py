@@ -1,18 +1,29 @@
-from langchain_community.utilities import SQLDatabase
-from langchain_openai import ChatOpenAI
 from langchain.tools import StructuredTool
 from langchain.pydantic_v1 import BaseModel, Field
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from app.config import get_settings
-from app.agents.dashboard_tool import detect_chart_type
+from app.resources import get_registry
+from app.agents.dashboard_tool import build_chart_config
+from app.services.query_results import QueryResult, read_result, aread_result
+from app.services.downsampling import downsample
+from collections import OrderedDict
 import pandas as pd
+import asyncio
 import json
+import threading
+import time
+import uuid
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
+# Chart rows waiting for the manager to put them in the response; the agent only sees a preview
+MAX_PENDING_CHARTS = 256
+_pending_charts: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+_pending_charts_lock = threading.Lock()
+
 
 class SQLVizInput(BaseModel):
     """Input schema for SQL visualization"""
@@ -25,6 +36,212 @@ class SQLVizInput(BaseModel):
     )
 
 
+def _sql_prompt(table_info: str, query: str) -> str:
+    """Build prompt asking the LLM to write SQL for the question"""
+    return f"""Given the following database schema:
+{table_info}
+
+Write a SQL query to answer this question: {query}
+
+Return ONLY the SQL query, nothing else. The query should return data suitable for visualization.
+For aggregations, use clear column aliases."""
+
+
+def _clean_sql(content: str) -> str:
+    """Strip markdown fences from generated SQL"""
+    sql_query = content.strip()
+    return sql_query.replace("```sql", "").replace("```", "").strip()
+
+
+def _get_cached_result(registry, sql_query: str, data_version: int) -> Optional[QueryResult]:
+    """Get the converted result of the query from the result cache"""
+    if registry.result_cache is None:
+        return None
+    data = registry.result_cache.get(sql_query, data_version)
+    if data is not None:
+        logger.info("Serving query result from cache")
+    return data
+
+
+def _put_cached_result(registry, sql_query: str, data_version: int, data: QueryResult):
+    """Store the converted result of the query in the result cache"""
+    if registry.result_cache is not None:
+        registry.result_cache.put(sql_query, data_version, data)
+
+
+def _run_sql(registry, sql_query: str) -> QueryResult:
+    # Server-side cursor, so rows past query_max_rows never leave the database
+    with registry.engine.connect().execution_options(stream_results=True) as conn:
+        return read_result(conn.execute(text(sql_query)), max_rows=settings.query_max_rows)
+
+
+async def _arun_sql(registry, sql_query: str) -> QueryResult:
+    async with registry.async_engine.connect() as conn:
+        result = await conn.stream(text(sql_query))
+        return await aread_result(result, max_rows=settings.query_max_rows)
+
+
+def _execute_query(registry, db, sql_query: str) -> QueryResult:
+    """Run the query, on a sales rollup when one can answer it"""
+    routed = db.route_query(sql_query)
+    try:
+        return _run_sql(registry, routed)
+    except Exception:
+        if routed == sql_query:
+            raise
+        logger.warning("Rollup query failed, falling back to sales table")
+        return _run_sql(registry, sql_query)
+
+
+async def _aexecute_query(registry, db, sql_query: str) -> QueryResult:
+    """Async version of _execute_query"""
+    routed = await asyncio.to_thread(db.route_query, sql_query)
+    try:
+        return await _arun_sql(registry, routed)
+    except Exception:
+        if routed == sql_query:
+            raise
+        logger.warning("Rollup query failed, falling back to sales table")
+        return await _arun_sql(registry, sql_query)
+
+
+def fetch_result(sql_query: str) -> QueryResult:
+    """
+    Run a query over sales and return its columns
+    
+    Served from the result cache when this data version already answered
+    the query, otherwise run on a sales rollup when one can answer it.
+    """
+    registry = get_registry()
+    db = registry.get_sql_database()
+    data_version = db.current_data_version()
+    data = _get_cached_result(registry, sql_query, data_version)
+    if data is None:
+        data = _execute_query(registry, db, sql_query)
+        _put_cached_result(registry, sql_query, data_version, data)
+    return data
+
+
+async def afetch_result(sql_query: str) -> QueryResult:
+    """Async version of fetch_result"""
+    registry = get_registry()
+    db = await asyncio.to_thread(registry.get_sql_database)
+    data_version = await asyncio.to_thread(db.current_data_version)
+    data = _get_cached_result(registry, sql_query, data_version)
+    if data is None:
+        data = await _aexecute_query(registry, db, sql_query)
+        _put_cached_result(registry, sql_query, data_version, data)
+    return data
+
+
+def fetch_rows(sql_query: str) -> List[Dict[str, Any]]:
+    """Run a query over sales and return JSON-ready row dicts"""
+    return fetch_result(sql_query).to_records()
+
+
+async def afetch_rows(sql_query: str) -> List[Dict[str, Any]]:
+    """Async version of fetch_rows"""
+    return (await afetch_result(sql_query)).to_records()
+
+
+def _answer_prompt(data: List[Dict[str, Any]], query: str) -> str:
+    """Build prompt asking the LLM to summarize the query result"""
+    return f"""Based on this data: {json.dumps(data[:5])}...
+        
+Answer the question: {query}
+
+Provide a clear, concise answer with key insights.
+DO NOT include any images, charts, base64 data, or markdown image syntax in your response.
+The visualization is handled separately by the frontend."""
+
+
+def _no_data_response() -> str:
+    return json.dumps({
+        "success": False,
+        "answer": "No data found for your query.",
+        "data": [],
+        "chart": None
+    })
+
+
+def _chart_data(result: QueryResult, frame: pd.DataFrame, chart_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Rows for the chart, downsampled to the point budget of its type"""
+    data, sampling = downsample(
+        result,
+        frame,
+        chart_config["type"],
+        max_points=settings.chart_max_points,
+        max_categories=settings.chart_max_categories
+    )
+    if sampling:
+        chart_config["downsampled"] = sampling
+        logger.info(f"Downsampled {sampling['original_points']} rows to {sampling['points']} points ({sampling['method']})")
+    return data
+
+
+def _result_handle(registry, result: QueryResult, data: List[Dict[str, Any]], chart_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the full result for /api/results/{id} when the chart rows are not all of it"""
+    complete = len(data) == len(result) and "downsampled" not in chart_config
+    return {
+        "result_id": None if complete else registry.result_store.put(result),
+        "total_rows": len(result),
+        "preview_rows": len(data),
+        "downsampled": chart_config.get("downsampled", {}).get("method"),
+        "truncated": result.truncated
+    }
+
+
+def _stash_chart_rows(data: List[Dict[str, Any]]) -> str:
+    """Keep the chart rows for the response under an id, dropping the oldest never collected"""
+    chart_id = uuid.uuid4().hex
+    with _pending_charts_lock:
+        _pending_charts[chart_id] = data
+        while len(_pending_charts) > MAX_PENDING_CHARTS:
+            _pending_charts.popitem(last=False)
+    return chart_id
+
+
+def take_chart_rows(chart_id: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """Chart rows stashed by the tool for its output, once"""
+    if not chart_id:
+        return None
+    with _pending_charts_lock:
+        return _pending_charts.pop(chart_id, None)
+
+
+def _success_response(
+    answer: str,
+    data: List[Dict[str, Any]],
+    chart_config: Dict[str, Any],
+    handle: Dict[str, Any]
+) -> str:
+    # The manager re-reads this output on every later step, so it holds a few rows and the id of the rest
+    response = {
+        "success": True,
+        "answer": answer,
+        "data": data[:settings.query_preview_rows],
+        "chart_id": _stash_chart_rows(data),
+        "chart_config": chart_config,
+        "result": handle,
+        "tool": "sql_viz_tool"
+    }
+    
+    logger.info(f"SQL+Viz Tool completed successfully")
+    
+    return json.dumps(response)
+
+
+def _error_response(e: Exception) -> str:
+    logger.error(f"SQL+Viz Tool error: {e}", exc_info=True)
+    return json.dumps({
+        "success": False,
+        "answer": f"I encountered an error while processing your request: {str(e)}",
+        "data": [],
+        "chart": None,
+        "error": str(e)
+    })
+
+
 def query_and_visualize(query: str, chart_type: str = "auto") -> str:
     """
     Query the database and create a visualization in one step
@@ -39,122 +256,114 @@ def query_and_visualize(query: str, chart_type: str = "auto") -> str:
     try:
         logger.info(f"SQL+Viz Tool received query: {query}")
         
-        # Create database connection
-        engine = create_engine(settings.database_url)
+        registry = get_registry()
+        llm = registry.get_llm(temperature=0)
+        
+        # Reuse SQL generated for the same or a similar question
+        sql_cache = registry.get_sql_cache()
+        cached = sql_cache.lookup(query) if sql_cache else None
+        
+        if cached and cached.sql:
+            sql_query = cached.sql
+            logger.info(f"Cached SQL: {sql_query}")
+        else:
+            # Generate SQL query using LLM
+            started = time.perf_counter()
+            table_info = registry.get_sql_database().get_table_info()
+            response = llm.invoke(_sql_prompt(table_info, query))
+            sql_query = _clean_sql(response.content)
+            generation_seconds = time.perf_counter() - started
+            
+            logger.info(f"Generated SQL: {sql_query}")
         
-        # Create LLM to convert natural language to SQL
-        llm = ChatOpenAI(
-            model=settings.openai_model,
-            temperature=0,
-            openai_api_key=settings.openai_api_key,
-            base_url=settings.openai_base_url
-        )
+        # Execute the query
+        result = fetch_result(sql_query)
         
-        # Create SQL database wrapper
-        db = SQLDatabase(engine, include_tables=["sales"])
+        logger.info(f"Query returned {len(result)} rows")
         
-        # Get table info
-        table_info = db.get_table_info()
+        if not len(result):
+            return _no_data_response()
         
-        # Generate SQL query using LLM
-        sql_prompt = f"""Given the following database schema:
-{table_info}
+        # SQL ran and returned rows, so it is safe to reuse
+        if cached and not cached.sql:
+            sql_cache.store(cached, sql_query, generation_seconds)
+        
+        frame = result.to_frame()
+        chart_config = build_chart_config(frame, chart_type)
+        # Only chart rows within the point budget go to the browser, the rest is paged on demand
+        data = _chart_data(result, frame, chart_config)
+        handle = _result_handle(registry, result, data, chart_config)
+        
+        # Generate natural language answer
+        answer_response = llm.invoke(_answer_prompt(data, query))
+        
+        return _success_response(answer_response.content, data, chart_config, handle)
+        
+    except Exception as e:
+        return _error_response(e)
 
-Write a SQL query to answer this question: {query}
 
-Return ONLY the SQL query, nothing else. The query should return data suitable for visualization.
-For aggregations, use clear column aliases."""
+async def aquery_and_visualize(query: str, chart_type: str = "auto") -> str:
+    """
+    Async version of query_and_visualize used by the async agent path
+    
+    Args:
+        query: Natural language question about sales data
+        chart_type: Type of chart to create
         
-        response = llm.invoke(sql_prompt)
-        sql_query = response.content.strip()
+    Returns:
+        JSON string with answer, data, and chart
+    """
+    try:
+        logger.info(f"SQL+Viz Tool received query: {query}")
         
-        # Clean up the SQL query
-        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+        registry = get_registry()
+        llm = registry.get_llm(temperature=0)
         
-        logger.info(f"Generated SQL: {sql_query}")
+        # Reuse SQL generated for the same or a similar question
+        sql_cache = registry.get_sql_cache()
+        cached = await sql_cache.alookup(query) if sql_cache else None
         
-        # Execute the query
-        with engine.connect() as conn:
-            result = conn.execute(text(sql_query))
-            rows = result.fetchall()
-            columns = list(result.keys())
+        if cached and cached.sql:
+            sql_query = cached.sql
+            logger.info(f"Cached SQL: {sql_query}")
+        else:
+            # Generate SQL query using LLM
+            started = time.perf_counter()
+            # Schema reflection is sync-only in SQLDatabase, keep it off the event loop
+            db = await asyncio.to_thread(registry.get_sql_database)
+            table_info = await asyncio.to_thread(db.get_table_info)
+            response = await llm.ainvoke(_sql_prompt(table_info, query))
+            sql_query = _clean_sql(response.content)
+            generation_seconds = time.perf_counter() - started
             
-            # Convert to list of dicts with proper type handling
-            data = []
-            for row in rows:
-                row_dict = {}
-                for col, val in zip(columns, row):
-                    # Convert Decimal to float for JSON serialization
-                    if hasattr(val, '__float__'):
-                        row_dict[col] = float(val)
-                    elif hasattr(val, '__str__') and not isinstance(val, str):
-                        row_dict[col] = str(val)
-                    else:
-                        row_dict[col] = val
-                data.append(row_dict)
-        
-        logger.info(f"Query returned {len(data)} rows")
-        
-        if not data:
-            return json.dumps({
-                "success": False,
-                "answer": "No data found for your query.",
-                "data": [],
-                "chart": None
-            })
-        
-        # Detect chart type if auto
-        final_chart_type = chart_type if chart_type != "auto" else detect_chart_type(data)
-        
-        # Determine axes from data
-        columns = list(data[0].keys()) if data else []
-        x_axis = columns[0] if len(columns) > 0 else "x"
-        y_axis = columns[1] if len(columns) > 1 else columns[0] if len(columns) > 0 else "y"
-        
-        # Create chart configuration for frontend
-        chart_config = {
-            "type": final_chart_type,
-            "x_axis": x_axis,
-            "y_axis": y_axis,
-            "title": f"{y_axis.replace('_', ' ').title()} by {x_axis.replace('_', ' ').title()}"
-        }
+            logger.info(f"Generated SQL: {sql_query}")
         
-        # Generate natural language answer
-        answer_prompt = f"""Based on this data: {json.dumps(data[:5])}...
+        # Execute the query
+        result = await afetch_result(sql_query)
         
-Answer the question: {query}
-
-Provide a clear, concise answer with key insights.
-DO NOT include any images, charts, base64 data, or markdown image syntax in your response.
-The visualization is handled separately by the frontend."""
+        logger.info(f"Query returned {len(result)} rows")
         
-        answer_response = llm.invoke(answer_prompt)
-        answer = answer_response.content
+        if not len(result):
+            return _no_data_response()
         
-        response = {
-            "success": True,
-            "answer": answer,
-            "data": data,
-            "chart_config": chart_config,
-            "tool": "sql_viz_tool"
-        }
+        # SQL ran and returned rows, so it is safe to reuse
+        if cached and not cached.sql:
+            sql_cache.store(cached, sql_query, generation_seconds)
         
-        logger.info(f"SQL+Viz Tool completed successfully")
+        frame = result.to_frame()
+        chart_config = build_chart_config(frame, chart_type)
+        # Only chart rows within the point budget go to the browser, the rest is paged on demand
+        data = _chart_data(result, frame, chart_config)
+        handle = _result_handle(registry, result, data, chart_config)
+        
+        # Generate natural language answer
+        answer_response = await llm.ainvoke(_answer_prompt(data, query))
         
-        return json.dumps(response)
+        return _success_response(answer_response.content, data, chart_config, handle)
         
     except Exception as e:
-        logger.error(f"SQL+Viz Tool error: {e}", exc_info=True)
-        import traceback
-        error_details = traceback.format_exc()
-        logger.error(f"Full traceback: {error_details}")
-        return json.dumps({
-            "success": False,
-            "answer": f"I encountered an error while processing your request: {str(e)}",
-            "data": [],
-            "chart": None,
-            "error": str(e)
-        })
+        return _error_response(e)
 
 
 def create_sql_viz_tool() -> StructuredTool:
@@ -162,6 +371,7 @@ def create_sql_viz_tool() -> StructuredTool:
     
     return StructuredTool.from_function(
         func=query_and_visualize,
+        coroutine=aquery_and_visualize,
         name="query_and_visualize",
         description="""
         Use this tool to query sales data AND create visualizations in one step.
@@ -0,0 +1,175 @@
+from app.agents.fast_path import METRICS, DIMENSIONS
+from app.services.sql_cache import normalize_question
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import json
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+SQL_TOOL = "sql_database_query"
+RAG_TOOL = "document_search"
+VIZ_TOOL = "query_and_visualize"
+
+# Keyword rules from the manager prompt, with weights
+VIZ_KEYWORDS = {
+    "visualize": 2.0, "visualise": 2.0, "visualization": 2.0, "visualisation": 2.0,
+    "chart": 2.0, "graph": 2.0, "plot": 2.0, "draw": 2.0, "histogram": 2.0,
+    "pie": 1.0, "trend": 1.0, "show": 0.5, "display": 0.5,
+}
+RAG_KEYWORDS = {
+    "document": 2.0, "documents": 2.0, "uploaded": 2.0, "upload": 2.0, "pdf": 2.0,
+    "file": 1.5, "files": 1.5, "policy": 1.5, "manual": 1.5, "handbook": 1.5,
+    "contract": 1.5, "according to": 1.5, "report": 1.0, "says": 1.0, "mention": 1.0,
+}
+DATA_KEYWORDS = {
+    **{word: 1.0 for word in list(METRICS) + list(DIMENSIONS)},
+    "how many": 1.0, "average": 1.0, "top": 1.0, "highest": 1.0, "lowest": 1.0,
+    "compare": 1.0, "breakdown": 1.0, "per": 0.5, "by": 0.5,
+}
+
+# Follow-ups need the chat history to be rewritten into a standalone question
+FOLLOW_UP = re.compile(
+    r"\b(it|that|this|those|these|them|same|again|instead|also|previous|above|"
+    r"what about|how about|and for|now)\b"
+)
+
+
+def _keyword_pattern(keywords: Dict[str, float]) -> re.Pattern:
+    alternation = "|".join(re.escape(word) for word in sorted(keywords, key=len, reverse=True))
+    return re.compile(rf"\b({alternation})\b")
+
+
+VIZ_PATTERN = _keyword_pattern(VIZ_KEYWORDS)
+RAG_PATTERN = _keyword_pattern(RAG_KEYWORDS)
+DATA_PATTERN = _keyword_pattern(DATA_KEYWORDS)
+
+
+def _score(pattern: re.Pattern, keywords: Dict[str, float], text: str) -> float:
+    return sum(keywords[match] for match in pattern.findall(text))
+
+
+@dataclass
+class RouteDecision:
+    """Tool picked for a message; tool is None when nothing matched"""
+    tool: Optional[str]
+    confidence: float
+    scores: Dict[str, float] = field(default_factory=dict)
+    reason: str = ""
+
+
+class ToolRouter:
+    """
+    Picks the manager's tool with weighted keyword rules instead of an LLM turn
+
+    Chart words only count as a visualization request when the message also
+    talks about sales data. Confidence is the winning tool's share of the
+    evidence, which is 1.0 whenever a single tool matched at all, so the
+    winner also needs a score of min_score, and the SQL tools at least
+    min_data_terms distinct data terms (a metric and a dimension, say):
+    one generic word like "sales" or "store" is not enough. Below those,
+    below confidence_threshold, and for follow-ups that depend on the chat
+    history, the decision is left to the agent.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        confidence_threshold: float = 0.8,
+        min_score: float = 2.0,
+        min_data_terms: int = 2
+    ):
+        self.enabled = enabled
+        self.confidence_threshold = confidence_threshold
+        self.min_score = min_score
+        self.min_data_terms = min_data_terms
+
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+        # Fallbacks where the router had a guess, checked against the tool the agent used
+        self.shadow_checked = 0
+        self.shadow_agreed = 0
+
+    def route(self, message: str, has_history: bool = False) -> RouteDecision:
+        """Score the message for each tool"""
+        text = normalize_question(message)
+        viz = _score(VIZ_PATTERN, VIZ_KEYWORDS, text)
+        rag = _score(RAG_PATTERN, RAG_KEYWORDS, text)
+        data = _score(DATA_PATTERN, DATA_KEYWORDS, text)
+        # Connectives like "by" and "per" add to the score but are not data terms of their own
+        data_terms = {match for match in DATA_PATTERN.findall(text) if DATA_KEYWORDS[match] >= 1.0}
+
+        scores = {
+            VIZ_TOOL: viz + data if viz and data else 0.0,
+            RAG_TOOL: rag,
+            # Weak display words ("show") leave the plain SQL answer in play
+            SQL_TOOL: max(data - viz, 0.0),
+        }
+        total = sum(scores.values())
+        if not total:
+            return RouteDecision(None, 0.0, scores, "no keywords")
+
+        tool = max(scores, key=scores.get)
+        decision = RouteDecision(tool, scores[tool] / total, scores)
+
+        if has_history and FOLLOW_UP.search(text):
+            decision.reason = "follow-up"
+        elif scores[tool] < self.min_score:
+            decision.reason = "weak evidence"
+        elif tool != RAG_TOOL and len(data_terms) < self.min_data_terms:
+            decision.reason = "too few data terms"
+        elif decision.confidence < self.confidence_threshold:
+            decision.reason = "ambiguous"
+        return decision
+
+    def is_confident(self, decision: RouteDecision) -> bool:
+        """Whether the tool can be called directly"""
+        return self.enabled and decision.tool is not None and not decision.reason
+
+    def log_decision(self, message: str, decision: RouteDecision, routed: bool):
+        """Log one JSON line per decision so router accuracy can be audited"""
+        with self._lock:
+            if routed:
+                self.routed += 1
+            else:
+                self.fallbacks += 1
+        logger.info("Router decision: " + json.dumps({
+            "message": message,
+            "tool": decision.tool,
+            "confidence": round(decision.confidence, 3),
+            "scores": decision.scores,
+            "routed": routed,
+            "reason": decision.reason or None
+        }))
+
+    def log_agent_choice(self, message: str, decision: RouteDecision, agent_tool: Optional[str]):
+        """Compare the router's guess on a fallback with the tool the agent picked"""
+        if decision.tool is None:
+            return
+        agreed = decision.tool == agent_tool
+        with self._lock:
+            self.shadow_checked += 1
+            self.shadow_agreed += agreed
+        logger.info("Router shadow check: " + json.dumps({
+            "message": message,
+            "router_tool": decision.tool,
+            "confidence": round(decision.confidence, 3),
+            "agent_tool": agent_tool,
+            "agreed": agreed
+        }))
+
+    def stats(self) -> Dict[str, Any]:
+        """Routing rate and agreement with the agent on fallbacks"""
+        decisions = self.routed + self.fallbacks
+        return {
+            "enabled": self.enabled,
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "routed_rate": self.routed / decisions if decisions else 0.0,
+            "shadow_checked": self.shadow_checked,
+            "shadow_agreement": self.shadow_agreed / self.shadow_checked if self.shadow_checked else 0.0,
+            "confidence_threshold": self.confidence_threshold
+        }
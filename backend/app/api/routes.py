@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
@@ -8,11 +8,19 @@ from app.models.schemas import (
 )
 from app.services.chat_service import ChatService
 from app.services.document_service import DocumentService
-from typing import List
+from app.agents.rag_tool import rag_service
+from app.resources import get_registry
+from app.config import get_settings
+from typing import Dict, List
+import asyncio
+import json
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 router = APIRouter()
+ws_router = APIRouter()
 
 # Initialize services
 chat_service = ChatService()
@@ -20,13 +28,12 @@ document_service = DocumentService()
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest):
     """Chat endpoint with agent"""
     try:
         response = await chat_service.process_message(
             message=request.message,
-            session_id=request.session_id,
-            db=db
+            session_id=request.session_id
         )
         return response
     except Exception as e:
@@ -34,6 +41,95 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat endpoint streaming tokens, tool events and the final payload as SSE"""
+    return StreamingResponse(
+        chat_service.stream_message(
+            message=request.message,
+            session_id=request.session_id
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+        }
+    )
+
+
+@ws_router.websocket("/chat")
+async def chat_socket(websocket: WebSocket):
+    """
+    WebSocket chat channel carrying many sessions over one connection
+    
+    Client frames: {"type": "chat", "session_id", "message"} starts a run,
+    {"type": "cancel", "session_id"} aborts the session's in-flight run.
+    Server frames: {"type": <event>, "session_id", "data"} with the same
+    events as /api/chat/stream plus "cancelled".
+    """
+    await websocket.accept()
+    runs: Dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    
+    async def send(event: str, session_id: str, data: dict):
+        async with send_lock:
+            await websocket.send_text(json.dumps(
+                {"type": event, "session_id": session_id, "data": data},
+                default=str
+            ))
+    
+    async def run_chat(message: str, session_id: str):
+        try:
+            async for event in chat_service.stream_events(message, session_id):
+                await send(event["event"], session_id, event["data"])
+        except Exception as e:
+            logger.error(f"Chat WebSocket run error: {e}")
+        finally:
+            if runs.get(session_id) is asyncio.current_task():
+                del runs[session_id]
+    
+    try:
+        while True:
+            try:
+                payload = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await send("error", None, {"message": "Invalid JSON frame", "success": False})
+                continue
+            
+            frame_type = payload.get("type")
+            session_id = payload.get("session_id")
+            
+            if frame_type == "chat":
+                message = (payload.get("message") or "").strip()
+                if not message:
+                    await send("error", session_id, {"message": "Empty message", "success": False})
+                    continue
+                session_id = session_id or str(uuid.uuid4())
+                if session_id in runs:
+                    await send("error", session_id, {"message": "Session already has a run in progress", "success": False})
+                    continue
+                runs[session_id] = asyncio.create_task(run_chat(message, session_id))
+            
+            elif frame_type == "cancel":
+                task = runs.pop(session_id, None)
+                if task is None:
+                    continue
+                # Cancelling the task aborts the awaited LLM/SQL calls of the agent run
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await send("cancelled", session_id, {})
+                logger.info(f"Cancelled chat run for session {session_id}")
+            
+            else:
+                await send("error", session_id, {"message": f"Unknown frame type: {frame_type}", "success": False})
+    
+    except WebSocketDisconnect:
+        logger.info("Chat WebSocket disconnected")
+    finally:
+        for task in runs.values():
+            task.cancel()
+
+
 @router.post("/upload", response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
@@ -86,3 +182,40 @@ async def health_check(db: Session = Depends(get_db)):
         "vector_store": "healthy",
         "openai": "healthy"
     }
+
+
+@router.get("/stats")
+async def stats():
+    """Runtime statistics for shared resources"""
+    registry = get_registry()
+    sql_cache = registry.get_sql_cache()
+    columnar_store = registry.get_columnar_store()
+    return {
+        "resources": registry.stats(),
+        "embeddings": registry.get_embeddings().stats(),
+        "fast_path": chat_service.fast_path.stats(),
+        "router": chat_service.manager_agent.router.stats(),
+        "session_memory": chat_service.manager_agent.memory_store.stats(),
+        "history_writer": chat_service.history_writer.stats(),
+        "sql_cache": sql_cache.stats() if sql_cache else None,
+        "result_cache": registry.result_cache.stats() if registry.result_cache else None,
+        "result_store": registry.result_store.stats(),
+        "columnar": columnar_store.stats() if columnar_store else None,
+        "vector_store": rag_service.segments.stats(),
+        "retrieval": rag_service.retrieval_stats.snapshot()
+    }
+
+
+@router.get("/results/{result_id}")
+async def result_page(result_id: str, cursor: int = Query(0, ge=0), limit: int = Query(1000, ge=1)):
+    """Page through a stored query result; next_cursor is null on the last page"""
+    page = get_registry().result_store.page(result_id, cursor, min(limit, settings.result_page_max_rows))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return page
+
+
+@router.get("/schema")
+async def schema_snapshot():
+    """Inspect the cached sales schema snapshot used by the SQL tools"""
+    return get_registry().get_sql_database().snapshot()
@@ -9,6 +9,9 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_model: str = "gpt-4"
     openai_base_url: str = "https://us.api.openai.com/v1"
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_timeout: float = 120.0
     
     # Database
     database_url: str
@@ -16,11 +19,64 @@ class Settings(BaseSettings):
     postgres_password: str = "postgres"
     postgres_db: str = "ai_assistant"
     
+    # Caching
+    cache_dir: str = "./cache"
+    schema_cache_check_interval: float = 30.0  # Seconds between data version checks
+    sql_cache_enabled: bool = True
+    sql_cache_similarity_threshold: float = 0.95
+    sql_cache_max_entries: int = 1000
+    sql_cache_ttl_seconds: int = 7 * 24 * 3600
+    embedding_cache_enabled: bool = True  # Chunk and query embeddings by content hash under cache_dir
+    embedding_cache_max_bytes: int = 512 * 1024 * 1024
+    result_cache_enabled: bool = True
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    rollups_enabled: bool = True
+    query_max_rows: int = 100_000  # Rows read from a visualization query, the rest is not fetched
+    query_preview_rows: int = 20  # Chart rows in the tool output the agent reads; the response carries all of them
+    chart_max_points: int = 500  # Line and scatter charts are downsampled to this many points
+    chart_max_categories: int = 30  # Bar and pie charts keep this many categories, the rest become "Other"
+    result_store_max_bytes: int = 256 * 1024 * 1024
+    result_store_ttl_seconds: float = 3600.0
+    result_page_max_rows: int = 5000
+    columnar_enabled: bool = False  # Serve fast-path queries from in-memory column arrays
+    columnar_threads: int = 4
+    columnar_snapshots: bool = True  # Memory-mapped snapshots under cache_dir/columnar
+    
+    # Agent routing
+    fast_path_enabled: bool = True
+    router_enabled: bool = True
+    router_confidence_threshold: float = 0.8
+    router_min_score: float = 2.0
+    router_min_data_terms: int = 2  # Distinct data terms the SQL tools need to be called without the agent
+    
+    # Session memory
+    session_max_count: int = 1000
+    session_idle_ttl_seconds: float = 3600.0
+    session_history_max_tokens: int = 2000
+    session_history_max_messages: int = 20
+    session_rehydrate_turns: int = 10
+    history_queue_max: int = 10000
+    history_batch_size: int = 200
+    history_flush_interval: float = 0.5
+    
     # Application
     backend_host: str = "0.0.0.0"
     backend_port: int = 8000
     upload_dir: str = "./uploads"
     vector_store_dir: str = "./vector_store"
+    vector_store_max_segments: int = 16  # Uploads past this many segments trigger a background merge
+    vector_store_tombstone_ratio: float = 0.2  # Deleted chunks, as a share of the index, that trigger compaction
+    vector_index_type: str = "flat"  # flat, ivf_flat, ivf_pq or hnsw
+    vector_index_min_chunks: int = 50_000  # Exact search below this many chunks whatever the type
+    vector_index_nlist: int = 0  # IVF lists, 0 for 4 * sqrt(chunks)
+    vector_index_pq_m: int = 64
+    vector_index_hnsw_m: int = 32
+    vector_index_nprobe: int = 16
+    vector_index_ef_search: int = 64
+    rag_retrieval_mode: str = "hybrid"  # vector, or hybrid to fuse BM25 and vector results
+    rag_fetch_k: int = 20  # Candidates from each of BM25 and vector search before fusion
+    rag_keyword_only: bool = True  # Skip the query embedding when BM25 finds the identifiers asked about
+    rag_keyword_max_df: int = 20  # Identifiers in more chunks than this are not confident enough
     
     # CORS
     frontend_url: str = "http://localhost:3000"
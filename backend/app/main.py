@@ -1,8 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
-from app.database import engine, Base
+from app.api.routes import router, ws_router, chat_service
+from app.database import engine, async_engine, Base
+from app.models.database_models import Conversation
 from app.config import get_settings
+from app.resources import get_registry
+from app.agents.rag_tool import rag_service
+import asyncio
 import logging
 
 # Configure logging
@@ -17,6 +21,10 @@ settings = get_settings()
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+# create_all skips indexes of tables that already exist
+for index in Conversation.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
 # Create FastAPI app
 app = FastAPI(
     title="AI Assistant API",
@@ -35,6 +43,7 @@ app.add_middleware(
 
 # Include routes
 app.include_router(router, prefix="/api")
+app.include_router(ws_router, prefix="/ws")
 
 
 @app.on_event("startup")
@@ -42,6 +51,31 @@ async def startup_event():
     """Startup event"""
     logger.info("Starting AI Assistant API")
     logger.info(f"OpenAI Model: {settings.openai_model}")
+    
+    # Build the schema snapshot before the first SQL request needs it
+    await asyncio.to_thread(get_registry().get_sql_database().get_table_info)
+    
+    # Load the columnar copy of sales (or map its snapshot) before the first fast-path query
+    columnar_store = get_registry().get_columnar_store()
+    if columnar_store is not None:
+        try:
+            await asyncio.to_thread(columnar_store.get)
+        except Exception as e:
+            logger.error(f"Error loading columnar store: {e}")
+    
+    chat_service.history_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Shutdown event"""
+    # Write queued conversation history before the engines go away
+    await chat_service.history_writer.stop()
+    # Let a running segment merge finish its manifest swap
+    await asyncio.to_thread(rag_service.segments.close)
+    await get_registry().aclose()
+    await async_engine.dispose()
+    logger.info("Stopped AI Assistant API")
 
 
 @app.get("/")
@@ -1,3 +1,3 @@
-from app.models.database_models import Sales, Document, Conversation
+from app.models.database_models import Sales, Document, Conversation, DataVersion, IngestWatermark
 
-__all__ = ["Sales", "Document", "Conversation"]
+__all__ = ["Sales", "Document", "Conversation", "DataVersion", "IngestWatermark"]
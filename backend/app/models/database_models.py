@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Numeric, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Date, Numeric, DateTime, Text, JSON, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -6,6 +6,10 @@ from app.database import Base
 class Sales(Base):
     """Sales data table"""
     __tablename__ = "sales"
+    __table_args__ = (
+        # Identity of incrementally ingested rows (NULL for rows loaded otherwise)
+        Index("idx_sales_source_row", "source", "source_row", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
@@ -19,6 +23,11 @@ class Sales(Base):
     rating = Column(Numeric(3, 1))
     total = Column(Numeric(10, 2))  # Computed: unit_price * quantity
     
+    # Set by incremental ingestion: source file, data row number in it, content hash
+    source = Column(String(255))
+    source_row = Column(Integer)
+    row_hash = Column(BigInteger)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -42,6 +51,10 @@ class Document(Base):
 class Conversation(Base):
     """Conversation history table"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Latest turns of a session, used to rehydrate chat memory
+        Index("idx_conversations_session_created", "session_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(100), index=True)
@@ -53,3 +66,23 @@ class Conversation(Base):
     extra_data = Column(JSON, default={})  # Store sources, charts, etc.
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DataVersion(Base):
+    """Version counter per dataset, bumped whenever its data or schema changes"""
+    __tablename__ = "data_versions"
+    
+    name = Column(String(50), primary_key=True)  # e.g. sales
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class IngestWatermark(Base):
+    """How far each source file has been ingested incrementally"""
+    __tablename__ = "ingest_watermarks"
+    
+    source = Column(String(255), primary_key=True)
+    row_count = Column(Integer, nullable=False, default=0)  # Data rows ingested so far
+    byte_offset = Column(BigInteger, nullable=False, default=0)  # File position after the last ingested row
+    tail_hash = Column(String(32))  # MD5 of the bytes just before byte_offset, detects rewritten files
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
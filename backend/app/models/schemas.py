@@ -29,6 +29,7 @@ class DocumentUploadResponse(BaseModel):
     file_type: str
     chunk_count: int
     upload_date: datetime
+    embedding: Optional[Dict[str, Any]] = None  # texts, embedded, saved, hit_ratio
     message: str
 
 
@@ -0,0 +1,190 @@
+from langchain_community.agent_toolkits import create_sql_agent
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain.agents import AgentExecutor, AgentType
+from app.database import engine, async_engine
+from app.services.schema_cache import CachedSQLDatabase
+from app.services.sql_cache import SemanticSQLCache
+from app.services.result_cache import SQLResultCache
+from app.services.columnar import ColumnarStore
+from app.services.result_store import ResultStore
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.config import get_settings
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+import httpx
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class ResourceRegistry:
+    """
+    Process-wide owner of the database engines, LLM/embedding clients and
+    prebuilt agents shared by the tools in app/agents
+    """
+
+    def __init__(self):
+        # Reuse the pooled engines from app.database instead of creating new ones
+        self.engine = engine
+        self.async_engine = async_engine
+
+        # One connection pool to the OpenAI API for every LLM and embedding client
+        limits = httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=settings.openai_timeout)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=settings.openai_timeout)
+
+        self._lock = threading.Lock()
+        self._llms: Dict[Tuple, ChatOpenAI] = {}
+        self._embeddings: Optional[CachedEmbeddings] = None
+        self._sql_database: Optional[CachedSQLDatabase] = None
+        self._sql_agent: Optional[AgentExecutor] = None
+        self._sql_cache: Optional[SemanticSQLCache] = None
+        self._columnar_store: Optional[ColumnarStore] = None
+        self.result_cache: Optional[SQLResultCache] = (
+            SQLResultCache(max_bytes=settings.result_cache_max_bytes)
+            if settings.result_cache_enabled else None
+        )
+        self.result_store = ResultStore(
+            max_bytes=settings.result_store_max_bytes,
+            ttl_seconds=settings.result_store_ttl_seconds
+        )
+        logger.info("Resource registry initialized")
+
+    def get_llm(
+        self,
+        temperature: float = 0,
+        streaming: bool = False,
+        tags: Tuple[str, ...] = ()
+    ) -> ChatOpenAI:
+        """Get shared chat model for the given settings"""
+        key = (temperature, streaming, tags)
+        with self._lock:
+            if key not in self._llms:
+                self._llms[key] = ChatOpenAI(
+                    model=settings.openai_model,
+                    temperature=temperature,
+                    openai_api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    streaming=streaming,
+                    tags=list(tags),
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client
+                )
+            return self._llms[key]
+
+    def get_embeddings(self) -> CachedEmbeddings:
+        """Get shared embeddings client, which only sends texts missing from the embedding cache"""
+        with self._lock:
+            if self._embeddings is None:
+                model = "text-embedding-3-small"
+                client = OpenAIEmbeddings(
+                    model=model,
+                    openai_api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    http_client=self.http_client,
+                    http_async_client=self.http_async_client
+                )
+                cache = (
+                    EmbeddingCache(
+                        os.path.join(settings.cache_dir, "embeddings.sqlite"),
+                        max_bytes=settings.embedding_cache_max_bytes
+                    )
+                    if settings.embedding_cache_enabled else None
+                )
+                self._embeddings = CachedEmbeddings(client, model=model, cache=cache)
+            return self._embeddings
+
+    def get_sql_database(self) -> CachedSQLDatabase:
+        """Get shared SQLDatabase wrapper over the sales table"""
+        with self._lock:
+            if self._sql_database is None:
+                self._sql_database = CachedSQLDatabase(
+                    self.engine,
+                    include_tables=["sales"],
+                    result_cache=self.result_cache
+                )
+            return self._sql_database
+
+    def get_sql_agent(self) -> AgentExecutor:
+        """Get prebuilt SQL agent executor"""
+        db = self.get_sql_database()
+        llm = self.get_llm(temperature=0)
+        with self._lock:
+            if self._sql_agent is None:
+                self._sql_agent = create_sql_agent(
+                    llm=llm,
+                    db=db,
+                    agent_type=AgentType.OPENAI_FUNCTIONS,
+                    verbose=True,
+                    handle_parsing_errors=True,
+                    max_iterations=10
+                )
+            return self._sql_agent
+
+    def get_sql_cache(self) -> Optional[SemanticSQLCache]:
+        """Get shared NL-to-SQL cache (None when disabled)"""
+        if not settings.sql_cache_enabled:
+            return None
+        embeddings = self.get_embeddings()
+        db = self.get_sql_database()
+        with self._lock:
+            if self._sql_cache is None:
+                self._sql_cache = SemanticSQLCache(
+                    embeddings=embeddings,
+                    cache_dir=settings.cache_dir,
+                    similarity_threshold=settings.sql_cache_similarity_threshold,
+                    max_entries=settings.sql_cache_max_entries,
+                    ttl_seconds=settings.sql_cache_ttl_seconds,
+                    dimension_values=db.dimension_values
+                )
+            return self._sql_cache
+
+    def get_columnar_store(self) -> Optional[ColumnarStore]:
+        """Get shared in-memory columnar copy of sales (None when disabled)"""
+        if not settings.columnar_enabled:
+            return None
+        db = self.get_sql_database()
+        with self._lock:
+            if self._columnar_store is None:
+                self._columnar_store = ColumnarStore(
+                    self.engine,
+                    get_data_version=db.current_data_version,
+                    snapshot_dir=os.path.join(settings.cache_dir, "columnar") if settings.columnar_snapshots else None,
+                    threads=settings.columnar_threads
+                )
+            return self._columnar_store
+
+    def stats(self) -> Dict[str, Any]:
+        """Connection and client counts for monitoring"""
+        return {
+            "engine_pool": self.engine.pool.status(),
+            "engine_connections_checked_out": self.engine.pool.checkedout(),
+            "async_engine_pool": self.async_engine.pool.status(),
+            "async_engine_connections_checked_out": self.async_engine.pool.checkedout(),
+            "llm_clients": len(self._llms),
+            "embeddings_client": self._embeddings is not None,
+            "sql_agent": self._sql_agent is not None
+        }
+
+    async def aclose(self):
+        """Persist caches and close the shared HTTP clients"""
+        if self._sql_cache is not None:
+            self._sql_cache.save()
+        if self._columnar_store is not None:
+            self._columnar_store.close()
+        if self._embeddings is not None:
+            self._embeddings.close()
+        self.http_client.close()
+        await self.http_async_client.aclose()
+
+
+@lru_cache()
+def get_registry() -> ResourceRegistry:
+    """Get process-wide resource registry"""
+    return ResourceRegistry()
@@ -0,0 +1,138 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+import math
+import faiss
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# k-means wants at least this many training points per centroid
+POINTS_PER_CENTROID = 40
+
+
+@dataclass
+class IndexSpec:
+    """
+    Which FAISS index to build over the chunk vectors, and how to search it
+
+    Below min_chunks (or with index_type "flat") searches are exact
+    brute-force scans. Above it IVF indexes probe nprobe of nlist inverted
+    lists, IVF-PQ also compresses vectors to pq_m bytes, and HNSW walks a
+    graph with ef_search candidates.
+    """
+    index_type: str = "flat"
+    min_chunks: int = 50_000
+    nlist: int = 0  # IVF lists, 0 for 4 * sqrt(chunks)
+    pq_m: int = 64  # IVF-PQ subquantizers, rounded down to a divisor of the dimension
+    pq_bits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    nprobe: int = 16
+    ef_search: int = 64
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type {self.index_type!r}, expected one of {INDEX_TYPES}")
+
+    def wants_ann(self, chunks: int) -> bool:
+        return self.index_type != "flat" and chunks >= self.min_chunks
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in ("ivf_flat", "ivf_pq")
+
+    def build_params(self) -> Dict[str, Any]:
+        """Parameters a trained index depends on; search parameters are left out"""
+        params = asdict(self)
+        for name in ("min_chunks", "nprobe", "ef_search"):
+            params.pop(name)
+        return params
+
+
+def nlist_for(spec: IndexSpec, chunks: int) -> int:
+    nlist = spec.nlist or int(4 * math.sqrt(chunks))
+    return max(1, min(nlist, chunks // POINTS_PER_CENTROID))
+
+
+def training_size(spec: IndexSpec, chunks: int) -> int:
+    """Vectors to train on: enough for the coarse and the PQ centroids, capped by the corpus"""
+    wanted = POINTS_PER_CENTROID * nlist_for(spec, chunks)
+    if spec.index_type == "ivf_pq":
+        wanted = max(wanted, POINTS_PER_CENTROID * 2 ** spec.pq_bits)
+    return min(chunks, max(wanted, 10_000))
+
+
+def _pq_m(spec: IndexSpec, dimension: int) -> int:
+    return max(m for m in range(1, min(spec.pq_m, dimension) + 1) if dimension % m == 0)
+
+
+def new_index(spec: IndexSpec, dimension: int, chunks: int) -> faiss.Index:
+    """Empty index for a corpus of about this many chunks; IVF indexes still need train()"""
+    if not spec.wants_ann(chunks):
+        return faiss.IndexFlatL2(dimension)
+    if spec.index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, spec.hnsw_m)
+        index.hnsw.efConstruction = spec.ef_construction
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        nlist = nlist_for(spec, chunks)
+        if spec.index_type == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_m(spec, dimension), spec.pq_bits)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    set_search_params(index, spec.nprobe, spec.ef_search)
+    return index
+
+
+def train(index: faiss.Index, sample: np.ndarray):
+    """Train an IVF index on a sample of the corpus"""
+    if index.is_trained:
+        return
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    # Lets FAISS reconstruct vectors by id, which LangChain's MMR search does
+    faiss.extract_index_ivf(index).make_direct_map()
+
+
+def set_search_params(index: faiss.Index, nprobe: int, ef_search: int):
+    """Search-time knobs: lists probed by IVF, candidates kept by HNSW"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    elif index_type(index).startswith("ivf"):
+        faiss.extract_index_ivf(index).nprobe = nprobe
+
+
+def index_type(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def sample_rows(segments: List[np.ndarray], size: int, seed: int = 0) -> np.ndarray:
+    """Random rows drawn from each segment in proportion to its size"""
+    total = sum(len(vectors) for vectors in segments)
+    rng = np.random.default_rng(seed)
+    parts = []
+    for vectors in segments:
+        take = min(len(vectors), math.ceil(len(vectors) * size / total))
+        rows = np.sort(rng.choice(len(vectors), take, replace=False))
+        parts.append(np.asarray(vectors[rows], dtype=np.float32))
+    return np.concatenate(parts)[:size]
+
+
+def describe(index: faiss.Index) -> Dict[str, Any]:
+    """Type, size and search parameters of an index"""
+    info = {"type": index_type(index), "ntotal": index.ntotal}
+    if isinstance(index, faiss.IndexHNSW):
+        info["ef_search"] = index.hnsw.efSearch
+    elif info["type"] != "flat":
+        ivf = faiss.extract_index_ivf(index)
+        info["nlist"] = ivf.nlist
+        info["nprobe"] = ivf.nprobe
+    return info
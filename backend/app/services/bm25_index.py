@@ -0,0 +1,129 @@
+from array import array
+from collections import Counter
+from typing import Collection, Dict, List, Tuple
+import math
+import re
+import numpy as np
+
+# Words joined by - _ . / : stay one token (SKU-1042, E_CONN_RESET, 4.2.1), and their parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from had has have how i if in into is it its of on or so
+such than that the their then there these they this to was were what when where which who why will with
+you your about after all also any been before being both each more most no not only other our out over
+same should some very would
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms of a text, without stopwords"""
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+
+def is_identifier(term: str) -> bool:
+    """Terms like SKUs, policy numbers and error codes: letters or separators mixed with digits"""
+    if term.isdigit():
+        # Long numbers only, not years or counts
+        return len(term) >= 5
+    return len(term) >= 3 and any(c.isdigit() for c in term)
+
+
+class BM25Index:
+    """
+    In-memory inverted index over chunk texts, scored with Okapi BM25
+
+    Postings are appended per added chunk, so an add costs the tokens of
+    its own chunks. Searches do not lock: writers append lengths before
+    postings, and readers score copies of the postings made by slicing,
+    which holds the GIL and, unlike a numpy view, leaves the arrays free
+    to grow.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._total_length = 0
+        self._postings: Dict[str, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, ids: List[str], texts: List[str]):
+        """Index chunks under their ids"""
+        for chunk_id, text in zip(ids, texts):
+            terms = Counter(tokenize(text))
+            position = len(self.ids)
+            if position >= len(self._lengths):
+                self._lengths = np.concatenate([self._lengths, np.zeros(len(self._lengths), dtype=np.float32)])
+            self._lengths[position] = sum(terms.values())
+            self._total_length += sum(terms.values())
+            self.ids.append(chunk_id)
+            self._positions[chunk_id] = position
+            for term, count in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("i"), array("i"))
+                postings[0].append(position)
+                postings[1].append(count)
+
+    def document_frequency(self, term: str) -> int:
+        postings = self._postings.get(term)
+        return len(postings[0]) if postings else 0
+
+    def contains(self, chunk_id: str, terms: Collection[str]) -> bool:
+        """Whether the chunk has every one of the terms"""
+        position = self._positions.get(chunk_id)
+        if position is None:
+            return False
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None or position not in postings[0]:
+                return False
+        return True
+
+    def search(self, query: str, k: int, exclude: Collection[str] = ()) -> List[Tuple[str, float]]:
+        """Top k chunk ids by BM25 score for the query, skipping excluded ids"""
+        n = len(self.ids)
+        terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+        if not n or not terms:
+            return []
+        average_length = max(self._total_length / n, 1.0)
+
+        positions, weights = [], []
+        for term in terms:
+            docs, counts = self._postings[term]
+            # Slices are private copies; numpy over the live arrays would block appends to them
+            docs = np.array(docs[:], dtype=np.int64)
+            counts = np.array(counts[:], dtype=np.float32)
+            size = min(len(docs), len(counts))
+            docs, counts = docs[:size], counts[:size]
+            idf = math.log(1 + (n - size + 0.5) / (size + 0.5))
+            lengths = self._lengths[docs]
+            norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            positions.append(docs)
+            weights.append(idf * counts * (self.k1 + 1) / (counts + norm))
+
+        candidates, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weights))
+        order = np.argsort(-scores, kind="stable")
+        hits = []
+        for i in order:
+            chunk_id = self.ids[candidates[i]]
+            if chunk_id in exclude:
+                continue
+            hits.append((chunk_id, float(scores[i])))
+            if len(hits) == k:
+                break
+        return hits
@@ -1,11 +1,15 @@
 from app.agents.manager_agent import ManagerAgent
-from app.models.database_models import Conversation
-from sqlalchemy.orm import Session
+from app.agents.fast_path import FastPath
+from app.config import get_settings
+from app.services.history_writer import ConversationWriter
+from app.database import async_engine
+from typing import AsyncIterator, Optional
 import uuid
 import json
 import logging
 
 logger = logging.getLogger(__name__)
+settings = get_settings()
 
 
 class ChatService:
@@ -13,12 +17,19 @@ class ChatService:
     
     def __init__(self):
         self.manager_agent = ManagerAgent()
+        self.fast_path = FastPath(enabled=settings.fast_path_enabled)
+        # History is written behind the response, in batches
+        self.history_writer = ConversationWriter(
+            async_engine,
+            max_queue=settings.history_queue_max,
+            batch_size=settings.history_batch_size,
+            flush_interval=settings.history_flush_interval
+        )
     
     async def process_message(
         self,
         message: str,
-        session_id: str,
-        db: Session
+        session_id: str
     ) -> dict:
         """Process chat message through manager agent"""
         
@@ -26,22 +37,59 @@ class ChatService:
         if not session_id:
             session_id = str(uuid.uuid4())
         
-        # Process through manager agent
-        result = self.manager_agent.process_message(message, session_id)
-        
-        # Save to conversation history
-        try:
-            conversation = Conversation(
-                session_id=session_id,
-                user_message=message,
-                agent_response=result.get("message", ""),
-                tool_used=result.get("tool_used"),
-                extra_data=result.get("metadata", {})  # Renamed from metadata
-            )
-            db.add(conversation)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error saving conversation: {e}")
-            db.rollback()
+        # Answer common question shapes without the LLM, otherwise use the manager agent
+        result = await self._afast_path(message, session_id)
+        if result is None:
+            result = await self.manager_agent.aprocess_message(message, session_id)
+        
+        self.history_writer.enqueue(session_id, message, result)
         
         return result
+    
+    async def stream_events(self, message: str, session_id: str) -> AsyncIterator[dict]:
+        """
+        Process chat message and yield agent events as they happen
+        
+        Yields dicts with "event" and "data" keys: a leading session event,
+        then the events of ManagerAgent.astream_message.
+        """
+        if not session_id:
+            session_id = str(uuid.uuid4())
+        
+        yield {"event": "session", "data": {"session_id": session_id}}
+        
+        result = await self._afast_path(message, session_id)
+        if result is not None:
+            yield {"event": "final", "data": result}
+            self.history_writer.enqueue(session_id, message, result)
+            return
+        
+        async for event in self.manager_agent.astream_message(message, session_id):
+            yield event
+            
+            if event["event"] in ("final", "error"):
+                self.history_writer.enqueue(session_id, message, event["data"])
+    
+    async def stream_message(self, message: str, session_id: str) -> AsyncIterator[str]:
+        """
+        Process chat message and yield Server-Sent Events frames
+        
+        Each frame is "event: <name>\ndata: <json>\n\n" where name is one of
+        session, token, tool_start, tool_end, final or error (see README).
+        """
+        async for event in self.stream_events(message, session_id):
+            yield self._sse(event["event"], event["data"])
+    
+    async def _afast_path(self, message: str, session_id: str) -> Optional[dict]:
+        """Fast path answer with session_id, also kept in the session memory"""
+        result = await self.fast_path.aanswer(message)
+        if result is None:
+            return None
+        result["session_id"] = session_id
+        await self.manager_agent.asave_turn(session_id, message, result["message"])
+        return result
+    
+    @staticmethod
+    def _sse(event: str, data: dict) -> str:
+        """Format a Server-Sent Events frame"""
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,385 @@
+from sqlalchemy import Engine, text
+from app.services.data_version import get_data_version_updated_at
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Dictionary-encoded string columns and numeric columns of sales
+DIMENSIONS = ["branch", "customer_type", "gender", "product_line", "payment"]
+MEASURES = ["unit_price", "quantity", "rating", "total"]
+TIME_GRAINS = ("day", "week", "month")
+
+# Below this many rows a scan is not worth splitting across threads
+PARALLEL_MIN_ROWS = 1_000_000
+
+
+def round_half_away(values: np.ndarray, decimals: int) -> np.ndarray:
+    """Round like PostgreSQL ROUND on NUMERIC, halves away from zero (np.round rounds them to even)"""
+    scale = 10.0 ** decimals
+    # Cut float noise first, so 2.675 (2.67499... as a float) still counts as a half
+    scaled = np.round(np.abs(values) * scale, 6)
+    return np.sign(values) * np.floor(scaled + 0.5) / scale
+
+
+@dataclass
+class Plan:
+    """
+    Group-by / filter / aggregate query over sales
+
+    Equivalent to SELECT <group_by> AS <dimension_alias>, <aggregate>(<metric>)
+    AS <metric_alias> FROM sales WHERE <filters> GROUP BY 1 ORDER BY ...
+    """
+    group_by: str  # dimension column, or day/week/month of date
+    metric: str  # measure column, or * for row counts
+    aggregate: str  # sum, avg, count, min or max
+    metric_alias: str
+    dimension_alias: str
+    filters: Dict[str, List[Any]] = field(default_factory=dict)  # dimension -> allowed values
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    descending: bool = True
+    limit: Optional[int] = None
+    precision: int = 2  # Decimal places of avg results, like ROUND(AVG(x), 2)
+
+    @property
+    def is_time_series(self) -> bool:
+        return self.group_by in TIME_GRAINS
+
+    @property
+    def is_chronological(self) -> bool:
+        """Time series in date order; with a limit it is ranked by the metric like other groups"""
+        return self.is_time_series and self.limit is None
+
+
+class SalesColumns:
+    """
+    Sales table as NumPy column arrays
+
+    Strings are dictionary-encoded as int32 codes into sorted value lists
+    (NULL is the last entry), dates are int32 days since 1970-01-01 and
+    measures are float64 with NaN for NULL.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[Optional[str]]], data_version: int):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.data_version = data_version
+        self.rows = len(columns["date"])
+        # Group keys of the time grains, derived from date on first use
+        self._grain_keys: Dict[str, Tuple[np.ndarray, List[Optional[str]]]] = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, data_version: int) -> "SalesColumns":
+        """Encode a frame with the sales columns"""
+        columns: Dict[str, np.ndarray] = {}
+        dictionaries: Dict[str, List[Optional[str]]] = {}
+        for name in DIMENSIONS:
+            codes, uniques = pd.factorize(df[name], sort=True)
+            values = [str(value) for value in uniques]
+            if (codes < 0).any():
+                codes = np.where(codes < 0, len(values), codes)
+                values.append(None)
+            columns[name] = codes.astype(np.int32)
+            dictionaries[name] = values
+        columns["date"] = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]").astype(np.int32)
+        for name in MEASURES:
+            columns[name] = pd.to_numeric(df[name]).to_numpy(dtype=np.float64, na_value=np.nan)
+        return cls(columns, dictionaries, data_version)
+
+    @classmethod
+    def from_database(cls, engine: Engine, data_version: int, chunk_size: int = 500_000) -> "SalesColumns":
+        """Read the sales table"""
+        query = text(f"SELECT date, {', '.join(DIMENSIONS + MEASURES)} FROM sales")
+        with engine.connect() as conn:
+            frames = list(pd.read_sql(query, conn, chunksize=chunk_size))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["date"] + DIMENSIONS + MEASURES)
+        return cls.from_frame(df, data_version)
+
+    def save(self, path: str):
+        """Write a snapshot directory that load() can memory-map"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in self.columns.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump({"data_version": self.data_version, "dictionaries": self.dictionaries}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SalesColumns":
+        """Memory-map a snapshot written by save()"""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        columns = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ["date"] + DIMENSIONS + MEASURES
+        }
+        return cls(columns, meta["dictionaries"], meta["data_version"])
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.columns.values())
+
+    def execute(self, plan: Plan, pool: Optional[ThreadPoolExecutor] = None, partitions: int = 1) -> List[Dict[str, Any]]:
+        """
+        Run the plan, returning rows shaped like fetch_rows output
+
+        With a pool, scans of PARALLEL_MIN_ROWS or more are split into
+        partitions whose per-group partials are combined at the end.
+        """
+        keys, labels = self._group_keys(plan.group_by)
+        groups = len(labels)
+        values = None if plan.metric == "*" else self.columns[plan.metric]
+
+        slices = [slice(0, self.rows)]
+        if pool is not None and partitions > 1 and self.rows >= PARALLEL_MIN_ROWS:
+            bounds = np.linspace(0, self.rows, partitions + 1, dtype=np.int64)
+            slices = [slice(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        def scan(part: slice) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            return self._scan(plan, keys[part], None if values is None else values[part], part, groups)
+
+        partials = list(pool.map(scan, slices)) if len(slices) > 1 else [scan(slices[0])]
+
+        rows = sum(partial[0] for partial in partials)
+        counts = sum(partial[1] for partial in partials)
+        if plan.aggregate == "min":
+            result = np.min([partial[2] for partial in partials], axis=0)
+        elif plan.aggregate == "max":
+            result = np.max([partial[2] for partial in partials], axis=0)
+        else:
+            result = sum(partial[2] for partial in partials)
+
+        present = np.flatnonzero(rows)
+        if plan.aggregate == "count":
+            output = (rows if values is None else counts).astype(np.float64)
+        elif plan.aggregate == "avg":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                output = round_half_away(result / counts, plan.precision)
+        elif plan.aggregate == "sum":
+            # Inputs have at most 2 decimals, like the NUMERIC columns they came from
+            output = round_half_away(result, 2)
+        else:
+            output = result
+        has_value = (counts > 0) | (plan.aggregate == "count")
+
+        if plan.is_chronological:
+            order = present
+        else:
+            # Groups without a value sort last
+            sort_values = np.where(has_value[present], output[present], np.nan)
+            sort_keys = -sort_values if plan.descending else sort_values
+            order = present[np.argsort(np.nan_to_num(sort_keys, nan=np.inf), kind="stable")]
+        if plan.limit is not None:
+            order = order[:plan.limit]
+
+        return [
+            {
+                plan.dimension_alias: labels[group],
+                plan.metric_alias: float(output[group]) if has_value[group] else None
+            }
+            for group in order
+        ]
+
+    def _scan(self, plan: Plan, keys: np.ndarray, values: Optional[np.ndarray], part: slice, groups: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Row counts, non-NULL value counts and aggregated values per group for one row range"""
+        mask = self._filter_mask(plan, part)
+        if mask is not None:
+            keys = keys[mask]
+            values = None if values is None else values[mask]
+        rows = np.bincount(keys, minlength=groups)
+        if values is None:
+            return rows, rows, rows
+
+        valid = ~np.isnan(values)
+        if valid.all():
+            counts = rows
+        else:
+            keys, values = keys[valid], values[valid]
+            counts = np.bincount(keys, minlength=groups)
+        if plan.aggregate == "min":
+            result = np.full(groups, np.inf)
+            np.minimum.at(result, keys, values)
+        elif plan.aggregate == "max":
+            result = np.full(groups, -np.inf)
+            np.maximum.at(result, keys, values)
+        else:
+            result = np.bincount(keys, weights=values, minlength=groups)
+        return rows, counts, result
+
+    def _filter_mask(self, plan: Plan, part: slice) -> Optional[np.ndarray]:
+        mask = None
+        for name, allowed in plan.filters.items():
+            dictionary = self.dictionaries[name]
+            codes = [dictionary.index(value) for value in allowed if value in dictionary]
+            column_mask = np.isin(self.columns[name][part], codes)
+            mask = column_mask if mask is None else mask & column_mask
+        for bound, compare in ((plan.date_from, np.greater_equal), (plan.date_to, np.less_equal)):
+            if bound is not None:
+                days = int(np.datetime64(bound, "D").astype(np.int64))
+                column_mask = compare(self.columns["date"][part], days)
+                mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def _group_keys(self, group_by: str) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """Dense group codes per row and the label of each code"""
+        if group_by in DIMENSIONS:
+            return self.columns[group_by], self.dictionaries[group_by]
+
+        if group_by not in self._grain_keys:
+            self._grain_keys[group_by] = self._time_keys(group_by)
+        return self._grain_keys[group_by]
+
+    def _time_keys(self, group_by: str) -> Tuple[np.ndarray, List[Optional[str]]]:
+        days = np.asarray(self.columns["date"])
+        if len(days) == 0:
+            return days, []
+        if group_by == "month":
+            periods = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+            unit, step = "M", 1
+        else:
+            # Weeks start on Monday like DATE_TRUNC('week'); 1970-01-01 was a Thursday
+            periods = days - (days + 3) % 7 if group_by == "week" else days
+            unit, step = "D", 7 if group_by == "week" else 1
+
+        first = int(periods.min())
+        keys = ((periods - first) // step).astype(np.int32)
+        labels = [
+            str(np.datetime64(first + i * step, unit).astype("datetime64[D]"))
+            for i in range(int(keys.max()) + 1)
+        ]
+        return keys, labels
+
+
+class ColumnarStore:
+    """
+    Holds the current SalesColumns, reloaded when the sales data version changes
+
+    Each version is snapshotted under snapshot_dir, so restarts and other
+    workers memory-map it instead of reading the table again. Snapshots
+    are named by the version and the time it was set, since a recreated
+    database counts versions from 1 again, and one whose row count does
+    not match the table is not used. Large scans are split across a thread
+    pool.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        get_data_version: Callable[[], int],
+        snapshot_dir: Optional[str] = None,
+        threads: int = 4
+    ):
+        self.engine = engine
+        self.get_data_version = get_data_version
+        self.snapshot_dir = snapshot_dir
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="columnar") if threads > 1 else None
+
+        self._lock = threading.Lock()
+        self._columns: Optional[SalesColumns] = None
+
+        self.loads = 0
+        self.load_source: Optional[str] = None
+        self.load_seconds = 0.0
+        self.queries = 0
+        self.query_seconds_total = 0.0
+
+    def get(self) -> SalesColumns:
+        """Current columns, reloading them if the data version moved on"""
+        data_version = self.get_data_version()
+        columns = self._columns
+        if columns is not None and columns.data_version == data_version:
+            return columns
+        with self._lock:
+            if self._columns is None or self._columns.data_version != data_version:
+                self._columns = self._load(data_version)
+            return self._columns
+
+    def execute(self, plan: Plan) -> List[Dict[str, Any]]:
+        """Run a plan on the current columns"""
+        columns = self.get()
+        started = time.perf_counter()
+        data = columns.execute(plan, self.pool, self.threads)
+        self.queries += 1
+        self.query_seconds_total += time.perf_counter() - started
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        """Loaded rows, memory and query latency"""
+        columns = self._columns
+        return {
+            "rows": columns.rows if columns else 0,
+            "bytes": columns.nbytes() if columns else 0,
+            "data_version": columns.data_version if columns else None,
+            "loads": self.loads,
+            "load_source": self.load_source,
+            "load_seconds": round(self.load_seconds, 3),
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds_total / self.queries * 1000, 3) if self.queries else 0.0
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+    def _snapshot_path(self, data_version: int) -> Optional[str]:
+        if not self.snapshot_dir:
+            return None
+        # Version numbers start over when the database is recreated, the time they were set does not
+        updated_at = get_data_version_updated_at(self.engine)
+        stamp = "".join(c for c in str(updated_at) if c.isdigit()) if updated_at else "0"
+        return os.path.join(self.snapshot_dir, f"sales_v{data_version}_{stamp}")
+
+    def _load_snapshot(self, path: str) -> Optional[SalesColumns]:
+        """Snapshot at path if it exists and has as many rows as the sales table"""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        columns = SalesColumns.load(path)
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT COUNT(*) FROM sales")).scalar_one()
+        if rows != columns.rows:
+            logger.warning(f"Columnar snapshot {path} has {columns.rows} rows, sales has {rows}; reading the table")
+            return None
+        return columns
+
+    def _load(self, data_version: int) -> SalesColumns:
+        started = time.perf_counter()
+        path = self._snapshot_path(data_version)
+        columns = self._load_snapshot(path) if path else None
+        if columns is not None:
+            self.load_source = "snapshot"
+        else:
+            columns = SalesColumns.from_database(self.engine, data_version)
+            self.load_source = "database"
+            if path:
+                try:
+                    columns.save(path)
+                    self._remove_old_snapshots(path)
+                except Exception as e:
+                    logger.error(f"Error saving columnar snapshot: {e}")
+        self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+        logger.info(
+            f"Loaded {columns.rows} sales rows into columnar store from {self.load_source} "
+            f"(data version {data_version}, {self.load_seconds:.2f}s)"
+        )
+        return columns
+
+    def _remove_old_snapshots(self, keep: str):
+        for name in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, name)
+            if name.startswith("sales_v") and not name.endswith(".tmp") and path != keep:
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,71 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+SALES_DATASET = "sales"
+
+
+def get_data_version(engine: Engine, name: str = SALES_DATASET) -> int:
+    """Get current version of a dataset (0 if it was never bumped)"""
+    with engine.connect() as conn:
+        version = conn.execute(
+            text("SELECT version FROM data_versions WHERE name = :name"),
+            {"name": name}
+        ).scalar()
+    return version or 0
+
+
+def get_data_version_updated_at(engine: Engine, name: str = SALES_DATASET) -> Optional[datetime]:
+    """When a dataset's version was last set (None if it never was)"""
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT updated_at FROM data_versions WHERE name = :name"),
+            {"name": name}
+        ).scalar()
+
+
+def bump_data_version(db: Session, name: str = SALES_DATASET) -> int:
+    """
+    Increment the version of a dataset and commit
+    
+    Call this after anything that changes the dataset's rows or schema
+    (load_sales_data.py, migrations) so caches built on it are invalidated.
+    """
+    version = db.execute(
+        text("""
+            INSERT INTO data_versions (name, version, updated_at)
+            VALUES (:name, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE
+            SET version = data_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+            RETURNING version
+        """),
+        {"name": name}
+    ).scalar()
+    db.commit()
+    logger.info(f"Bumped {name} data version to {version}")
+    return version
+
+
+def get_data_versions(engine: Engine) -> Dict[str, int]:
+    """Get current version of every dataset"""
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT name, version FROM data_versions")).fetchall()
+    return {name: version for name, version in rows}
+
+
+def set_data_version(db: Session, name: str, version: int):
+    """Record that a derived dataset is current for the given version (caller commits)"""
+    db.execute(
+        text("""
+            INSERT INTO data_versions (name, version, updated_at)
+            VALUES (:name, :version, CURRENT_TIMESTAMP)
+            ON CONFLICT (name) DO UPDATE
+            SET version = :version, updated_at = CURRENT_TIMESTAMP
+        """),
+        {"name": name, "version": version}
+    )
@@ -4,6 +4,7 @@ from app.models.database_models import Document
 from app.agents.rag_tool import rag_service
 from app.config import get_settings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+import asyncio
 import os
 import uuid
 import logging
@@ -45,29 +46,44 @@ class DocumentService:
         # Split into chunks
         chunks = self.text_splitter.split_text(text)
         
+        # Embedded before the row is written, so no transaction stays open while the endpoint is called
+        embedded = await rag_service.aembed_documents(chunks)
+        if embedded is None:
+            os.remove(file_path)
+            raise RuntimeError(f"Could not embed {file.filename}")
+        vectors, embedding_usage = embedded
+        
+        # Flush the row first so its id can go into the chunk metadata, which deletes look chunks up by
+        doc = Document(
+            filename=unique_filename,
+            original_filename=file.filename,
+            file_path=file_path,
+            file_size=file_size,
+            file_type=file_ext[1:],
+            chunk_count=len(chunks),
+            doc_metadata={"chunks_by_document_id": True}
+        )
+        db.add(doc)
+        db.flush()
+        
         # Create metadata for each chunk
         metadatas = [
             {
                 "source": file.filename,
                 "chunk": i,
-                "total_chunks": len(chunks)
+                "total_chunks": len(chunks),
+                "document_id": doc.id
             }
             for i in range(len(chunks))
         ]
         
-        # Add to vector store
-        rag_service.add_documents(chunks, metadatas)
+        # Add to vector store, off the event loop since it writes the segment and updates the index;
+        # without its chunks the document is not kept
+        if not await asyncio.to_thread(rag_service.add_documents, chunks, vectors, metadatas):
+            db.rollback()
+            os.remove(file_path)
+            raise RuntimeError(f"Could not add {file.filename} to the vector store")
         
-        # Save to database
-        doc = Document(
-            filename=unique_filename,
-            original_filename=file.filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=file_ext[1:],
-            chunk_count=len(chunks)
-        )
-        db.add(doc)
         db.commit()
         db.refresh(doc)
         
@@ -78,6 +94,7 @@ class DocumentService:
             "file_type": doc.file_type,
             "chunk_count": doc.chunk_count,
             "upload_date": doc.upload_date,
+            "embedding": embedding_usage,
             "message": "Document uploaded successfully"
         }
     
@@ -112,9 +129,23 @@ class DocumentService:
         return db.query(Document).order_by(Document.upload_date.desc()).all()
     
     def delete_document(self, document_id: int, db: Session) -> bool:
-        """Delete document"""
+        """Delete document and remove its chunks from search"""
         doc = db.query(Document).filter(Document.id == document_id).first()
         if doc:
+            # Tombstoned right away, the space is reclaimed by compaction; raises and keeps the row if the store fails
+            removed = rag_service.delete_document(doc.id)
+            # Only chunks uploaded before they carried a document id are found by file name,
+            # a document with ids whose chunks are already gone must not take its namesakes' chunks
+            keyed_by_id = (doc.doc_metadata or {}).get("chunks_by_document_id")
+            if not keyed_by_id and not removed and doc.chunk_count:
+                namesakes = db.query(Document).filter(Document.original_filename == doc.original_filename).count()
+                if namesakes > 1:
+                    logger.warning(
+                        f"{namesakes} documents are named {doc.original_filename}; "
+                        f"removing the chunks without a document id of all of them"
+                    )
+                removed = rag_service.delete_source(doc.original_filename)
+            logger.info(f"Removed {removed} chunks of document {doc.id} from the vector store")
             # Delete file
             if os.path.exists(doc.file_path):
                 os.remove(doc.file_path)
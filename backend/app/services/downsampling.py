@@ -0,0 +1,145 @@
+from app.services.query_results import QueryResult
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+OTHER_LABEL = "Other"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the shape of y over x
+
+    x must be sorted. The first and last points are always kept; from
+    each bucket in between the point forming the largest triangle with
+    the previously kept point and the next bucket's mean is picked.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(min(n, n_out))
+
+    # Areas do not change with a shift, and smaller numbers keep the cumulative sums precise
+    x = x - x[0]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Mean of each bucket, for the "next bucket" vertex, from cumulative sums
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = np.maximum(edges[1:] - edges[:-1], 1)
+    x_means = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / sizes
+    y_means = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / sizes
+    x_means = np.append(x_means, x[-1])
+    y_means = np.append(y_means, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], max(edges[bucket + 1], edges[bucket] + 1)
+        xs, ys = x[start:stop], y[start:stop]
+        # Twice the triangle area, for every candidate in the bucket at once
+        areas = np.abs(
+            (x[previous] - x_means[bucket + 1]) * (ys - y[previous])
+            - (x[previous] - xs) * (y_means[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def scatter_bins(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Aggregate points into a grid of at most n_out cells; mean x, mean y and count of each occupied cell"""
+    side = max(int(np.sqrt(n_out)), 1)
+
+    def cell(values: np.ndarray) -> np.ndarray:
+        low, high = values.min(), values.max()
+        if high == low:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.minimum(((values - low) / (high - low) * side).astype(np.int64), side - 1)
+
+    cells = cell(x) * side + cell(y)
+    occupied, codes = np.unique(cells, return_inverse=True)
+    counts = np.bincount(codes, minlength=len(occupied))
+    x_means = np.bincount(codes, weights=x, minlength=len(occupied)) / counts
+    y_means = np.bincount(codes, weights=y, minlength=len(occupied)) / counts
+    return x_means, y_means, counts
+
+
+def top_n_indices(values: np.ndarray, n: int) -> np.ndarray:
+    """Indices of the n largest values, in their original order"""
+    top = np.argpartition(-np.nan_to_num(values, nan=-np.inf), n - 1)[:n]
+    return np.sort(top)
+
+
+def _numeric_axis(frame: pd.DataFrame, position: int) -> Optional[np.ndarray]:
+    """Column as float64 (datetimes as nanoseconds), or None if it is not numeric"""
+    column = frame.iloc[:, position]
+    if pd.api.types.is_datetime64_any_dtype(column):
+        values = column.to_numpy().astype("datetime64[ns]")
+        return np.where(np.isnat(values), np.nan, values.astype(np.int64).astype(np.float64))
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    return None
+
+
+def _format_x(frame: pd.DataFrame, values: np.ndarray) -> List[Any]:
+    if pd.api.types.is_datetime64_any_dtype(frame.iloc[:, 0]):
+        return [str(value) for value in pd.to_datetime(values.astype(np.int64))]
+    return values.tolist()
+
+
+def downsample(
+    result: QueryResult,
+    frame: pd.DataFrame,
+    chart_type: str,
+    max_points: int,
+    max_categories: int
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """
+    Chart rows for a result, within a point budget
+
+    Line charts (and bars over a numeric or date axis) keep their shape
+    with LTTB, scatter plots are binned into a grid with a count per cell,
+    and bar and pie charts over categories keep the largest values and
+    sum the rest into "Other". Returns the rows and a description of the
+    downsampling, or None if the rows are returned as they are.
+    """
+    n = len(result)
+    has_y = len(result.columns) >= 2 and result.kinds[1] == "number"
+    x = _numeric_axis(frame, 0) if has_y else None
+    categorical = has_y and chart_type in ("bar", "pie") and x is None
+    if n <= (max_categories if categorical else max_points):
+        return result.to_records(), None
+    if not has_y:
+        # No y axis to sample on, send the first rows like a table preview
+        return result.to_records(0, max_points), {"method": "head", "original_points": n, "points": max_points}
+
+    y = result.arrays[1]
+    x_name, y_name = result.columns[0], result.columns[1]
+
+    if chart_type == "scatter" and x is not None:
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if not valid.any():
+            # Every point lacks x or y, there is nothing to plot
+            return [], {"method": "bins", "original_points": n, "points": 0}
+        x_means, y_means, counts = scatter_bins(x[valid], y[valid], max_points)
+        rows = [
+            {x_name: x_value, y_name: y_value, "count": int(count)}
+            for x_value, y_value, count in zip(_format_x(frame, x_means), y_means.tolist(), counts.tolist())
+        ]
+        return rows, {"method": "bins", "original_points": n, "points": len(rows)}
+
+    if categorical:
+        keep = top_n_indices(y, max_categories - 1)
+        rest = np.ones(n, dtype=bool)
+        rest[keep] = False
+        rows = result.take(keep)
+        rows.append({x_name: f"{OTHER_LABEL} ({int(rest.sum())})", y_name: float(np.nansum(y[rest]))})
+        return rows, {"method": "top_n", "original_points": n, "points": len(rows)}
+
+    if x is None:
+        x = np.arange(n, dtype=np.float64)
+    # Sorted by x, without points that have no x
+    positions = np.flatnonzero(~np.isnan(x))
+    order = positions[np.argsort(x[positions], kind="stable")]
+    keep = order[lttb_indices(x[order], np.nan_to_num(y[order]), max_points)]
+    return result.take(keep), {"method": "lttb", "original_points": n, "points": len(keep)}
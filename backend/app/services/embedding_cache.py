@@ -0,0 +1,227 @@
+from langchain_core.embeddings import Embeddings
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def text_key(model: str, text: str) -> str:
+    """Cache key of a text embedded with a model"""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embeddings keyed by the hash of the model name and the text
+
+    Stored as float32 blobs in SQLite. When the stored vectors pass
+    max_bytes, the least recently used are evicted down to 90% of it.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+        self.evictions = 0
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """Cached vectors of the keys that are present"""
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            # Stay below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *batch]
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Store vectors, evicting the least recently used when over max_bytes"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            replaced = self._stored_bytes([key for key, _, _ in rows])
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self.bytes += sum(len(blob) for _, blob, _ in rows) - replaced
+            if self.bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * 0.9))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Entries and disk usage"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"entries": entries, "bytes": self.bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _stored_bytes(self, keys: List[str]) -> int:
+        total = 0
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            total += self._conn.execute(
+                f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchone()[0]
+        return total
+
+    def _evict(self, target_bytes: int):
+        # Oldest first, in batches, until under the target
+        while self.bytes > target_bytes:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                self.bytes = 0
+                break
+            evicted, freed = [], 0
+            for key, size in rows:
+                evicted.append((key,))
+                freed += size
+                if self.bytes - freed <= target_bytes:
+                    break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+            self.bytes -= freed
+            self.evictions += len(evicted)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings client that only sends texts it has not embedded before
+
+    Wraps the OpenAI client for both document and query embeddings. Texts
+    are looked up by model and content hash, repeated texts in one call are
+    embedded once, and only the misses go to the embedding endpoint. With
+    no cache every text is sent, and the usage counts still apply.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents_with_usage(texts)[0]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents_with_usage([text], query=True)[0][0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return (await self.aembed_documents_with_usage(texts))[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents_with_usage([text], query=True))[0][0]
+
+    def embed_documents_with_usage(self, texts: List[str], query: bool = False) -> Tuple[List[List[float]], Dict[str, Any]]:
+        """Embeddings of the texts, and how many were embedded and how many the cache saved"""
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            missing_texts = [texts[positions[0]] for positions in missing.values()]
+            if query:
+                vectors = [self.embeddings.embed_query(missing_texts[0])]
+            else:
+                vectors = self.embeddings.embed_documents(missing_texts)
+            self._store(missing, vectors, found)
+        return self._assemble(keys, found, len(missing))
+
+    async def aembed_documents_with_usage(self, texts: List[str], query: bool = False) -> Tuple[List[List[float]], Dict[str, Any]]:
+        """Async version of embed_documents_with_usage"""
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            missing_texts = [texts[positions[0]] for positions in missing.values()]
+            if query:
+                vectors = [await self.embeddings.aembed_query(missing_texts[0])]
+            else:
+                vectors = await self.embeddings.aembed_documents(missing_texts)
+            await asyncio.to_thread(self._store, missing, vectors, found)
+        return self._assemble(keys, found, len(missing))
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and endpoint calls"""
+        total = self.hits + self.misses
+        return {
+            "model": self.model,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            "requests": self.requests,
+            "cache": self.cache.stats() if self.cache else None
+        }
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def _lookup(self, texts: List[str]):
+        """Keys of the texts, cached vectors by key, and positions of each distinct missing key"""
+        keys = [text_key(self.model, text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        if self.cache is not None:
+            try:
+                found = self.cache.get_many(list(dict.fromkeys(keys)))
+            except Exception as e:
+                logger.error(f"Error reading embedding cache: {e}")
+        missing: Dict[str, List[int]] = {}
+        for position, key in enumerate(keys):
+            if key not in found:
+                missing.setdefault(key, []).append(position)
+        return keys, found, missing
+
+    def _store(self, missing: Dict[str, List[int]], vectors: List[List[float]], found: Dict[str, List[float]]):
+        embedded = dict(zip(missing.keys(), vectors))
+        found.update(embedded)
+        if self.cache is not None:
+            try:
+                self.cache.put_many(embedded)
+            except Exception as e:
+                logger.error(f"Error writing embedding cache: {e}")
+
+    def _assemble(self, keys: List[str], found: Dict[str, List[float]], embedded: int) -> Tuple[List[List[float]], Dict[str, Any]]:
+        with self._lock:
+            self.hits += len(keys) - embedded
+            self.misses += embedded
+            self.requests += 1 if embedded else 0
+        usage = {
+            "texts": len(keys),
+            "embedded": embedded,
+            "saved": len(keys) - embedded,
+            "hit_ratio": round((len(keys) - embedded) / len(keys), 3) if keys else 0.0
+        }
+        return [found[key] for key in keys], usage
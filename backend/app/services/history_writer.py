@@ -0,0 +1,127 @@
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.models.database_models import Conversation
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationWriter:
+    """
+    Write-behind queue for conversation history
+
+    Rows are queued without touching the database and written by a
+    background task in multi-row inserts of up to batch_size rows, at
+    least every flush_interval seconds. When the queue is full new rows are
+    dropped rather than slowing down chat. stop() writes whatever is queued.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_queue: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """Start the background writer on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Write everything still queued and stop the background writer"""
+        if self._task is None:
+            return
+        # Sentinel goes behind the queued rows, so they are all written first
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def enqueue(self, session_id: str, message: str, result: Dict[str, Any]):
+        """Queue an exchange for writing; never waits on the database"""
+        self.start()
+        row = {
+            "session_id": session_id,
+            "user_message": message,
+            "agent_response": result.get("message", ""),
+            "tool_used": result.get("tool_used"),
+            "extra_data": result.get("metadata") or {},
+            # Stamped now, so order and rehydration follow chat time rather than flush time
+            "created_at": datetime.now(timezone.utc)
+        }
+        try:
+            self._queue.put_nowait(row)
+            self.enqueued += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+            # One warning per 1000 drops, not a log line per message during a burst
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Conversation history queue full, {self.dropped} turns dropped so far")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and write counters"""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 1) if self.batches else 0.0,
+            "last_flush_ms": self.last_flush_ms
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            rows = []
+            deadline = None
+            while len(rows) < self.batch_size:
+                if deadline is None:
+                    row = await self._queue.get()
+                    # Wait for the batch to fill up, but no longer than flush_interval
+                    deadline = time.monotonic() + self.flush_interval
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if row is None:
+                    stopping = True
+                    break
+                rows.append(row)
+            await self._write(rows)
+
+    async def _write(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(Conversation), rows)
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"Error saving {len(rows)} conversations: {e}")
+        self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
@@ -0,0 +1,119 @@
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from app.services.bm25_index import is_identifier, tokenize
+from typing import Any, Dict, List, Sequence, Tuple
+import asyncio
+import threading
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Ids ordered by the sum of 1 / (k + rank) over the rankings they appear in"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda entry: entry[1], reverse=True)
+
+
+class RetrievalStats:
+    """Counts of how document_search queries were answered"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"vector": 0, "hybrid": 0, "keyword_only": 0}
+
+    def record(self, path: str):
+        with self._lock:
+            self.counts[path] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {**counts, "embeddings_skipped_ratio": round(counts["keyword_only"] / total, 3) if total else 0.0}
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever over the segmented vector store fusing BM25 and vector results
+
+    In hybrid mode the BM25 and nearest-neighbour rankings of fetch_k chunks
+    each are fused by reciprocal rank. When the question names identifiers
+    (SKUs, policy numbers, error codes) that only a few chunks contain and
+    the best BM25 chunk has all of them, the BM25 ranking is used alone and
+    the question is never embedded. The store is read on every call, so a
+    compaction swapping its index is picked up.
+    """
+
+    store: Any  # SegmentedVectorStore
+    embeddings: Embeddings
+    k: int = 4
+    fetch_k: int = 20
+    mode: str = "hybrid"
+    rrf_k: int = 60
+    keyword_only: bool = True
+    keyword_max_df: int = 20
+    stats: Any = None  # RetrievalStats
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {self.mode!r}, expected one of {RETRIEVAL_MODES}")
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        index = self.store.vector_store
+        if index is None:
+            return []
+        lexical, confident = self._lexical(index, query)
+        if confident:
+            return self._finish(index, "keyword_only", [[chunk_id for chunk_id, _ in lexical]])
+        embedding = self.embeddings.embed_query(query)
+        return self._fuse(index, lexical, index.search_ids(embedding, self._candidates()))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        index = self.store.vector_store
+        if index is None:
+            return []
+        lexical, confident = await asyncio.to_thread(self._lexical, index, query)
+        if confident:
+            return self._finish(index, "keyword_only", [[chunk_id for chunk_id, _ in lexical]])
+        embedding = await self.embeddings.aembed_query(query)
+        vector = await asyncio.to_thread(index.search_ids, embedding, self._candidates())
+        return self._fuse(index, lexical, vector)
+
+    def _candidates(self) -> int:
+        return self.k if self.mode == "vector" else max(self.fetch_k, self.k)
+
+    def _lexical(self, index, query: str) -> Tuple[List[Tuple[str, float]], bool]:
+        """BM25 hits for the query, and whether they are good enough to skip the vector search"""
+        if self.mode == "vector" or index.lexical is None:
+            return [], False
+        hits = index.lexical.search(query, self._candidates(), exclude=index.tombstones)
+        if not self.keyword_only or not hits:
+            return hits, False
+        identifiers = [term for term in dict.fromkeys(tokenize(query)) if is_identifier(term)]
+        confident = bool(identifiers) and all(
+            0 < index.lexical.document_frequency(term) <= self.keyword_max_df for term in identifiers
+        ) and index.lexical.contains(hits[0][0], identifiers)
+        return hits, confident
+
+    def _fuse(self, index, lexical: List[Tuple[str, float]], vector: List[Tuple[str, float]]) -> List[Document]:
+        vector_ids = [chunk_id for chunk_id, _ in vector]
+        if self.mode == "vector" or index.lexical is None:
+            return self._finish(index, "vector", [vector_ids])
+        return self._finish(index, "hybrid", [vector_ids, [chunk_id for chunk_id, _ in lexical]])
+
+    def _finish(self, index, path: str, rankings: List[List[str]]) -> List[Document]:
+        if self.stats is not None:
+            self.stats.record(path)
+        fused = reciprocal_rank_fusion(rankings, self.rrf_k)[:self.k]
+        return [index.docstore.search(chunk_id) for chunk_id, _ in fused]
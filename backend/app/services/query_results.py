@@ -0,0 +1,181 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import asyncio
+import numpy as np
+import pandas as pd
+
+# PostgreSQL type OIDs, as reported in cursor.description by psycopg2 and asyncpg
+NUMBER_TYPES = {20, 21, 23, 26, 700, 701, 790, 1700}  # int8, int2, int4, oid, float4, float8, money, numeric
+DATE_TYPES = {1082, 1114, 1184}  # date, timestamp, timestamptz
+BOOL_TYPES = {16}
+TEXT_TYPES = {18, 19, 25, 1042, 1043}  # char, name, text, bpchar, varchar
+
+FETCH_BATCH_SIZE = 10_000
+
+
+def _column_kind(type_code: Any, values: Sequence[Any]) -> str:
+    """number, date, bool, text or other, from the declared type or else the values"""
+    if type_code in NUMBER_TYPES:
+        return "number"
+    if type_code in DATE_TYPES:
+        return "date"
+    if type_code in BOOL_TYPES:
+        return "bool"
+    if type_code in TEXT_TYPES:
+        return "text"
+    # SQLite and unknown types: look at the values once per column
+    inferred = pd.api.types.infer_dtype(values, skipna=True)
+    if inferred in ("integer", "floating", "decimal", "mixed-integer-float"):
+        return "number"
+    if inferred in ("date", "datetime"):
+        return "date"
+    if inferred == "boolean":
+        return "bool"
+    if inferred in ("string", "empty"):
+        return "text"
+    return "other"
+
+
+def _to_strings(values: Sequence[Any]) -> np.ndarray:
+    return np.array([None if value is None else str(value) for value in values], dtype=object)
+
+
+CONVERTERS: Dict[str, Callable[[Sequence[Any]], np.ndarray]] = {
+    # Decimals and ints become float64 with NaN for NULL
+    "number": lambda values: np.fromiter(
+        (np.nan if value is None else value for value in values), dtype=np.float64, count=len(values)
+    ),
+    # ISO strings, as the API has always returned; to_frame() parses them back
+    "date": _to_strings,
+    "bool": lambda values: np.array(values, dtype=object),
+    "text": lambda values: np.array(values, dtype=object),
+    "other": _to_strings,
+}
+
+
+class QueryResult:
+    """
+    Column-oriented query result
+
+    Each column is converted once, by a converter picked from the type in
+    the cursor description: numbers are float64 arrays (NaN for NULL),
+    dates and other non-JSON values are strings, text and bools are kept.
+    """
+
+    def __init__(self, columns: List[str], kinds: List[str], arrays: List[np.ndarray], truncated: bool = False):
+        self.columns = columns
+        self.kinds = kinds
+        self.arrays = arrays
+        # True when the query had more rows than were read
+        self.truncated = truncated
+
+    def __len__(self) -> int:
+        return len(self.arrays[0]) if self.arrays else 0
+
+    @classmethod
+    def from_rows(
+        cls,
+        columns: List[str],
+        type_codes: List[Any],
+        column_values: List[Sequence[Any]],
+        truncated: bool = False
+    ) -> "QueryResult":
+        kinds = [_column_kind(type_code, values) for type_code, values in zip(type_codes, column_values)]
+        arrays = [CONVERTERS[kind](values) for kind, values in zip(kinds, column_values)]
+        return cls(columns, kinds, arrays, truncated)
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame over the column arrays, with date columns as datetime64"""
+        arrays = [
+            pd.to_datetime(array, format="ISO8601", errors="coerce") if kind == "date" else array
+            for kind, array in zip(self.kinds, self.arrays)
+        ]
+        # Keyed by position, as SQL results can repeat a column name
+        frame = pd.DataFrame(dict(enumerate(arrays)), copy=False)
+        frame.columns = self.columns
+        return frame
+
+    def to_records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """JSON-ready row dicts of rows start to stop, NULL as None"""
+        values = []
+        for kind, array in zip(self.kinds, self.arrays):
+            array = array[start:stop]
+            if kind == "number":
+                column = array.astype(object)
+                column[np.isnan(array)] = None
+                values.append(column.tolist())
+            else:
+                values.append(array.tolist())
+        return [dict(zip(self.columns, row)) for row in zip(*values)]
+
+    def take(self, indices: np.ndarray) -> List[Dict[str, Any]]:
+        """JSON-ready row dicts of the rows at the given positions"""
+        return QueryResult(self.columns, self.kinds, [array[indices] for array in self.arrays]).to_records()
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the arrays"""
+        size = 0
+        for array in self.arrays:
+            size += array.nbytes
+            if array.dtype == object:
+                size += sum(len(value) for value in array if isinstance(value, str))
+        return size
+
+
+def _description_types(result) -> List[Any]:
+    description = getattr(result.cursor, "description", None) or []
+    return [column[1] for column in description]
+
+
+def _append_batch(column_values: List[List[Any]], batch: Sequence[Sequence[Any]]):
+    # zip(*rows) transposes the batch in C
+    for values, column in zip(column_values, zip(*batch)):
+        values.extend(column)
+
+
+def _take(column_values: List[List[Any]], batch: Sequence[Sequence[Any]], read: int, max_rows: Optional[int]) -> bool:
+    """Add the batch, up to max_rows in total; True once the limit is passed"""
+    if max_rows is not None and read + len(batch) > max_rows:
+        _append_batch(column_values, batch[:max_rows - read])
+        return True
+    _append_batch(column_values, batch)
+    return False
+
+
+def read_result(result, batch_size: int = FETCH_BATCH_SIZE, max_rows: Optional[int] = None) -> QueryResult:
+    """
+    Fetch a SQLAlchemy result in batches into a QueryResult
+
+    Stops after max_rows rows, marking the result truncated; with a
+    server-side cursor (stream_results) the rest is never transferred.
+    """
+    columns = list(result.keys())
+    # Before fetching, as the cursor is released once the rows are exhausted
+    type_codes = _description_types(result) or [None] * len(columns)
+    column_values: List[List[Any]] = [[] for _ in columns]
+    read, truncated = 0, False
+    while not truncated:
+        batch = result.fetchmany(batch_size)
+        if not batch:
+            break
+        truncated = _take(column_values, batch, read, max_rows)
+        read += len(batch)
+    result.close()
+    return QueryResult.from_rows(columns, type_codes, column_values, truncated)
+
+
+async def aread_result(result, batch_size: int = FETCH_BATCH_SIZE, max_rows: Optional[int] = None) -> QueryResult:
+    """Async version of read_result for an AsyncResult from AsyncConnection.stream()"""
+    columns = list(result.keys())
+    # AsyncResult wraps the sync CursorResult, which holds the description
+    type_codes = _description_types(getattr(result, "_real_result", result)) or [None] * len(columns)
+    column_values: List[List[Any]] = [[] for _ in columns]
+    read, truncated = 0, False
+    while not truncated:
+        batch = await result.fetchmany(batch_size)
+        if not batch:
+            break
+        truncated = _take(column_values, batch, read, max_rows)
+        read += len(batch)
+    await result.close()
+    # Converting 100k rows is worth keeping off the event loop
+    return await asyncio.to_thread(QueryResult.from_rows, columns, type_codes, column_values, truncated)
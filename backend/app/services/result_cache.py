@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import json
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+LINE_COMMENT = re.compile(r"--[^\n]*")
+BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Canonical form of a SQL statement for use as a cache key
+
+    Comments, redundant whitespace and trailing semicolons are removed and
+    everything outside string literals is lowercased, so formatting-only
+    differences map to the same key.
+    """
+    parts = STRING_LITERAL.split(sql)
+    canonical = []
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            # String literal, keep as-is
+            canonical.append(part)
+        else:
+            part = BLOCK_COMMENT.sub(" ", LINE_COMMENT.sub(" ", part))
+            canonical.append(re.sub(r"\s+", " ", part.lower()))
+    return "".join(canonical).strip().rstrip(";").strip()
+
+
+def is_read_only(canonical_sql: str) -> bool:
+    """Only plain queries are cacheable"""
+    return canonical_sql.startswith(("select ", "with "))
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if hasattr(value, "nbytes"):
+        return value.nbytes()
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+class SQLResultCache:
+    """
+    Result cache keyed by canonical SQL text and the sales data version
+
+    Values are the already converted results (QueryResults for
+    query_and_visualize, result strings for the SQL agent). When a lookup
+    arrives with a newer data version everything is dropped at once. Entries
+    are evicted LRU to stay within max_bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self._data_version: Optional[int] = None
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, sql: str, data_version: int, namespace: str = "rows") -> Optional[Any]:
+        """Get cached result, or None on a miss"""
+        key = (namespace, canonicalize_sql(sql))
+        with self._lock:
+            self._check_version(data_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, sql: str, data_version: int, value: Any, namespace: str = "rows") -> bool:
+        """Cache a result; returns False if it is not cacheable or too large"""
+        canonical = canonicalize_sql(sql)
+        if not is_read_only(canonical):
+            return False
+
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False
+
+        key = (namespace, canonical)
+        with self._lock:
+            self._check_version(data_version)
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and memory usage"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "data_version": self._data_version
+        }
+
+    def _check_version(self, data_version: int):
+        """Drop everything cached for an older data version"""
+        if data_version == self._data_version:
+            return
+        if self._entries:
+            logger.info(f"Sales data version {self._data_version} -> {data_version}, dropping {len(self._entries)} cached results")
+            self.invalidations += 1
+        self._entries.clear()
+        self.bytes = 0
+        self._data_version = data_version
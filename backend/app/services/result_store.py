@@ -0,0 +1,102 @@
+from app.services.query_results import QueryResult
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResultStore:
+    """
+    Query results kept behind an id for paginated access
+
+    Chat responses carry a bounded preview of a result and its id; the
+    full (row-capped) result is paged through /api/results/{id}. Results
+    unused for ttl_seconds expire, and the least recently used are evicted
+    to stay within max_bytes.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 3600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[str, Tuple[QueryResult, int, float]]" = OrderedDict()
+
+        self.bytes = 0
+        self.stored = 0
+        self.pages = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def put(self, result: QueryResult) -> Optional[str]:
+        """Keep a result and return its id, or None if it is too large to keep"""
+        size = result.nbytes()
+        if size > self.max_bytes:
+            return None
+        result_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._results[result_id] = (result, size, now)
+            self.bytes += size
+            self.stored += 1
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._results.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+        return result_id
+
+    def get(self, result_id: str) -> Optional[QueryResult]:
+        """Get a stored result, or None if it is unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._results.get(result_id)
+            if entry is None:
+                return None
+            self._results[result_id] = (entry[0], entry[1], now)
+            self._results.move_to_end(result_id)
+            return entry[0]
+
+    def page(self, result_id: str, cursor: int = 0, limit: int = 1000) -> Optional[Dict[str, Any]]:
+        """Rows cursor to cursor + limit of a stored result, with the cursor of the next page"""
+        result = self.get(result_id)
+        if result is None:
+            return None
+        total = len(result)
+        stop = min(cursor + limit, total)
+        self.pages += 1
+        return {
+            "result_id": result_id,
+            "columns": result.columns,
+            "rows": result.to_records(cursor, stop),
+            "cursor": cursor,
+            "next_cursor": stop if stop < total else None,
+            "total_rows": total,
+            "truncated": result.truncated
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Stored results and memory usage"""
+        return {
+            "results": len(self._results),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "stored": self.stored,
+            "pages_served": self.pages,
+            "evictions": self.evictions,
+            "expired": self.expired
+        }
+
+    def _expire(self, now: float):
+        # Kept in last-used order, so expired results are at the front
+        while self._results:
+            result_id, (_, size, last_used) = next(iter(self._results.items()))
+            if now - last_used <= self.ttl_seconds:
+                break
+            del self._results[result_id]
+            self.bytes -= size
+            self.expired += 1
@@ -0,0 +1,193 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from sqlglot import exp
+from app.models.database_models import Sales
+from app.services.data_version import set_data_version
+from datetime import date
+from typing import List, Optional, Tuple
+import sqlglot
+import logging
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_DATASET = "sales_rollups"
+
+DIMENSIONS = ["date", "branch", "customer_type", "gender", "product_line", "payment"]
+MEASURES = ["total", "quantity", "rating", "unit_price"]
+
+# Smallest first - queries go to the first rollup that has every dimension they use
+ROLLUPS: List[Tuple[str, List[str]]] = [
+    ("sales_rollup_dims", ["branch", "customer_type", "gender", "product_line", "payment"]),
+    ("sales_rollup_daily_branch_product_line", ["date", "branch", "product_line"]),
+    ("sales_rollup_daily", DIMENSIONS),
+]
+
+
+def _create_table_sql(name: str, dims: List[str]) -> str:
+    columns = [f"{dim} {Sales.__table__.c[dim].type}" for dim in dims]
+    columns.append("row_count BIGINT NOT NULL")
+    for measure in MEASURES:
+        measure_type = Sales.__table__.c[measure].type
+        columns += [
+            f"sum_{measure} NUMERIC",
+            f"count_{measure} BIGINT",
+            f"min_{measure} {measure_type}",
+            f"max_{measure} {measure_type}",
+        ]
+    return f"CREATE TABLE IF NOT EXISTS {name} ({', '.join(columns)})"
+
+
+def _refresh_sql(name: str, dims: List[str], where: str = "") -> str:
+    aggregates = ["COUNT(*)"]
+    for measure in MEASURES:
+        aggregates += [f"SUM({measure})", f"COUNT({measure})", f"MIN({measure})", f"MAX({measure})"]
+    dim_list = ", ".join(dims)
+    return f"INSERT INTO {name} SELECT {dim_list}, {', '.join(aggregates)} FROM sales {where} GROUP BY {dim_list}"
+
+
+def _reaggregate_sql(name: str, dims: List[str], source: str) -> str:
+    """Build a coarser rollup from a finer one instead of from sales"""
+    aggregates = ["SUM(row_count)"]
+    for measure in MEASURES:
+        aggregates += [f"SUM(sum_{measure})", f"SUM(count_{measure})", f"MIN(min_{measure})", f"MAX(max_{measure})"]
+    dim_list = ", ".join(dims)
+    return f"INSERT INTO {name} SELECT {dim_list}, {', '.join(aggregates)} FROM {source} GROUP BY {dim_list}"
+
+
+def refresh_rollups(db: Session, data_version: int, date_range: Optional[Tuple[date, date]] = None):
+    """
+    Rebuild the rollup tables and mark them current for data_version
+
+    Without date_range everything is rebuilt from sales. With the (first,
+    last) dates of the rows that changed, only those days of the daily
+    rollups are recomputed and the date-less rollup is re-aggregated from
+    the finest daily one, so the cost follows the change, not the history.
+    Runs in one transaction, so readers keep seeing the previous rollups
+    until the commit.
+    """
+    finest_daily = next(name for name, dims in reversed(ROLLUPS) if "date" in dims)
+    for name, dims in ROLLUPS:
+        db.execute(text(_create_table_sql(name, dims)))
+        for dim in dims:
+            db.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{name}_{dim} ON {name}({dim})"))
+
+    # Daily rollups first, the date-less ones may be built from them
+    for name, dims in sorted(ROLLUPS, key=lambda rollup: "date" not in rollup[1]):
+        if date_range is None:
+            db.execute(text(f"DELETE FROM {name}"))
+            db.execute(text(_refresh_sql(name, dims)))
+        elif "date" in dims:
+            params = {"first": date_range[0], "last": date_range[1]}
+            db.execute(text(f"DELETE FROM {name} WHERE date BETWEEN :first AND :last"), params)
+            db.execute(text(_refresh_sql(name, dims, "WHERE date BETWEEN :first AND :last")), params)
+        else:
+            db.execute(text(f"DELETE FROM {name}"))
+            db.execute(text(_reaggregate_sql(name, dims, finest_daily)))
+    set_data_version(db, ROLLUPS_DATASET, data_version)
+    db.commit()
+    scope = f"{date_range[0]} to {date_range[1]}" if date_range else "all dates"
+    logger.info(f"Refreshed {len(ROLLUPS)} sales rollups ({scope}) for data version {data_version}")
+
+
+def _rewrite_aggregate(agg: exp.AggFunc, used_dims: set) -> Optional[exp.Expression]:
+    """Rollup equivalent of an aggregate over sales, or None if there is none"""
+    arg = agg.this
+
+    if isinstance(agg, exp.Count) and isinstance(arg, exp.Star):
+        return exp.Sum(this=exp.column("row_count"))
+
+    if isinstance(agg, exp.Count) and isinstance(arg, exp.Distinct):
+        columns = arg.expressions
+        if all(isinstance(col, exp.Column) and col.name.lower() in DIMENSIONS for col in columns):
+            used_dims.update(col.name.lower() for col in columns)
+            return agg.copy()
+        return None
+
+    if not isinstance(arg, exp.Column):
+        return None
+    name = arg.name.lower()
+
+    if isinstance(agg, (exp.Min, exp.Max)) and name in DIMENSIONS:
+        used_dims.add(name)
+        return agg.copy()
+
+    if name not in MEASURES:
+        return None
+
+    if isinstance(agg, exp.Sum):
+        return exp.Sum(this=exp.column(f"sum_{name}"))
+    if isinstance(agg, exp.Count):
+        return exp.Sum(this=exp.column(f"count_{name}"))
+    if isinstance(agg, exp.Min):
+        return exp.Min(this=exp.column(f"min_{name}"))
+    if isinstance(agg, exp.Max):
+        return exp.Max(this=exp.column(f"max_{name}"))
+    if isinstance(agg, exp.Avg):
+        return sqlglot.parse_one(
+            f"(CAST(SUM(sum_{name}) AS NUMERIC) / NULLIF(SUM(count_{name}), 0))",
+            read="postgres"
+        )
+    return None
+
+
+def rewrite_to_rollup(sql: str) -> Optional[Tuple[str, str]]:
+    """
+    Rewrite an aggregate query over sales to the smallest rollup that answers it
+
+    Handles single-table SELECTs whose non-aggregated columns are all rollup
+    dimensions and whose aggregates are COUNT/SUM/AVG/MIN/MAX of a measure
+    (or COUNT(DISTINCT)/MIN/MAX of a dimension). Returns (rewritten_sql,
+    rollup_name), or None when the query has to run on the raw table.
+    """
+    try:
+        tree = sqlglot.parse_one(sql, read="postgres")
+    except sqlglot.errors.ParseError:
+        return None
+
+    if not isinstance(tree, exp.Select):
+        return None
+    tables = list(tree.find_all(exp.Table))
+    if len(tables) != 1 or tables[0].name.lower() != "sales":
+        return None
+    if any(tree.find_all(exp.Join, exp.Subquery, exp.With, exp.Window, exp.Union)):
+        return None
+
+    aggregates = list(tree.find_all(exp.AggFunc))
+    if not aggregates:
+        return None
+
+    # Output aliases may be referenced in ORDER BY / HAVING
+    aliases = {select.alias.lower() for select in tree.expressions if select.alias}
+    used_dims: set = set()
+
+    for column in tree.find_all(exp.Column):
+        if column.find_ancestor(exp.AggFunc):
+            continue
+        name = column.name.lower()
+        if name in DIMENSIONS:
+            used_dims.add(name)
+        elif not (name in aliases and not column.table):
+            return None
+
+    replacements = {}
+    for agg in aggregates:
+        # Nested aggregates are not rewritable
+        if agg.find_ancestor(exp.AggFunc):
+            return None
+        replacement = _rewrite_aggregate(agg, used_dims)
+        if replacement is None:
+            return None
+        replacements[id(agg)] = replacement
+
+    rollup = next((name for name, dims in ROLLUPS if used_dims <= set(dims)), None)
+    if rollup is None:
+        return None
+
+    table = tables[0]
+    # Keep the original name as alias so qualified columns (sales.branch) still resolve
+    alias = table.alias or table.name
+    table.replace(exp.to_table(rollup).as_(alias))
+    for agg in aggregates:
+        agg.replace(replacements[id(agg)])
+
+    return tree.sql(dialect="postgres"), rollup
@@ -0,0 +1,241 @@
+from sqlalchemy import Connection, Engine, inspect, select, text
+from app.models.database_models import Sales, IngestWatermark
+from app.services.sales_loader import CSV_COLUMNS, SALES_COLUMNS, parse_sales_chunk, copy_frame
+from datetime import date
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import io
+import os
+import time
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGING_TABLE = "sales_staging"
+KEY_COLUMNS = ["source", "source_row", "row_hash"]
+# Bytes before the watermark that are hashed to notice a rewritten (not appended) file
+TAIL_BYTES = 4096
+
+
+def ensure_ingest_schema(engine: Engine):
+    """Add the ingestion columns to a sales table created before they existed"""
+    columns = {column["name"] for column in inspect(engine).get_columns("sales")}
+    with engine.begin() as conn:
+        for name in KEY_COLUMNS:
+            if name not in columns:
+                conn.execute(text(f"ALTER TABLE sales ADD COLUMN {name} {Sales.__table__.c[name].type}"))
+    for index in Sales.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    IngestWatermark.__table__.create(bind=engine, checkfirst=True)
+
+
+def hash_rows(df: pd.DataFrame) -> pd.Series:
+    """Stable 64-bit content hash of each parsed row, as signed BIGINT values"""
+    return pd.util.hash_pandas_object(df[SALES_COLUMNS], index=False).astype("int64")
+
+
+def _tail_hash(f, offset: int, start: int) -> str:
+    f.seek(max(start, offset - TAIL_BYTES))
+    return hashlib.md5(f.read(offset - max(start, offset - TAIL_BYTES))).hexdigest()
+
+
+def _read_lines(f, chunk_size: int) -> Iterator[Tuple[List[bytes], int]]:
+    """
+    Complete lines from the current position in chunks, with the bytes consumed
+
+    A trailing line without a newline is still being written and is left
+    for the next run. Rows are one line each (no quoted newlines), which
+    holds for the sales exports.
+    """
+    while True:
+        lines = list(islice(f, chunk_size))
+        if not lines:
+            return
+        if not lines[-1].endswith(b"\n"):
+            lines.pop()
+            if not lines:
+                return
+            yield lines, sum(len(line) for line in lines)
+            return
+        yield lines, sum(len(line) for line in lines)
+
+
+def _parse_lines(lines: List[bytes], header: List[str], first_row: int) -> Tuple[pd.DataFrame, int]:
+    chunk = pd.read_csv(
+        io.BytesIO(b"".join(lines)),
+        header=None,
+        names=header,
+        usecols=list(CSV_COLUMNS),
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        # Blank lines still count as rows so numbering matches the file
+        skip_blank_lines=False
+    )
+    chunk.index = range(first_row, first_row + len(chunk))
+    df, dropped = parse_sales_chunk(chunk)
+    df = df.copy()
+    df["source_row"] = df.index
+    df["row_hash"] = hash_rows(df)
+    return df, dropped
+
+
+def _stage(conn: Connection, df: pd.DataFrame):
+    """Replace the staging table contents with a parsed chunk"""
+    conn.execute(text(f"DELETE FROM {STAGING_TABLE}"))
+    if conn.dialect.name == "postgresql":
+        copy_frame(conn.connection.cursor(), df, STAGING_TABLE)
+    else:
+        records = df.astype(object).where(df.notna(), None).to_dict("records")
+        columns = list(df.columns)
+        conn.execute(
+            text(f"INSERT INTO {STAGING_TABLE} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"),
+            records
+        )
+
+
+def _create_staging(conn: Connection):
+    columns = [f"{name} {Sales.__table__.c[name].type}" for name in SALES_COLUMNS + KEY_COLUMNS]
+    conn.execute(text(f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ({', '.join(columns)})"))
+
+
+# Staged rows that are new, or whose content differs from the stored row
+CHANGED_SQL = f"""
+    SELECT
+        SUM(CASE WHEN t.id IS NULL THEN 1 ELSE 0 END),
+        SUM(CASE WHEN t.id IS NOT NULL THEN 1 ELSE 0 END),
+        MIN(s.date), MAX(s.date), MIN(t.date), MAX(t.date)
+    FROM {STAGING_TABLE} s
+    LEFT JOIN sales t ON t.source = s.source AND t.source_row = s.source_row
+    WHERE t.id IS NULL OR t.row_hash IS NULL OR t.row_hash <> s.row_hash
+"""
+
+_UPDATE_COLUMNS = SALES_COLUMNS + ["row_hash"]
+UPSERT_SQL = f"""
+    INSERT INTO sales ({', '.join(SALES_COLUMNS + KEY_COLUMNS)})
+    SELECT {', '.join(SALES_COLUMNS + KEY_COLUMNS)} FROM {STAGING_TABLE} WHERE true
+    ON CONFLICT (source, source_row) DO UPDATE
+    SET {', '.join(f'{c} = excluded.{c}' for c in _UPDATE_COLUMNS)}
+    WHERE sales.row_hash IS NULL OR sales.row_hash <> excluded.row_hash
+"""
+
+
+def _widen(date_range: Optional[Tuple[Any, Any]], *dates) -> Optional[Tuple[Any, Any]]:
+    dates = [d for d in dates if d is not None]
+    if date_range:
+        dates += list(date_range)
+    return (min(dates), max(dates)) if dates else date_range
+
+
+def ingest_csv(
+    engine: Engine,
+    csv_path: str,
+    source: Optional[str] = None,
+    chunk_size: int = 100_000,
+    full_scan: bool = False,
+    progress: Optional[Callable[[int, float], None]] = None
+) -> Dict[str, Any]:
+    """
+    Upsert the new or changed rows of a sales export
+
+    Each data row is keyed by (source, row number) and stores a hash of its
+    parsed content. The source's watermark records how far the file has
+    been ingested, so a file that only grew is read from the watermark on:
+    the cost follows the appended rows. A file that shrank or whose bytes
+    before the watermark changed (or full_scan) is rescanned from the top;
+    unchanged rows are skipped by hash and rows past the new end are
+    deleted. Everything, including the watermark, commits in one
+    transaction, so re-running after a failure is safe.
+
+    Returns counts of inserted, updated, deleted and unchanged rows and the
+    (first, last) sales date touched, for precise downstream invalidation.
+    """
+    source = source or os.path.basename(csv_path)
+    started = time.perf_counter()
+    stats = {"source": source, "inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "errors": 0}
+    date_range: Optional[Tuple[date, date]] = None
+
+    with open(csv_path, "rb") as f, engine.begin() as conn:
+        header_line = f.readline()
+        header = pd.read_csv(io.BytesIO(header_line), nrows=0).columns.tolist()
+        data_start = len(header_line)
+        file_size = os.fstat(f.fileno()).st_size
+
+        watermark = conn.execute(
+            select(IngestWatermark.row_count, IngestWatermark.byte_offset, IngestWatermark.tail_hash)
+            .where(IngestWatermark.source == source)
+        ).first()
+        offset, first_row = data_start, 0
+        if watermark and not full_scan:
+            if watermark.byte_offset <= file_size and _tail_hash(f, watermark.byte_offset, data_start) == watermark.tail_hash:
+                offset, first_row = watermark.byte_offset, watermark.row_count
+            else:
+                logger.info(f"{source} was rewritten, rescanning it")
+        scanned_from_top = first_row == 0
+        stats["mode"] = "full" if scanned_from_top else "append"
+
+        _create_staging(conn)
+        f.seek(offset)
+        row = first_row
+        for lines, consumed in _read_lines(f, chunk_size):
+            df, dropped = _parse_lines(lines, header, row)
+            df.insert(len(SALES_COLUMNS), "source", source)
+            stats["errors"] += dropped
+            row += len(lines)
+            offset += consumed
+
+            if len(df):
+                _stage(conn, df)
+                inserted, updated, new_first, new_last, old_first, old_last = conn.execute(text(CHANGED_SQL)).one()
+                inserted, updated = inserted or 0, updated or 0
+                if inserted or updated:
+                    conn.execute(text(UPSERT_SQL))
+                    date_range = _widen(date_range, new_first, new_last, old_first, old_last)
+                stats["inserted"] += inserted
+                stats["updated"] += updated
+                stats["unchanged"] += len(df) - inserted - updated
+            if progress:
+                progress(row, time.perf_counter() - started)
+
+        if scanned_from_top:
+            # Rows that are no longer in the file
+            params = {"source": source, "rows": row}
+            first, last = conn.execute(
+                text("SELECT MIN(date), MAX(date) FROM sales WHERE source = :source AND source_row >= :rows"),
+                params
+            ).one()
+            stats["deleted"] = conn.execute(
+                text("DELETE FROM sales WHERE source = :source AND source_row >= :rows"),
+                params
+            ).rowcount
+            date_range = _widen(date_range, first, last)
+
+        conn.execute(text(f"DROP TABLE {STAGING_TABLE}"))
+        _save_watermark(conn, source, row, offset, _tail_hash(f, offset, data_start))
+
+    stats["rows_read"] = row - first_row
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["changed"] = stats["inserted"] + stats["updated"] + stats["deleted"]
+    stats["date_range"] = tuple(pd.Timestamp(d).date() for d in date_range) if date_range else None
+    return stats
+
+
+def _save_watermark(conn: Connection, source: str, row_count: int, offset: int, tail_hash: str):
+    values = {"source": source, "row_count": row_count, "byte_offset": offset, "tail_hash": tail_hash}
+    updated = conn.execute(
+        text(
+            "UPDATE ingest_watermarks SET row_count = :row_count, byte_offset = :byte_offset, "
+            "tail_hash = :tail_hash, updated_at = CURRENT_TIMESTAMP WHERE source = :source"
+        ),
+        values
+    ).rowcount
+    if not updated:
+        conn.execute(
+            text(
+                "INSERT INTO ingest_watermarks (source, row_count, byte_offset, tail_hash, updated_at) "
+                "VALUES (:source, :row_count, :byte_offset, :tail_hash, CURRENT_TIMESTAMP)"
+            ),
+            values
+        )
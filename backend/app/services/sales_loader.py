@@ -0,0 +1,205 @@
+from sqlalchemy import Engine, delete, insert, inspect, text
+from app.models.database_models import Sales, IngestWatermark
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import io
+import time
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+# CSV header -> sales column
+CSV_COLUMNS = {
+    "Date": "date",
+    "Branch": "branch",
+    "Customer type": "customer_type",
+    "Gender": "gender",
+    "Product line": "product_line",
+    "Unit price": "unit_price",
+    "Quantity": "quantity",
+    "Payment": "payment",
+    "Rating": "rating",
+}
+SALES_COLUMNS = [
+    "date", "branch", "customer_type", "gender", "product_line",
+    "unit_price", "quantity", "payment", "rating", "total",
+]
+TEXT_COLUMNS = ["branch", "customer_type", "gender", "product_line", "payment"]
+
+
+def read_csv_chunks(csv_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Stream the export in chunks, everything as text so parsing is done once, vectorized"""
+    return pd.read_csv(
+        csv_path,
+        usecols=list(CSV_COLUMNS),
+        dtype=str,
+        keep_default_na=False,
+        na_values=[""],
+        chunksize=chunk_size
+    )
+
+
+def parse_sales_chunk(chunk: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    """
+    Convert a raw CSV chunk to sales rows
+
+    Dates, numbers and total are computed over whole columns. Rows without
+    a parseable date, unit price or quantity are dropped; returns the rows
+    and the number dropped.
+    """
+    df = chunk.rename(columns=CSV_COLUMNS)
+
+    raw_dates = df["date"].str.strip()
+    dates = pd.to_datetime(raw_dates, format="%m/%d/%Y", errors="coerce")
+    unparsed = dates.isna() & raw_dates.notna()
+    if unparsed.any():
+        # Other formats (ISO dates etc.) are rare, parse them the slow way
+        dates[unparsed] = pd.to_datetime(raw_dates[unparsed], format="mixed", errors="coerce")
+    df["date"] = dates.dt.date
+
+    df["unit_price"] = pd.to_numeric(df["unit_price"], errors="coerce")
+    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
+    df["rating"] = pd.to_numeric(df["rating"], errors="coerce")
+
+    valid = dates.notna() & df["unit_price"].notna() & df["quantity"].notna()
+    df = df[valid].copy()
+    df["quantity"] = df["quantity"].astype("int64")
+    df["total"] = (df["unit_price"] * df["quantity"]).round(2)
+    for column in TEXT_COLUMNS:
+        df[column] = df[column].str.strip()
+
+    return df[SALES_COLUMNS], int((~valid).sum())
+
+
+def copy_frame(cursor, df: pd.DataFrame, table: str = "sales"):
+    """Stream a frame into a table with COPY, columns named as in the frame"""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep="")
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def _secondary_indexes(cursor) -> List[Tuple[str, str]]:
+    """(name, definition) of the sales indexes that are not the primary key"""
+    cursor.execute(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.schemaname = current_schema() AND i.tablename = 'sales' "
+        "AND i.indexname NOT IN ("
+        "  SELECT conname FROM pg_constraint WHERE conrelid = 'sales'::regclass AND contype = 'p'"
+        ")"
+    )
+    return cursor.fetchall()
+
+
+def bulk_load_csv(
+    engine: Engine,
+    csv_path: str,
+    chunk_size: int = 100_000,
+    replace: bool = False,
+    drop_indexes: bool = False,
+    progress: Optional[Callable[[int, float], None]] = None
+) -> Dict[str, Any]:
+    """
+    Load a sales export into PostgreSQL with COPY
+
+    The whole load is one transaction: with replace the table is truncated
+    and the incremental ingestion watermarks cleared first, and with
+    drop_indexes the secondary indexes are dropped before copying and
+    rebuilt after, which is much faster for large loads.
+    progress(rows_loaded, seconds) is called after every chunk.
+    """
+    started = time.perf_counter()
+    rows = 0
+    errors = 0
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if replace:
+            cursor.execute("TRUNCATE sales RESTART IDENTITY")
+            # Incremental ingestion would otherwise skip the rows before its watermarks
+            cursor.execute("SELECT to_regclass('ingest_watermarks')")
+            if cursor.fetchone()[0] is not None:
+                cursor.execute("DELETE FROM ingest_watermarks")
+
+        indexes = _secondary_indexes(cursor) if drop_indexes else []
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{name}"')
+
+        for chunk in read_csv_chunks(csv_path, chunk_size):
+            df, dropped = parse_sales_chunk(chunk)
+            errors += dropped
+            if len(df):
+                copy_frame(cursor, df)
+            rows += len(df)
+            if progress:
+                progress(rows, time.perf_counter() - started)
+
+        for name, definition in indexes:
+            logger.info(f"Rebuilding index {name}")
+            cursor.execute(definition)
+
+        raw.commit()
+        cursor.execute("ANALYZE sales")
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows / seconds) if seconds else 0,
+        "indexes_rebuilt": len(indexes)
+    }
+
+
+def insert_load_csv(
+    engine: Engine,
+    csv_path: str,
+    chunk_size: int = 100_000,
+    replace: bool = False,
+    progress: Optional[Callable[[int, float], None]] = None
+) -> Dict[str, Any]:
+    """Portable version of bulk_load_csv using multi-row INSERTs, for databases without COPY"""
+    started = time.perf_counter()
+    rows = 0
+    errors = 0
+
+    with engine.begin() as conn:
+        if replace:
+            conn.execute(delete(Sales))
+            # Incremental ingestion would otherwise skip the rows before its watermarks
+            if inspect(conn).has_table(IngestWatermark.__tablename__):
+                conn.execute(delete(IngestWatermark))
+        for chunk in read_csv_chunks(csv_path, chunk_size):
+            df, dropped = parse_sales_chunk(chunk)
+            errors += dropped
+            records = df.astype(object).where(df.notna(), None).to_dict("records")
+            if records:
+                conn.execute(insert(Sales), records)
+            rows += len(records)
+            if progress:
+                progress(rows, time.perf_counter() - started)
+
+    seconds = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "errors": errors,
+        "seconds": round(seconds, 2),
+        "rows_per_second": round(rows / seconds) if seconds else 0,
+        "indexes_rebuilt": 0
+    }
+
+
+def count_sales(engine: Engine) -> int:
+    """Rows currently in the sales table"""
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COUNT(*) FROM sales")).scalar_one()
@@ -0,0 +1,177 @@
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import MetaData, text
+from app.config import get_settings
+from app.services.data_version import get_data_versions, SALES_DATASET
+from app.services.result_cache import SQLResultCache
+from app.services.rollups import rewrite_to_rollup, ROLLUPS_DATASET
+from app.services.sales_loader import TEXT_COLUMNS
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Literal, Optional, Tuple
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Text columns with more distinct values than this are not treated as dimensions
+MAX_DIMENSION_VALUES = 500
+
+
+class CachedSQLDatabase(SQLDatabase):
+    """
+    SQLDatabase that snapshots table info (schema + sample rows)
+    
+    The snapshot is built once and reused until the sales data version
+    changes, which is checked at most every schema_cache_check_interval
+    seconds. Both SQL tools share one instance through the resource registry.
+    
+    When a result cache is given, query results returned by run() (used by
+    the SQL agent toolkit) are cached per data version as well. Aggregate
+    queries are routed to the sales rollups while those are current.
+    """
+    
+    def __init__(self, *args, result_cache: Optional[SQLResultCache] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.result_cache = result_cache
+        self._snapshot_lock = threading.Lock()
+        self._snapshots: Dict[Optional[Tuple[str, ...]], str] = {}
+        self._snapshot_version: Optional[int] = None
+        self._snapshot_built_at: Optional[datetime] = None
+        self._dimension_values: Optional[Dict[str, List[str]]] = None
+        self._version_checked_at = 0.0
+        self._rollups_ready = False
+    
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        """Get table info from the snapshot, building it on first use"""
+        self._ensure_fresh()
+        key = tuple(sorted(table_names)) if table_names else None
+        with self._snapshot_lock:
+            if key not in self._snapshots:
+                self._snapshots[key] = super().get_table_info(table_names)
+                self._snapshot_built_at = datetime.now(timezone.utc)
+                logger.info(f"Built table info snapshot for {key or 'all tables'}")
+            return self._snapshots[key]
+    
+    def dimension_values(self) -> Dict[str, List[str]]:
+        """Distinct values of the low-cardinality text columns of sales, kept until the data version changes"""
+        self._ensure_fresh()
+        with self._snapshot_lock:
+            if self._dimension_values is not None:
+                return self._dimension_values
+        values = {}
+        with self._engine.connect() as conn:
+            for column in TEXT_COLUMNS:
+                rows = conn.execute(text(
+                    f"SELECT DISTINCT {column} FROM sales WHERE {column} IS NOT NULL LIMIT {MAX_DIMENSION_VALUES + 1}"
+                )).scalars().all()
+                if len(rows) <= MAX_DIMENSION_VALUES:
+                    values[column] = [str(value) for value in rows]
+        with self._snapshot_lock:
+            self._dimension_values = values
+        return values
+    
+    def current_data_version(self) -> int:
+        """Sales data version, re-checked at most every schema_cache_check_interval seconds"""
+        self._ensure_fresh()
+        return self._snapshot_version
+    
+    def route_query(self, sql: str) -> str:
+        """Rewrite the query to a rollup table when one can answer it"""
+        self._ensure_fresh()
+        if not (settings.rollups_enabled and self._rollups_ready):
+            return sql
+        rewritten = rewrite_to_rollup(sql)
+        if rewritten is None:
+            return sql
+        logger.info(f"Routed query to {rewritten[1]}")
+        return rewritten[0]
+    
+    def run(
+        self,
+        command,
+        fetch: Literal["all", "one", "cursor"] = "all",
+        include_columns: bool = False,
+        *,
+        parameters: Optional[Dict[str, Any]] = None,
+        execution_options: Optional[Dict[str, Any]] = None,
+    ):
+        """Execute a SQL command, serving repeated plain queries from the result cache"""
+        cacheable = (
+            self.result_cache is not None
+            and isinstance(command, str)
+            and fetch != "cursor"
+            and parameters is None
+        )
+        if not cacheable:
+            return super().run(
+                command, fetch, include_columns,
+                parameters=parameters, execution_options=execution_options
+            )
+        
+        version = self.current_data_version()
+        namespace = f"agent:{fetch}:{include_columns}"
+        cached = self.result_cache.get(command, version, namespace=namespace)
+        if cached is not None:
+            return cached
+        
+        routed = self.route_query(command)
+        try:
+            result = super().run(routed, fetch, include_columns, execution_options=execution_options)
+        except Exception:
+            if routed == command:
+                raise
+            logger.warning("Rollup query failed, falling back to sales table")
+            result = super().run(command, fetch, include_columns, execution_options=execution_options)
+        self.result_cache.put(command, version, result, namespace=namespace)
+        return result
+    
+    def invalidate(self):
+        """Drop the snapshot so the next call re-checks the version and rebuilds"""
+        with self._snapshot_lock:
+            self._snapshots.clear()
+            self._dimension_values = None
+            self._snapshot_version = None
+            self._version_checked_at = 0.0
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Current snapshot contents for inspection"""
+        with self._snapshot_lock:
+            return {
+                "data_version": self._snapshot_version,
+                "built_at": self._snapshot_built_at,
+                "tables": {
+                    ",".join(key) if key else "*": info
+                    for key, info in self._snapshots.items()
+                }
+            }
+    
+    def _ensure_fresh(self):
+        """Rebuild reflection and drop snapshots if the data version changed"""
+        now = time.monotonic()
+        if self._snapshot_version is not None and now - self._version_checked_at < settings.schema_cache_check_interval:
+            return
+        
+        versions = get_data_versions(self._engine)
+        version = versions.get(SALES_DATASET, 0)
+        with self._snapshot_lock:
+            self._version_checked_at = now
+            self._rollups_ready = version > 0 and versions.get(ROLLUPS_DATASET) == version
+            if version == self._snapshot_version:
+                return
+            
+            if self._snapshot_version is not None:
+                # Schema may have changed too (migrations), so reflect again
+                metadata = MetaData()
+                metadata.reflect(
+                    views=self._view_support,
+                    bind=self._engine,
+                    only=list(self._usable_tables),
+                    schema=self._schema
+                )
+                self._metadata = metadata
+                logger.info(f"Sales data version changed to {version}, refreshing table info")
+            
+            self._snapshots.clear()
+            self._dimension_values = None
+            self._snapshot_version = version
@@ -0,0 +1,316 @@
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import BaseMessage
+from sqlalchemy import Engine, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.models.database_models import Conversation
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import threading
+import time
+import tiktoken
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Chat format overhead per message and per reply, as counted by OpenAI
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache()
+def _get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; estimate if that is not possible
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(messages: List[BaseMessage], model: str) -> int:
+    """Prompt tokens used by a list of chat messages"""
+    encoding = _get_encoding(model)
+    tokens = TOKENS_PER_REPLY
+    for message in messages:
+        content = str(message.content)
+        tokens += TOKENS_PER_MESSAGE
+        tokens += len(encoding.encode(content)) if encoding else len(content) // 4 + 1
+    return tokens
+
+
+def _recent_turns_query(session_id: str, limit: int):
+    # Served by the (session_id, created_at) index
+    return (
+        select(Conversation.user_message, Conversation.agent_response)
+        .where(Conversation.session_id == session_id)
+        .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+        .limit(limit)
+    )
+
+
+def _turn_count_query(session_id: str):
+    return select(func.count()).select_from(Conversation).where(Conversation.session_id == session_id)
+
+
+def count_turns(engine: Engine, session_id: str) -> int:
+    """Number of turns stored for the session"""
+    with engine.connect() as conn:
+        return conn.execute(_turn_count_query(session_id)).scalar_one()
+
+
+async def acount_turns(engine: AsyncEngine, session_id: str) -> int:
+    """Async version of count_turns"""
+    async with engine.connect() as conn:
+        return (await conn.execute(_turn_count_query(session_id))).scalar_one()
+
+
+def load_recent_turns(engine: Engine, session_id: str, limit: int) -> List[Tuple[str, str]]:
+    """Last (user_message, agent_response) pairs of the session, oldest first"""
+    with engine.connect() as conn:
+        rows = conn.execute(_recent_turns_query(session_id, limit)).all()
+    return [tuple(row) for row in reversed(rows)]
+
+
+async def aload_recent_turns(engine: AsyncEngine, session_id: str, limit: int) -> List[Tuple[str, str]]:
+    """Async version of load_recent_turns"""
+    async with engine.connect() as conn:
+        rows = (await conn.execute(_recent_turns_query(session_id, limit))).all()
+    return [tuple(row) for row in reversed(rows)]
+
+
+class BoundedSessionMemory(ConversationSummaryBufferMemory):
+    """
+    Chat history kept within a token budget and a message window
+
+    When a turn pushes the history over max_token_limit (summary included)
+    or max_messages, the oldest exchanges are folded into a rolling summary.
+    Token counts use tiktoken instead of the chat model, so any model name
+    works. On the async path the history is trimmed at once and the summary
+    is written in a background task, after the response.
+    """
+
+    model_name: str = "gpt-4"
+    max_messages: int = 20
+    last_used: float = 0.0
+    summarizations: int = 0
+    # Turns of the session this memory has seen, stored ones included
+    turns: int = 0
+    # Latest background summarization; the next one waits for it so summaries fold in order
+    summary_task: Optional[Any] = None
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        super().save_context(inputs, outputs)
+        self.turns += 1
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        await super().asave_context(inputs, outputs)
+        self.turns += 1
+
+    def rehydrate(self, turns: List[Tuple[str, str]], turn_count: int):
+        """Replace the history with stored turns, trimmed to the budget without summarizing"""
+        self.clear()
+        for user_message, agent_response in turns:
+            self.chat_memory.add_user_message(user_message)
+            self.chat_memory.add_ai_message(agent_response)
+        self._trim()
+        self.turns = turn_count
+
+    def token_count(self) -> int:
+        """Prompt tokens of the history as loaded into the prompt"""
+        return count_tokens(self.load_memory_variables({})[self.memory_key], self.model_name)
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by the history"""
+        text_bytes = sum(len(str(message.content)) for message in self.chat_memory.messages)
+        return text_bytes + len(self.moving_summary_buffer)
+
+    def prune(self) -> None:
+        pruned = self._trim()
+        if pruned:
+            self.moving_summary_buffer = self.predict_new_summary(pruned, self.moving_summary_buffer)
+            self.summarizations += 1
+
+    async def aprune(self) -> None:
+        pruned = self._trim()
+        if pruned:
+            # The summarizing LLM call would otherwise hold up the response it follows
+            self.summary_task = asyncio.create_task(self._asummarize(pruned, self.summary_task))
+
+    async def _asummarize(self, pruned: List[BaseMessage], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await previous
+        try:
+            self.moving_summary_buffer = await self.apredict_new_summary(pruned, self.moving_summary_buffer)
+            self.summarizations += 1
+        except Exception as e:
+            logger.error(f"Error summarizing session history: {e}")
+
+    def _trim(self) -> List[BaseMessage]:
+        """Pop the oldest exchanges until the history fits; returns what was popped"""
+        buffer = self.chat_memory.messages
+        pruned = []
+        # Keep the latest exchange even if it alone is over budget
+        while len(buffer) > 2 and (len(buffer) > self.max_messages or self.token_count() > self.max_token_limit):
+            # Whole exchanges, so the window always starts with a human message
+            pruned.extend([buffer.pop(0), buffer.pop(0)])
+        return pruned
+
+
+class SessionMemoryStore:
+    """
+    Bounded map of session_id to BoundedSessionMemory
+
+    Holds at most max_sessions sessions, evicting the least recently used,
+    and drops sessions idle for longer than idle_ttl_seconds.
+
+    With an engine, the conversations table is the source of truth: a
+    session missing here is rehydrated from its last rehydrate_turns turns,
+    so any worker can serve any session. Cached sessions are not checked
+    against the table; turns another worker served while one was cached
+    here are only seen after it is evicted.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLanguageModel,
+        model_name: str,
+        max_sessions: int = 1000,
+        idle_ttl_seconds: float = 3600.0,
+        max_token_limit: int = 2000,
+        max_messages: int = 20,
+        engine: Optional[Engine] = None,
+        async_engine: Optional[AsyncEngine] = None,
+        rehydrate_turns: int = 10
+    ):
+        self.llm = llm
+        self.model_name = model_name
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.max_token_limit = max_token_limit
+        self.max_messages = max_messages
+        self.engine = engine
+        self.async_engine = async_engine
+        self.rehydrate_turns = rehydrate_turns
+
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, BoundedSessionMemory]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+        self.rehydrations = 0
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+        self.prompts = 0
+
+    def get(self, session_id: str) -> BoundedSessionMemory:
+        """
+        Get memory for the session, marking it as used
+
+        Missing sessions are rehydrated from the table; cached ones are
+        served without touching it.
+        """
+        if self.engine is not None and self.peek(session_id) is None:
+            try:
+                turn_count = count_turns(self.engine, session_id)
+                turns = load_recent_turns(self.engine, session_id, self.rehydrate_turns) if turn_count else []
+                return self._rehydrate(session_id, turns, turn_count)
+            except Exception as e:
+                logger.error(f"Error rehydrating session memory: {e}")
+        return self._touch(session_id)
+
+    async def aget(self, session_id: str) -> BoundedSessionMemory:
+        """Async version of get"""
+        if self.async_engine is not None and self.peek(session_id) is None:
+            try:
+                turn_count = await acount_turns(self.async_engine, session_id)
+                turns = await aload_recent_turns(self.async_engine, session_id, self.rehydrate_turns) if turn_count else []
+                return self._rehydrate(session_id, turns, turn_count)
+            except Exception as e:
+                logger.error(f"Error rehydrating session memory: {e}")
+        return self._touch(session_id)
+
+    def peek(self, session_id: str) -> Optional[BoundedSessionMemory]:
+        """Get memory for the session without creating it"""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def load(self, session_id: str) -> Dict[str, Any]:
+        """Memory variables for the prompt, recording their token count"""
+        memory = self.get(session_id)
+        variables = memory.load_memory_variables({})
+        tokens = count_tokens(variables["chat_history"], self.model_name)
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens_total += tokens
+            self.prompt_tokens_max = max(self.prompt_tokens_max, tokens)
+        return variables
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counts, memory held and history tokens sent with prompts"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "messages": sum(len(memory.chat_memory.messages) for memory in sessions),
+            "bytes": sum(memory.size_bytes() for memory in sessions),
+            "summarizations": sum(memory.summarizations for memory in sessions),
+            "rehydrations": self.rehydrations,
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions,
+            "history_token_limit": self.max_token_limit,
+            "avg_history_tokens": round(self.prompt_tokens_total / self.prompts, 1) if self.prompts else 0.0,
+            "max_history_tokens": self.prompt_tokens_max
+        }
+
+    def _touch(self, session_id: str) -> BoundedSessionMemory:
+        """Get or create the cached memory and mark it as most recently used"""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = BoundedSessionMemory(
+                    llm=self.llm,
+                    model_name=self.model_name,
+                    max_token_limit=self.max_token_limit,
+                    max_messages=self.max_messages,
+                    memory_key="chat_history",
+                    return_messages=True
+                )
+                self._sessions[session_id] = memory
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.lru_evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            memory.last_used = now
+            return memory
+
+    def _rehydrate(self, session_id: str, turns: List[Tuple[str, str]], turn_count: int) -> BoundedSessionMemory:
+        memory = self._touch(session_id)
+        memory.rehydrate(turns, turn_count)
+        if turns:
+            self.rehydrations += 1
+            logger.info(f"Rehydrated {len(turns)} of {turn_count} turns for session {session_id}")
+        return memory
+
+    def _sweep(self, now: float):
+        """Drop idle sessions, at most once a minute"""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        # Sessions are kept in last-used order, so idle ones are at the front
+        while self._sessions:
+            session_id, memory = next(iter(self._sessions.items()))
+            if now - memory.last_used <= self.idle_ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.idle_evictions += 1
@@ -0,0 +1,339 @@
+from langchain_core.embeddings import Embeddings
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Leading phrases that do not change what SQL a question needs
+FILLER_PREFIXES = re.compile(
+    r"^(please |can you |could you |would you |show me |give me |tell me |i want |i'd like |what are |what is |what's |the )+"
+)
+NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+QUOTED_PATTERN = re.compile(r"\"([^\"]+)\"|(?<!\w)'([^']+)'(?!\w)")
+
+
+def _normalize_text(text: str) -> str:
+    text = re.sub(r"[^\w\s.']", " ", text.lower().strip())
+    return re.sub(r"\s+", " ", text).strip(" .")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and filler prefixes, collapse whitespace"""
+    return FILLER_PREFIXES.sub("", _normalize_text(question)).strip()
+
+
+def quoted_literals(question: str) -> List[str]:
+    """Lowercased strings quoted in the question, which usually end up in a WHERE clause"""
+    return sorted({(double or single).strip().lower() for double, single in QUOTED_PATTERN.findall(question)})
+
+
+class DimensionMatcher:
+    """
+    Finds mentions of dimension values (branch, product line, payment ...)
+
+    Values are matched the way normalized questions are written. Values of
+    one or two characters (branch "A") only count after their column name
+    ("branch a"), so articles and initials are not taken for filters.
+    """
+
+    def __init__(self, dimension_values: Dict[str, List[str]]):
+        self.filters: Dict[str, str] = {}  # Phrase -> column=value
+        for column, values in dimension_values.items():
+            column_words = column.replace("_", " ")
+            for value in values:
+                phrase = _normalize_text(value)
+                if not phrase:
+                    continue
+                self.filters[f"{column_words} {phrase}"] = f"{column}={phrase}"
+                if len(phrase) > 2:
+                    self.filters.setdefault(phrase, f"{column}={phrase}")
+        # Longest first, so "branch a" wins over a value inside it
+        ordered = sorted(self.filters, key=len, reverse=True)
+        self._pattern = (
+            re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in ordered) + r")\b") if ordered else None
+        )
+
+    def find(self, normalized: str) -> List[str]:
+        """Sorted column=value filters mentioned in a normalized question"""
+        if self._pattern is None:
+            return []
+        return sorted({self.filters[phrase] for phrase in self._pattern.findall(normalized)})
+
+
+@dataclass
+class SQLCacheLookup:
+    """Result of a cache lookup, reused to store the generated SQL on a miss"""
+    normalized: str
+    embedding: Optional[np.ndarray]
+    sql: Optional[str] = None
+    similarity: float = 0.0
+    literals: List[str] = field(default_factory=list)
+
+
+class SemanticSQLCache:
+    """
+    Maps embedded, normalized questions to previously generated SQL
+
+    A question hits when its normalized text matches exactly, or when the
+    cosine similarity of its embedding to a cached question reaches the
+    threshold and both mention the same numbers ("top 5" never reuses the
+    SQL of "top 10"), the same quoted strings and the same values of the
+    dimension_values() columns ("branch a" never reuses the SQL of
+    "branch b"). Without dimension values only exact matches hit. Entries
+    are evicted LRU beyond max_entries and expire after ttl_seconds. The
+    cache is persisted to cache_dir.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_dir: str,
+        similarity_threshold: float = 0.95,
+        max_entries: int = 1000,
+        ttl_seconds: int = 7 * 24 * 3600,
+        save_interval: float = 60.0,
+        dimension_values: Optional[Callable[[], Dict[str, List[str]]]] = None
+    ):
+        self.embeddings = embeddings
+        self.dimension_values = dimension_values
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_interval = save_interval
+        self.meta_path = os.path.join(cache_dir, "sql_cache.json")
+        self.vectors_path = os.path.join(cache_dir, "sql_cache.npy")
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # Normalized embeddings, rows match _entries order
+        self._matrix_keys: List[str] = []
+        self._last_saved = time.monotonic()
+        self._dirty = False
+        self._matcher: Optional[DimensionMatcher] = None
+        self._matcher_values: Optional[Dict[str, List[str]]] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._generation_seconds_total = 0.0
+        self._generations = 0
+
+        self._load()
+
+    def lookup(self, question: str) -> SQLCacheLookup:
+        """Find cached SQL for the question"""
+        normalized = normalize_question(question)
+        literals = quoted_literals(question)
+        exact = self._find_exact(normalized, literals)
+        if exact:
+            return exact
+        matcher = self._get_matcher()
+        embedding = np.asarray(self.embeddings.embed_query(normalized), dtype=np.float32)
+        return self._find_similar(normalized, literals, embedding, matcher)
+
+    async def alookup(self, question: str) -> SQLCacheLookup:
+        """Async version of lookup"""
+        normalized = normalize_question(question)
+        literals = quoted_literals(question)
+        exact = self._find_exact(normalized, literals)
+        if exact:
+            return exact
+        matcher = await asyncio.to_thread(self._get_matcher)
+        embedding = np.asarray(await self.embeddings.aembed_query(normalized), dtype=np.float32)
+        return self._find_similar(normalized, literals, embedding, matcher)
+
+    def store(self, lookup: SQLCacheLookup, sql: str, generation_seconds: float):
+        """Cache SQL that was generated for a missed lookup and ran successfully"""
+        if lookup.embedding is None:
+            return
+        with self._lock:
+            self._generation_seconds_total += generation_seconds
+            self._generations += 1
+            self._entries[lookup.normalized] = {
+                "sql": sql,
+                "embedding": lookup.embedding,
+                "numbers": sorted(NUMBER_PATTERN.findall(lookup.normalized)),
+                "literals": lookup.literals,
+                "created_at": time.time(),
+                "hits": 0
+            }
+            self._entries.move_to_end(lookup.normalized)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            self._dirty = True
+
+        if time.monotonic() - self._last_saved >= self.save_interval:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and estimated LLM latency saved"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 3),
+            "avg_generation_seconds": round(self._average_generation_seconds(), 3),
+            "similarity_threshold": self.similarity_threshold
+        }
+
+    def save(self):
+        """Persist entries to disk"""
+        with self._lock:
+            if not self._dirty:
+                return
+            keys = list(self._entries.keys())
+            meta = {
+                "entries": [
+                    {
+                        "normalized": key,
+                        "sql": self._entries[key]["sql"],
+                        "numbers": self._entries[key]["numbers"],
+                        "literals": self._entries[key].get("literals", []),
+                        "created_at": self._entries[key]["created_at"],
+                        "hits": self._entries[key]["hits"]
+                    }
+                    for key in keys
+                ],
+                "generation_seconds_total": self._generation_seconds_total,
+                "generations": self._generations
+            }
+            vectors = (
+                np.stack([self._entries[key]["embedding"] for key in keys])
+                if keys else np.zeros((0, 0), dtype=np.float32)
+            )
+            self._dirty = False
+            self._last_saved = time.monotonic()
+
+        try:
+            os.makedirs(os.path.dirname(self.meta_path), exist_ok=True)
+            # Write both files first, then swap them in so a crash never leaves a torn cache
+            np.save(self.vectors_path + ".tmp.npy", vectors)
+            with open(self.meta_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(self.vectors_path + ".tmp.npy", self.vectors_path)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            logger.info(f"Saved {len(keys)} SQL cache entries")
+        except Exception as e:
+            logger.error(f"Error saving SQL cache: {e}")
+
+    def _load(self):
+        """Load persisted entries, dropping expired ones"""
+        try:
+            if not (os.path.exists(self.meta_path) and os.path.exists(self.vectors_path)):
+                return
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            vectors = np.load(self.vectors_path)
+            if len(vectors) != len(meta["entries"]):
+                logger.warning("SQL cache files out of sync, starting empty")
+                return
+
+            now = time.time()
+            for entry, vector in zip(meta["entries"], vectors):
+                if now - entry["created_at"] > self.ttl_seconds:
+                    continue
+                normalized = entry.pop("normalized")
+                entry["embedding"] = vector.astype(np.float32)
+                self._entries[normalized] = entry
+            self._generation_seconds_total = meta.get("generation_seconds_total", 0.0)
+            self._generations = meta.get("generations", 0)
+            logger.info(f"Loaded {len(self._entries)} SQL cache entries")
+        except Exception as e:
+            logger.error(f"Error loading SQL cache: {e}")
+            self._entries.clear()
+
+    def _get_matcher(self) -> Optional[DimensionMatcher]:
+        """Matcher over the current dimension values, None when they cannot be read"""
+        if self.dimension_values is None:
+            return DimensionMatcher({})
+        try:
+            values = self.dimension_values()
+        except Exception as e:
+            logger.error(f"Error reading dimension values for the SQL cache: {e}")
+            return None
+        with self._lock:
+            # The values object is kept until the data changes, so the matcher is rebuilt only then
+            if values is not self._matcher_values:
+                self._matcher = DimensionMatcher(values)
+                self._matcher_values = values
+            return self._matcher
+
+    def _find_exact(self, normalized: str, literals: List[str]) -> Optional[SQLCacheLookup]:
+        with self._lock:
+            entry = self._entries.get(normalized)
+            if entry is None or self._expired(normalized, entry):
+                return None
+            self._record_hit(normalized, entry)
+            return SQLCacheLookup(normalized, entry["embedding"], entry["sql"], 1.0, literals)
+
+    def _find_similar(
+        self,
+        normalized: str,
+        literals: List[str],
+        embedding: np.ndarray,
+        matcher: Optional[DimensionMatcher]
+    ) -> SQLCacheLookup:
+        with self._lock:
+            # A wrong filter value cannot be ruled out without the dimension values
+            if self._entries and matcher is not None:
+                matrix = self._get_matrix()
+                query = embedding / (np.linalg.norm(embedding) or 1.0)
+                similarities = matrix @ query
+                numbers = sorted(NUMBER_PATTERN.findall(normalized))
+                dimensions = matcher.find(normalized)
+
+                for index in np.argsort(similarities)[::-1]:
+                    similarity = float(similarities[index])
+                    if similarity < self.similarity_threshold:
+                        break
+                    key = self._matrix_keys[index]
+                    entry = self._entries.get(key)
+                    if entry is None or self._expired(key, entry) or entry["numbers"] != numbers:
+                        continue
+                    if entry.get("literals", []) != literals or matcher.find(key) != dimensions:
+                        continue
+                    self._record_hit(key, entry)
+                    logger.info(f"SQL cache hit ({similarity:.3f}): '{normalized}' ~ '{key}'")
+                    return SQLCacheLookup(normalized, embedding, entry["sql"], similarity)
+
+            self.misses += 1
+            return SQLCacheLookup(normalized, embedding, literals=literals)
+
+    def _get_matrix(self) -> np.ndarray:
+        """Stack normalized embeddings, rebuilt only after the entries change"""
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.where(norms == 0, 1.0, norms)
+        return self._matrix
+
+    def _expired(self, key: str, entry: Dict[str, Any]) -> bool:
+        if time.time() - entry["created_at"] <= self.ttl_seconds:
+            return False
+        del self._entries[key]
+        self._matrix = None
+        self._dirty = True
+        return True
+
+    def _record_hit(self, key: str, entry: Dict[str, Any]):
+        entry["hits"] += 1
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.seconds_saved += self._average_generation_seconds()
+        self._dirty = True
+
+    def _average_generation_seconds(self) -> float:
+        return self._generation_seconds_total / self._generations if self._generations else 0.0
@@ -0,0 +1,711 @@
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain.docstore.document import Document as LangChainDocument
+from langchain_core.embeddings import Embeddings
+from app.services import ann_index
+from app.services.ann_index import IndexSpec
+from app.services.bm25_index import BM25Index
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import faiss
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+SEGMENTS_DIR = "segments"
+LEGACY_INDEX = "faiss_index"
+TRAINED_INDEX = "trained.index"
+
+# An IVF index is retrained once the corpus is this many times what it was trained on
+RETRAIN_GROWTH = 4
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_json(path: str, data: Any):
+    """Write JSON next to path and swap it in, so readers see the old or the new file, never half of one"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path))
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer; a waiting writer holds off new readers"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+def _document_key(metadata: dict) -> Optional[str]:
+    document_id = metadata.get("document_id")
+    if document_id is not None:
+        return str(document_id)
+    # Chunks uploaded before their document id was recorded are known by file name
+    source = metadata.get("source")
+    return None if source is None else _source_key(source)
+
+
+def _source_key(source: str) -> str:
+    return f"source:{source}"
+
+
+class SegmentedFAISS(FAISS):
+    """
+    FAISS store that skips tombstoned chunks, which stay in the index until
+    compaction, and keeps a BM25 index of the same chunks beside it
+
+    Searches share a read lock and adds take it exclusively, so uploads
+    never change the FAISS index under a search running in a worker thread.
+    """
+
+    tombstones: Set[str] = set()
+    lexical: Optional[BM25Index] = None
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        # FAISS releases the GIL, so searches run in parallel but must not overlap an add
+        self._index_lock = _ReadWriteLock()
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        text_embeddings = list(text_embeddings)
+        with self._index_lock.write():
+            ids = super().add_embeddings(text_embeddings, metadatas=metadatas, ids=ids, **kwargs)
+        if self.lexical is not None:
+            self.lexical.add(ids, [text for text, _ in text_embeddings])
+        return ids
+
+    def search_ids(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        predicate: Optional[Callable[[str], bool]] = None
+    ) -> List[Tuple[str, float]]:
+        """Chunk ids and distances of the k nearest live chunks"""
+        with self._index_lock.read():
+            return [(chunk_id, score) for _, chunk_id, score in self._search_live(embedding, k, predicate)]
+
+    def _search_live(
+        self,
+        embedding: List[float],
+        k: int,
+        predicate: Optional[Callable[[str], bool]]
+    ) -> List[Tuple[int, str, float]]:
+        """Index positions, chunk ids and distances of the k nearest live chunks (caller holds the read lock)"""
+        if not self.index.ntotal:
+            return []
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        # Search past tombstoned neighbours, widening until enough live chunks are found
+        fetch = min(k + min(len(self.tombstones), k), self.index.ntotal)
+        while True:
+            scores, indices = self.index.search(vector, fetch)
+            hits = []
+            for score, i in zip(scores[0], indices[0]):
+                if i == -1:
+                    continue
+                chunk_id = self.index_to_docstore_id[i]
+                if chunk_id in self.tombstones:
+                    continue
+                if predicate is None or predicate(chunk_id):
+                    hits.append((int(i), chunk_id, float(score)))
+            if len(hits) >= k or fetch >= self.index.ntotal:
+                return hits[:k]
+            fetch = min(fetch * 2, self.index.ntotal)
+
+    def _filter_predicate(
+        self, filter: Optional[Union[Callable, Dict[str, Any]]]
+    ) -> Optional[Callable[[str], bool]]:
+        if filter is None:
+            return None
+        filter_func = self._create_filter_func(filter)
+        return lambda chunk_id: filter_func(self.docstore.search(chunk_id).metadata)
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[LangChainDocument, float]]:
+        if not self.tombstones:
+            with self._index_lock.read():
+                return super().similarity_search_with_score_by_vector(
+                    embedding, k, filter=filter, fetch_k=fetch_k, **kwargs
+                )
+
+        hits = self.search_ids(embedding, k if filter is None else fetch_k, self._filter_predicate(filter))
+        docs = [(self.docstore.search(chunk_id), score) for chunk_id, score in hits]
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            docs = [(doc, score) for doc, score in docs if score <= score_threshold]
+        return docs[:k]
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        *,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: Optional[Union[Callable, Dict[str, Any]]] = None
+    ) -> List[Tuple[LangChainDocument, float]]:
+        if not self.tombstones:
+            with self._index_lock.read():
+                return super().max_marginal_relevance_search_with_score_by_vector(
+                    embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter
+                )
+
+        # MMR picks from the fetch_k nearest live chunks, so deleted ones are never candidates
+        with self._index_lock.read():
+            hits = self._search_live(embedding, fetch_k, self._filter_predicate(filter))
+            vectors = [self.index.reconstruct(i) for i, _, _ in hits]
+        selected = maximal_marginal_relevance(
+            np.array([embedding], dtype=np.float32), vectors, k=k, lambda_mult=lambda_mult
+        )
+        return [(self.docstore.search(hits[i][1]), hits[i][2]) for i in selected]
+
+    def set_search_params(self, nprobe: int, ef_search: int):
+        with self._index_lock.write():
+            ann_index.set_search_params(self.index, nprobe, ef_search)
+
+
+class SegmentedVectorStore:
+    """
+    Append-only on-disk layout for the FAISS vector store
+
+    Every add writes one immutable segment (vectors.npy plus chunks.jsonl
+    with the chunk ids, texts and metadata) and then swaps manifest.json,
+    which lists the live segments, with an atomic rename. An add therefore
+    costs its own chunks and not the size of the corpus, and a crash leaves
+    the previous manifest and its segments intact. Once there are more than
+    max_segments, the smallest are merged into one in a background thread.
+
+    Deleting a document tombstones its chunks in the manifest; searches
+    skip them. When tombstoned chunks pass tombstone_ratio of the index,
+    compaction rewrites the segments holding them and swaps in an index
+    rebuilt without them.
+
+    The searchable index is a LangChain FAISS store kept in memory and
+    rebuilt from the segments at startup, with a BM25 index of the chunk
+    texts beside it unless lexical is off. Its FAISS index follows
+    index_spec: exact until the corpus reaches index_spec.min_chunks, then
+    rebuilt in the background as IVF or HNSW. Trained IVF centroids are
+    kept in trained.index so restarts only add vectors.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embeddings: Embeddings,
+        max_segments: int = 16,
+        tombstone_ratio: float = 0.2,
+        index_spec: Optional[IndexSpec] = None,
+        lexical: bool = True
+    ):
+        self.directory = directory
+        self.segments_dir = os.path.join(directory, SEGMENTS_DIR)
+        self.manifest_path = os.path.join(directory, MANIFEST)
+        self.embeddings = embeddings
+        self.max_segments = max(max_segments, 2)
+        self.tombstone_ratio = tombstone_ratio
+        self.index_spec = index_spec or IndexSpec()
+        self.lexical = lexical
+        self.trained_index_path = os.path.join(directory, TRAINED_INDEX)
+        self.vector_store: Optional[SegmentedFAISS] = None
+
+        # Guards the manifest, the in-memory index and the chunk bookkeeping
+        self._lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        self._manifest = self._empty_manifest()
+        self._document_chunks: Dict[str, List[str]] = {}
+        # Shared with the in-memory index, which checks it on every search
+        self.tombstones: Set[str] = set()
+
+        self._trained_on = 0  # Corpus size the IVF index was trained for
+
+        self.segments_written = 0
+        self.compactions = 0
+        self.chunks_purged = 0
+        self.index_builds = 0
+
+    def load(self) -> Optional[FAISS]:
+        """Build the in-memory index from the segments in the manifest (None when there are none)"""
+        if not os.path.exists(self.manifest_path):
+            self._migrate_legacy()
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            self._manifest = {**self._empty_manifest(), **json.load(f)}
+        self._remove_orphans()
+
+        self.tombstones.clear()
+        for chunk_ids in self._manifest["tombstones"].values():
+            self.tombstones.update(chunk_ids)
+        self._document_chunks = {}
+        self.vector_store = self._build_index(self._manifest["segments"], self._document_chunks)
+        if self.vector_store is not None:
+            logger.info(
+                f"Loaded {self.vector_store.index.ntotal} chunks from {len(self._manifest['segments'])} "
+                f"vector store segments ({len(self.tombstones)} tombstoned)"
+            )
+            if self._needs_rebuild():
+                self.compact_in_background()
+        return self.vector_store
+
+    def add(self, texts: List[str], vectors: np.ndarray, metadatas: List[dict]) -> List[str]:
+        """Persist chunks and their embeddings as a new segment and add them to the index; returns the chunk ids"""
+        if not texts:
+            return []
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = [uuid.uuid4().hex for _ in texts]
+        with self._lock:
+            name = self._next_segment_name()
+            self._write_segment(name, ids, texts, vectors, metadatas)
+            try:
+                # The manifest only lists the segment once the in-memory indexes hold it
+                if self.vector_store is None:
+                    self.vector_store = self._new_index(vectors.shape[1])
+                self.vector_store.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
+                self._commit(add=[self._segment_entry(name, ids, metadatas)])
+            except Exception:
+                # Chunks already in the index stay hidden; the segment never reaches the manifest
+                self.tombstones.update(ids)
+                shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+                raise
+            self._track_documents(self._document_chunks, ids, metadatas)
+        self.segments_written += 1
+
+        if len(self._manifest["segments"]) > self.max_segments or self._needs_rebuild():
+            self.compact_in_background()
+        return ids
+
+    def delete_document(self, document_id: Any) -> int:
+        """Tombstone the chunks of a document; returns how many were tombstoned"""
+        return self._delete_chunks(str(document_id))
+
+    def delete_source(self, source: str) -> int:
+        """Tombstone the chunks without a document id that came from a file name; returns how many"""
+        return self._delete_chunks(_source_key(source))
+
+    def _delete_chunks(self, key: str) -> int:
+        with self._lock:
+            chunk_ids = self._document_chunks.pop(key, [])
+            if not chunk_ids:
+                return 0
+            tombstones = {**self._manifest["tombstones"], key: chunk_ids}
+            self._commit(add=[], tombstones=tombstones)
+            self.tombstones.update(chunk_ids)
+
+        logger.info(f"Tombstoned {len(chunk_ids)} chunks of document {key}")
+        if self._needs_purge():
+            self.compact_in_background()
+        return len(chunk_ids)
+
+    def compact_in_background(self):
+        """Start a compaction unless one is already running"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self.compact, name="vector-compaction", daemon=True)
+        self._compaction.start()
+
+    def compact(self):
+        """
+        Merge the smallest segments so that at most max_segments / 2 remain,
+        past tombstone_ratio drop tombstoned chunks from disk and memory, and
+        rebuild the index when the corpus outgrew its type or training
+        """
+        try:
+            with self._lock:
+                purged = dict(self._manifest["tombstones"]) if self._needs_purge() else {}
+                rebuild = self._needs_rebuild()
+                # Segments holding tombstoned chunks are rewritten without them; without a
+                # document list (written before deletes were tracked) a segment may hold any
+                rewriting = [
+                    segment for segment in self._manifest["segments"]
+                    if purged and ("documents" not in segment or purged.keys() & set(segment["documents"]))
+                ]
+                rest = sorted(
+                    (segment for segment in self._manifest["segments"] if segment not in rewriting),
+                    key=lambda segment: segment["rows"]
+                )
+                merge_count = len(self._manifest["segments"]) - len(rewriting) - self.max_segments // 2 + 1
+                merging = rewriting + (rest[:merge_count] if merge_count >= 2 else [])
+                if len(merging) < 2 and not purged:
+                    merging = []
+                if not merging and not purged and not rebuild:
+                    return
+                name = self._next_segment_name()
+
+            # Segments are immutable, so they are read and merged without holding the lock
+            dead = {chunk_id for chunk_ids in purged.values() for chunk_id in chunk_ids}
+            ids, texts, metadatas, vectors = [], [], [], []
+            for segment in merging:
+                segment_vectors, chunks = self._read_segment(segment["name"])
+                keep = [position for position, chunk in enumerate(chunks) if chunk["id"] not in dead]
+                vectors.append(np.asarray(segment_vectors)[keep])
+                for position in keep:
+                    ids.append(chunks[position]["id"])
+                    texts.append(chunks[position]["text"])
+                    metadatas.append(chunks[position]["metadata"])
+            added = []
+            if ids:
+                self._write_segment(name, ids, texts, np.concatenate(vectors), metadatas)
+                added.append(self._segment_entry(name, ids, metadatas))
+
+            with self._lock:
+                if merging or purged:
+                    tombstones = {
+                        key: chunk_ids for key, chunk_ids in self._manifest["tombstones"].items() if key not in purged
+                    }
+                    self._commit(add=added, remove=[segment["name"] for segment in merging], tombstones=tombstones)
+                snapshot = list(self._manifest["segments"])
+
+            if purged or rebuild:
+                self._swap_index(snapshot, dead, retrain=rebuild)
+            if not merging and not purged:
+                return
+            for segment in merging:
+                shutil.rmtree(os.path.join(self.segments_dir, segment["name"]), ignore_errors=True)
+            self.compactions += 1
+            self.chunks_purged += len(dead)
+            logger.info(
+                f"Compacted {len(merging)} vector store segments into {name} "
+                f"({len(ids)} chunks kept, {len(dead)} tombstoned chunks dropped)"
+            )
+        except Exception as e:
+            logger.error(f"Error compacting vector store segments: {e}")
+
+    def clear(self):
+        """Remove every segment and the manifest"""
+        self.close()
+        with self._lock:
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+            self._manifest = self._empty_manifest()
+            self._document_chunks = {}
+            self.tombstones.clear()
+            self.vector_store = None
+
+    def close(self):
+        """Wait for a running compaction to finish"""
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment counts and index size"""
+        segments = self._manifest["segments"]
+        return {
+            "segments": len(segments),
+            "chunks": sum(segment["rows"] for segment in segments),
+            "indexed_chunks": self.vector_store.index.ntotal if self.vector_store is not None else 0,
+            "tombstoned_chunks": len(self.tombstones),
+            "documents": len(self._document_chunks),
+            "segments_written": self.segments_written,
+            "compactions": self.compactions,
+            "chunks_purged": self.chunks_purged,
+            "index": ann_index.describe(self.vector_store.index) if self.vector_store is not None else None,
+            "index_builds": self.index_builds,
+            "compacting": self._compaction is not None and self._compaction.is_alive()
+        }
+
+    def set_search_params(self, nprobe: int, ef_search: int):
+        """Change how many IVF lists or HNSW candidates searches visit"""
+        self.index_spec.nprobe = nprobe
+        self.index_spec.ef_search = ef_search
+        if self.vector_store is not None:
+            self.vector_store.set_search_params(nprobe, ef_search)
+
+    def _needs_rebuild(self) -> bool:
+        if self.vector_store is None:
+            return False
+        chunks = self.vector_store.index.ntotal
+        current = ann_index.index_type(self.vector_store.index)
+        if current == "flat":
+            return self.index_spec.wants_ann(chunks)
+        return self.index_spec.needs_training and chunks > RETRAIN_GROWTH * self._trained_on
+
+    def _needs_purge(self) -> bool:
+        indexed = self.vector_store.index.ntotal if self.vector_store is not None else 0
+        return bool(self.tombstones) and len(self.tombstones) > self.tombstone_ratio * indexed
+
+    def _swap_index(self, snapshot: List[dict], dead: Set[str], retrain: bool = False):
+        """Replace the in-memory index with one rebuilt from the compacted segments"""
+        document_chunks: Dict[str, List[str]] = {}
+        rebuilt = self._build_index(snapshot, document_chunks, retrain=retrain)
+        with self._lock:
+            # Catch up with segments added while the index was rebuilt
+            built = {segment["name"] for segment in snapshot}
+            for segment in self._manifest["segments"]:
+                if segment["name"] in built:
+                    continue
+                segment_vectors, chunks = self._read_segment(segment["name"])
+                if rebuilt is None:
+                    rebuilt = self._new_index(segment_vectors.shape[1])
+                metadatas = [chunk["metadata"] for chunk in chunks]
+                ids = [chunk["id"] for chunk in chunks]
+                rebuilt.add_embeddings(
+                    zip([chunk["text"] for chunk in chunks], np.asarray(segment_vectors)), metadatas=metadatas, ids=ids
+                )
+                self._track_documents(document_chunks, ids, metadatas)
+            # Documents deleted while the index was rebuilt stay deleted
+            live = set(self._document_chunks)
+            self._document_chunks = {key: chunk_ids for key, chunk_ids in document_chunks.items() if key in live}
+            self.vector_store = rebuilt
+            # Only now that the old index is out of use can its dropped chunks leave the tombstones,
+            # as can chunks of failed adds, which the rebuilt index never had
+            self.tombstones -= dead
+            self.tombstones &= {
+                chunk_id for chunk_ids in self._manifest["tombstones"].values() for chunk_id in chunk_ids
+            }
+
+    def _build_index(
+        self,
+        segments: List[dict],
+        document_chunks: Dict[str, List[str]],
+        retrain: bool = False
+    ) -> Optional[SegmentedFAISS]:
+        loaded = [self._read_segment(segment["name"]) for segment in segments]
+        if not loaded:
+            return None
+        index = self._empty_index([vectors for vectors, _ in loaded], retrain)
+
+        docs: Dict[str, LangChainDocument] = {}
+        index_to_id: Dict[int, str] = {}
+        lexical = BM25Index() if self.lexical else None
+        for segment, (vectors, chunks) in zip(segments, loaded):
+            # Segments written before every chunk had a document key list fewer documents than they hold
+            segment["documents"] = sorted({_document_key(chunk["metadata"]) for chunk in chunks} - {None})
+            start = index.ntotal
+            index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+            for position, chunk in enumerate(chunks):
+                docs[chunk["id"]] = LangChainDocument(page_content=chunk["text"], metadata=chunk["metadata"])
+                index_to_id[start + position] = chunk["id"]
+            if lexical is not None:
+                lexical.add([chunk["id"] for chunk in chunks], [chunk["text"] for chunk in chunks])
+            self._track_documents(
+                document_chunks,
+                [chunk["id"] for chunk in chunks if chunk["id"] not in self.tombstones],
+                [chunk["metadata"] for chunk in chunks if chunk["id"] not in self.tombstones]
+            )
+        self.index_builds += 1
+        store = SegmentedFAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=InMemoryDocstore(docs),
+            index_to_docstore_id=index_to_id
+        )
+        store.tombstones = self.tombstones
+        store.lexical = lexical
+        return store
+
+    def _empty_index(self, segments: List[np.ndarray], retrain: bool) -> faiss.Index:
+        """Index of the spec'd type for these segments, trained if it needs to be"""
+        chunks = sum(len(vectors) for vectors in segments)
+        dimension = segments[0].shape[1]
+        index = ann_index.new_index(self.index_spec, dimension, chunks)
+        if index.is_trained:
+            return index
+
+        trained = None if retrain else self._read_trained(dimension)
+        if trained is not None:
+            return trained
+        sample = ann_index.sample_rows(segments, ann_index.training_size(self.index_spec, chunks))
+        started = time.perf_counter()
+        ann_index.train(index, sample)
+        self._trained_on = chunks
+        logger.info(
+            f"Trained {self.index_spec.index_type} vector index on {len(sample)} of {chunks} chunks "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        self._write_trained(index)
+        return index
+
+    def _read_trained(self, dimension: int) -> Optional[faiss.Index]:
+        """Trained, empty IVF index from an earlier run, if it was built with the same parameters"""
+        meta_path = f"{self.trained_index_path}.json"
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["params"] != self.index_spec.build_params() or meta["dimension"] != dimension:
+                return None
+            index = faiss.read_index(self.trained_index_path)
+            ann_index.set_search_params(index, self.index_spec.nprobe, self.index_spec.ef_search)
+            self._trained_on = meta["trained_on"]
+            return index
+        except Exception as e:
+            logger.error(f"Error reading trained vector index: {e}")
+            return None
+
+    def _write_trained(self, index: faiss.Index):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self.trained_index_path}.{os.getpid()}.tmp"
+            faiss.write_index(index, tmp_path)
+            os.replace(tmp_path, self.trained_index_path)
+            _write_json(f"{self.trained_index_path}.json", {
+                "params": self.index_spec.build_params(),
+                "dimension": index.d,
+                "trained_on": self._trained_on
+            })
+        except Exception as e:
+            logger.error(f"Error writing trained vector index: {e}")
+
+    def _new_index(self, dimension: int) -> SegmentedFAISS:
+        store = SegmentedFAISS(
+            embedding_function=self.embeddings,
+            index=ann_index.new_index(self.index_spec, dimension, 0),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+        store.tombstones = self.tombstones
+        store.lexical = BM25Index() if self.lexical else None
+        return store
+
+    @staticmethod
+    def _track_documents(document_chunks: Dict[str, List[str]], ids: List[str], metadatas: List[dict]):
+        for chunk_id, metadata in zip(ids, metadatas):
+            key = _document_key(metadata)
+            if key is not None:
+                document_chunks.setdefault(key, []).append(chunk_id)
+
+    @staticmethod
+    def _segment_entry(name: str, ids: List[str], metadatas: List[dict]) -> dict:
+        documents = {_document_key(metadata) for metadata in metadatas} - {None}
+        return {"name": name, "rows": len(ids), "documents": sorted(documents)}
+
+    @staticmethod
+    def _empty_manifest() -> dict:
+        return {"next_segment": 1, "segments": [], "tombstones": {}}
+
+    def _next_segment_name(self) -> str:
+        number = self._manifest["next_segment"]
+        self._manifest["next_segment"] = number + 1
+        return f"seg-{number:08d}"
+
+    def _write_segment(self, name: str, ids: List[str], texts: List[str], vectors: np.ndarray, metadatas: List[dict]):
+        """Write a segment under a temporary name and rename it into place once it is complete"""
+        os.makedirs(self.segments_dir, exist_ok=True)
+        path = os.path.join(self.segments_dir, name)
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, "vectors.npy"), "wb") as f:
+            np.save(f, vectors)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(os.path.join(tmp_path, "chunks.jsonl"), "w") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+        _fsync_dir(self.segments_dir)
+
+    def _read_segment(self, name: str):
+        path = os.path.join(self.segments_dir, name)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.jsonl")) as f:
+            chunks = [json.loads(line) for line in f]
+        return vectors, chunks
+
+    def _commit(self, add: List[dict], remove: Optional[List[str]] = None, tombstones: Optional[dict] = None):
+        """Swap in a manifest with segments added and removed; called with the lock held"""
+        removed = set(remove or [])
+        manifest = {
+            "next_segment": self._manifest["next_segment"],
+            "segments": [segment for segment in self._manifest["segments"] if segment["name"] not in removed] + add,
+            "tombstones": self._manifest["tombstones"] if tombstones is None else tombstones
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(self.manifest_path, manifest)
+        self._manifest = manifest
+
+    def _remove_orphans(self):
+        """Delete segments a crash or an interrupted compaction left out of the manifest"""
+        if not os.path.isdir(self.segments_dir):
+            return
+        live = {segment["name"] for segment in self._manifest["segments"]}
+        for name in os.listdir(self.segments_dir):
+            if name not in live:
+                shutil.rmtree(os.path.join(self.segments_dir, name), ignore_errors=True)
+                logger.info(f"Removed orphaned vector store segment {name}")
+
+    def _migrate_legacy(self):
+        """Turn an index written by FAISS.save_local into the first segment"""
+        legacy_path = os.path.join(self.directory, LEGACY_INDEX)
+        if not os.path.exists(legacy_path):
+            return
+        legacy = FAISS.load_local(legacy_path, self.embeddings, allow_dangerous_deserialization=True)
+        ids = [legacy.index_to_docstore_id[i] for i in range(legacy.index.ntotal)]
+        docs = [legacy.docstore.search(chunk_id) for chunk_id in ids]
+        vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+        metadatas = [doc.metadata for doc in docs]
+        with self._lock:
+            name = self._next_segment_name()
+            self._write_segment(name, ids, [doc.page_content for doc in docs], vectors, metadatas)
+            self._commit(add=[self._segment_entry(name, ids, metadatas)])
+        shutil.rmtree(legacy_path)
+        logger.info(f"Migrated {len(ids)} chunks from the FAISS index to vector store segments")
@@ -0,0 +1,98 @@
+"""
+Recall vs latency of the vector index types on a synthetic corpus
+
+Builds a clustered corpus of --chunks vectors (unit length, like OpenAI
+embeddings) and finds the exact neighbours of --queries held-out queries
+with a flat index. Then builds each index type the way the vector store
+does (app.services.ann_index) and, for each nprobe or efSearch setting,
+prints recall@k against the exact neighbours, milliseconds per query,
+build seconds and index size.
+
+Usage (from the backend directory):
+    python benchmarks/ann_recall.py --chunks 200000 --dim 256 --queries 500
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import faiss
+import numpy as np
+from app.services import ann_index
+from app.services.ann_index import IndexSpec
+
+SWEEPS = {
+    "ivf_flat": [1, 4, 16, 64],
+    "ivf_pq": [1, 4, 16, 64],
+    "hnsw": [16, 32, 64, 128, 256],
+}
+
+
+def synthetic_corpus(chunks: int, queries: int, dim: int, clusters: int, spread: float, seed: int = 0):
+    """Vectors around random topic centres, normalized; queries come from the same distribution"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    total = chunks + queries
+    vectors = centres[rng.integers(0, clusters, total)] + spread * rng.normal(size=(total, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors[:chunks], vectors[chunks:]
+
+
+def build(spec: IndexSpec, corpus: np.ndarray):
+    started = time.perf_counter()
+    index = ann_index.new_index(spec, corpus.shape[1], len(corpus))
+    if not index.is_trained:
+        ann_index.train(index, ann_index.sample_rows([corpus], ann_index.training_size(spec, len(corpus))))
+    index.add(corpus)
+    return index, time.perf_counter() - started
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int):
+    started = time.perf_counter()
+    # One query at a time, like document_search
+    found = np.vstack([index.search(queries[i:i + 1], k)[1] for i in range(len(queries))])
+    ms = (time.perf_counter() - started) / len(queries) * 1000
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    return recall, ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=1.5, help="Noise around the topic centres; higher is harder")
+    parser.add_argument("-k", type=int, default=4, help="Neighbours per query, as RAGService.query")
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--pq-m", type=int, default=32)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--types", nargs="+", default=list(SWEEPS), choices=list(SWEEPS))
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(args.chunks, args.queries, args.dim, args.clusters, args.spread)
+    print(f"{args.chunks} chunks, {args.dim} dimensions, {args.queries} queries, k={args.k}")
+
+    flat, flat_seconds = build(IndexSpec(), corpus)
+    _, truth = flat.search(queries, args.k)
+    _, flat_ms = measure(flat, queries, truth, args.k)
+    print(f"\n{'index':>9} {'param':>12} {'recall':>7} {'ms/query':>9} {'build s':>8} {'size MB':>8}")
+    print(f"{'flat':>9} {'-':>12} {1.0:7.3f} {flat_ms:9.3f} {flat_seconds:8.1f} {corpus.nbytes / 1e6:8.1f}")
+
+    for index_type in args.types:
+        spec = IndexSpec(
+            index_type=index_type,
+            min_chunks=0,
+            nlist=args.nlist,
+            pq_m=args.pq_m,
+            hnsw_m=args.hnsw_m
+        )
+        index, seconds = build(spec, corpus)
+        size = len(faiss.serialize_index(index)) / 1e6
+        for value in SWEEPS[index_type]:
+            ann_index.set_search_params(index, nprobe=value, ef_search=value)
+            recall, ms = measure(index, queries, truth, args.k)
+            param = f"efSearch={value}" if index_type == "hnsw" else f"nprobe={value}"
+            print(f"{index_type:>9} {param:>12} {recall:7.3f} {ms:9.3f} {seconds:8.1f} {size:8.1f}")
@@ -0,0 +1,77 @@
+"""
+Chart spec vs Plotly figure round trip in the dashboard tool
+
+Times what generate_visualization used to do (build a plotly.express
+figure, fig.to_json(), json.loads, json.dumps, detect the chart type a
+second time) against the compact chart spec it returns now, for each
+chart type and a few data sizes, and prints the payload sizes. Also
+times importing plotly against importing the dashboard tool, in fresh
+interpreters.
+
+Usage (from the backend directory):
+    python benchmarks/chart_spec.py -n 20
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.agents.dashboard_tool import create_plotly_chart, detect_chart_type, generate_visualization
+
+SIZES = [10, 100, 1000]
+CHART_TYPES = ["bar", "line", "pie", "scatter"]
+
+
+def sample_data(rows: int):
+    return [{"label": f"item {i}", "total_sales": round(1000 + (i * 37) % 500 + i * 0.5, 2)} for i in range(rows)]
+
+
+def figure_round_trip(data, chart_type: str) -> str:
+    fig = create_plotly_chart(data, chart_type)
+    return json.dumps({
+        "success": True,
+        "chart": json.loads(fig.to_json()),
+        "chart_type": chart_type if chart_type != "auto" else detect_chart_type(data),
+        "tool": "dashboard_tool"
+    })
+
+
+def timed(run, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        output = run()
+    return (time.perf_counter() - start) / iterations * 1000, len(output)
+
+
+def import_seconds(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, check=True, cwd=Path(__file__).parent.parent
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    # Warm up plotly so the figure timings do not include the import
+    figure_round_trip(sample_data(10), "bar")
+
+    print(f"{'type':>8} {'rows':>6} {'figure ms':>10} {'spec ms':>8} {'speedup':>8} {'figure KB':>10} {'spec KB':>8}")
+    for chart_type in CHART_TYPES:
+        for rows in SIZES:
+            data = sample_data(rows)
+            figure_ms, figure_bytes = timed(lambda: figure_round_trip(data, chart_type), args.iterations)
+            spec_ms, spec_bytes = timed(lambda: generate_visualization(data, chart_type), args.iterations)
+            print(f"{chart_type:>8} {rows:>6} {figure_ms:10.2f} {spec_ms:8.3f} {figure_ms / spec_ms:7.0f}x "
+                  f"{figure_bytes / 1024:10.1f} {spec_bytes / 1024:8.1f}")
+
+    print(f"\nimport plotly.express:        {import_seconds('plotly.express'):.2f}s")
+    print(f"import app.agents.dashboard_tool: {import_seconds('app.agents.dashboard_tool'):.2f}s")
@@ -0,0 +1,64 @@
+"""
+Concurrency benchmark for the /api/chat endpoint
+
+Sends one chat message on its own, then N identical messages in parallel,
+and compares wall-clock times. With the async agent path the parallel batch
+should finish in roughly the time of a single request.
+
+The default message needs the agent; questions the fast path answers
+(such as "total sales by branch") skip the LLM and measure nothing here.
+
+Usage:
+    python benchmarks/chat_concurrency.py --url http://localhost:8000 -n 10
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Optional, Tuple
+
+import httpx
+
+# Filtered question the fast path does not match, so every request runs the agent
+DEFAULT_MESSAGE = "Which product line had the highest average rating among female members?"
+
+
+async def send_chat(client: httpx.AsyncClient, url: str, message: str) -> Tuple[float, Optional[str]]:
+    """Send one chat message and return its latency in seconds and the tool that answered"""
+    start = time.perf_counter()
+    response = await client.post(
+        f"{url}/api/chat",
+        json={"message": message, "session_id": f"bench-{uuid.uuid4()}"}
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start, response.json().get("tool_used")
+
+
+async def run(url: str, message: str, concurrency: int):
+    async with httpx.AsyncClient(timeout=300) as client:
+        single, tool_used = await send_chat(client, url, message)
+        print(f"Single request:          {single:.2f}s (tool: {tool_used})")
+        if tool_used == "fast_path":
+            print("  warning: answered by the fast path without the agent; pick another --message")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(send_chat(client, url, message) for _ in range(concurrency))
+        )
+        wall = time.perf_counter() - start
+        latencies = [latency for latency, _ in results]
+
+    print(f"{concurrency} parallel requests:  {wall:.2f}s wall")
+    print(f"  min/avg/max latency:   {min(latencies):.2f}s / "
+          f"{sum(latencies) / len(latencies):.2f}s / {max(latencies):.2f}s")
+    print(f"  speedup vs serial:     {single * concurrency / wall:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--message", default=DEFAULT_MESSAGE, help="chat message to send; it should reach the agent")
+    parser.add_argument("-n", "--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    asyncio.run(run(args.url, args.message, args.concurrency))
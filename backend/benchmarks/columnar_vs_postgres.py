@@ -0,0 +1,118 @@
+"""
+In-process columnar store vs PostgreSQL for the fast-path queries
+
+Loads the sales export, repeated --scale times, into SalesColumns and
+times the query of each fast-path question on it. With --postgres the
+same rows are copied into a sales_bench table and the SQL the fast path
+would send is timed there too, checking both return the same rows.
+
+Usage (from the backend directory):
+    python benchmarks/columnar_vs_postgres.py ../Supermarket_Sales.csv --scale 1000 --threads 4 --postgres
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import pandas as pd
+from sqlalchemy import text
+from app.agents.fast_path import match_question
+from app.services.columnar import SalesColumns
+from app.services.sales_loader import read_csv_chunks, parse_sales_chunk, copy_frame
+
+QUESTIONS = [
+    "total sales by branch",
+    "average rating by product line",
+    "top 3 product lines by revenue",
+    "number of transactions by payment method",
+    "quantity by gender",
+    "monthly sales",
+    "weekly revenue",
+    "sales over time",
+]
+
+
+def load_frame(csv_path: str, scale: int) -> pd.DataFrame:
+    df = pd.concat([parse_sales_chunk(chunk)[0] for chunk in read_csv_chunks(csv_path, 100_000)], ignore_index=True)
+    return pd.concat([df] * scale, ignore_index=True)
+
+
+def timed(run, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = run()
+    return (time.perf_counter() - start) / iterations * 1000, data
+
+
+def same_data(a, b) -> bool:
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a.values(), row_b.values()):
+            if isinstance(x, float) and y is not None:
+                if abs(x - float(y)) > 0.011:
+                    return False
+            elif str(x) != str(y):
+                return False
+    return True
+
+
+def copy_to_postgres(df: pd.DataFrame):
+    from app.database import engine
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("DROP TABLE IF EXISTS sales_bench")
+        cursor.execute("CREATE UNLOGGED TABLE sales_bench (LIKE sales INCLUDING DEFAULTS)")
+        copy_frame(cursor, df, "sales_bench")
+        cursor.execute("ANALYZE sales_bench")
+        raw.commit()
+    finally:
+        raw.close()
+    return engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path")
+    parser.add_argument("--scale", type=int, default=100, help="Times to repeat the export's rows")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    parser.add_argument("--postgres", action="store_true", help="Also time the SQL on a sales_bench table")
+    args = parser.parse_args()
+
+    df = load_frame(args.csv_path, args.scale)
+    started = time.perf_counter()
+    columns = SalesColumns.from_frame(df, data_version=0)
+    print(f"rows: {columns.rows}, encoded in {time.perf_counter() - started:.2f}s, "
+          f"{columns.nbytes() / 1024 / 1024:.1f} MB\n")
+
+    engine = None
+    if args.postgres:
+        started = time.perf_counter()
+        engine = copy_to_postgres(df)
+        print(f"copied to sales_bench in {time.perf_counter() - started:.2f}s\n")
+
+    pool = ThreadPoolExecutor(max_workers=args.threads) if args.threads > 1 else None
+    print(f"{'columnar ms':>12} {'postgres ms':>12} {'speedup':>8}  match  question")
+    for question in QUESTIONS:
+        intent = match_question(question)
+        plan = intent.to_plan()
+        columnar_ms, columnar_data = timed(lambda: columns.execute(plan, pool, args.threads), args.iterations)
+        if engine is None:
+            print(f"{columnar_ms:12.2f} {'-':>12} {'-':>8}  -      {question}")
+            continue
+
+        sql = intent.to_sql().replace("FROM sales", "FROM sales_bench")
+        with engine.connect() as conn:
+            postgres_ms, rows = timed(lambda: conn.execute(text(sql)).mappings().all(), args.iterations)
+        postgres_data = [dict(row) for row in rows]
+        print(f"{columnar_ms:12.2f} {postgres_ms:12.2f} {postgres_ms / columnar_ms:7.1f}x  "
+              f"{'yes' if same_data(columnar_data, postgres_data) else 'NO':5}  {question}")
+
+    if engine is not None:
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE sales_bench"))
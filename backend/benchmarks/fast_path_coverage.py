@@ -0,0 +1,70 @@
+"""
+Coverage of the deterministic fast path on a query log
+
+Reads questions from a text file (one per line) or from the
+conversations table, and reports how many the fast path would answer
+without an LLM, broken down by question shape, plus the most common
+questions it does not cover.
+
+Usage (from the backend directory):
+    python benchmarks/fast_path_coverage.py questions.txt
+    python benchmarks/fast_path_coverage.py --from-db
+"""
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from app.agents.fast_path import match_question
+
+
+def load_questions(args):
+    if args.from_db:
+        from app.database import SessionLocal
+        from app.models.database_models import Conversation
+        db = SessionLocal()
+        try:
+            return [row.user_message for row in db.query(Conversation.user_message).all()]
+        finally:
+            db.close()
+    with open(args.path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", help="Text file with one question per line")
+    parser.add_argument("--from-db", action="store_true", help="Read questions from the conversations table")
+    parser.add_argument("--show", type=int, default=20, help="Number of unmatched questions to list")
+    args = parser.parse_args()
+    if not args.path and not args.from_db:
+        parser.error("give a question file or --from-db")
+
+    questions = load_questions(args)
+    shapes = Counter()
+    unmatched = Counter()
+
+    start = time.perf_counter()
+    for question in questions:
+        intent = match_question(question)
+        if intent is None:
+            unmatched[question.strip().lower()] += 1
+        else:
+            shapes[intent.shape] += 1
+    elapsed = time.perf_counter() - start
+
+    matched = sum(shapes.values())
+    total = len(questions)
+    print(f"Questions: {total}")
+    print(f"Covered:   {matched} ({matched / total:.1%})" if total else "Covered:   0")
+    print(f"Matching:  {elapsed / max(total, 1) * 1e6:.1f} us/question")
+    for shape, count in shapes.most_common():
+        print(f"  {shape:12} {count}")
+
+    if unmatched:
+        print(f"\nMost common unmatched questions:")
+        for question, count in unmatched.most_common(args.show):
+            print(f"  {count:5}  {question}")
@@ -0,0 +1,64 @@
+"""
+Per-request setup cost of the SQL tools' dependencies
+
+Times building an engine, LLM client and SQLDatabase wrapper from scratch
+(what query_and_visualize used to do on every call) against fetching them
+from the shared resource registry, and prints the pool's connection counts.
+
+Usage (from the backend directory):
+    python benchmarks/resource_setup.py -n 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from langchain_community.utilities import SQLDatabase
+from langchain_openai import ChatOpenAI
+from sqlalchemy import create_engine
+from app.config import get_settings
+from app.resources import get_registry
+
+settings = get_settings()
+
+
+def build_per_call():
+    engine = create_engine(settings.database_url)
+    ChatOpenAI(
+        model=settings.openai_model,
+        temperature=0,
+        openai_api_key=settings.openai_api_key,
+        base_url=settings.openai_base_url
+    )
+    SQLDatabase(engine, include_tables=["sales"])
+    return engine
+
+
+def fetch_from_registry():
+    registry = get_registry()
+    registry.get_llm(temperature=0)
+    registry.get_sql_database()
+
+
+def timed(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    engines = []
+    per_call = timed(lambda: engines.append(build_per_call()), args.iterations)
+    print(f"Per-call setup:  {per_call:.2f} ms/request, {len(engines)} engines created")
+
+    fetch_from_registry()  # Warm up
+    shared = timed(fetch_from_registry, args.iterations)
+    print(f"Registry fetch:  {shared:.3f} ms/request")
+    print(f"Registry stats:  {get_registry().stats()}")
@@ -0,0 +1,70 @@
+"""
+Raw sales table vs rollup tables for typical chart queries
+
+Runs each query on the raw sales table and on the rollup chosen by the
+rewriter, checks both return the same rows and prints the timings.
+Run load_sales_data.py first so the rollups exist.
+
+Usage (from the backend directory):
+    python benchmarks/rollup_queries.py -n 5
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import text
+from app.database import engine
+from app.services.rollups import rewrite_to_rollup
+
+QUERIES = [
+    "SELECT branch, SUM(total) AS total_sales FROM sales GROUP BY branch ORDER BY total_sales DESC",
+    "SELECT product_line, SUM(quantity) AS units FROM sales GROUP BY product_line ORDER BY units DESC LIMIT 5",
+    "SELECT payment, AVG(rating) AS avg_rating FROM sales GROUP BY payment",
+    "SELECT date, SUM(total) AS daily_sales FROM sales GROUP BY date ORDER BY date",
+    "SELECT DATE_TRUNC('month', date) AS month, branch, SUM(total) AS sales FROM sales GROUP BY 1, 2 ORDER BY 1, 2",
+    "SELECT gender, customer_type, COUNT(*) AS transactions FROM sales GROUP BY gender, customer_type",
+]
+
+
+def timed(conn, sql: str, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        rows = conn.execute(text(sql)).fetchall()
+    return (time.perf_counter() - start) / iterations * 1000, rows
+
+
+def same_rows(a, b) -> bool:
+    if len(a) != len(b):
+        return False
+    for row_a, row_b in zip(a, b):
+        for x, y in zip(row_a, row_b):
+            if isinstance(x, (int, float)) or hasattr(x, "__float__"):
+                if abs(float(x) - float(y)) > 1e-6 * max(1.0, abs(float(x))):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        sales_rows = conn.execute(text("SELECT COUNT(*) FROM sales")).scalar()
+        print(f"sales rows: {sales_rows}\n")
+        print(f"{'raw ms':>10} {'rollup ms':>10} {'speedup':>8}  match  rollup / query")
+
+        for sql in QUERIES:
+            raw_ms, raw_rows = timed(conn, sql, args.iterations)
+            rewritten = rewrite_to_rollup(sql)
+            if rewritten is None:
+                print(f"{raw_ms:10.2f} {'-':>10} {'-':>8}  -      (not rewritable) {sql}")
+                continue
+            rollup_ms, rollup_rows = timed(conn, rewritten[0], args.iterations)
+            print(f"{raw_ms:10.2f} {rollup_ms:10.2f} {raw_ms / rollup_ms:7.1f}x  "
+                  f"{'yes' if same_rows(raw_rows, rollup_rows) else 'NO':5}  {rewritten[1]} / {sql}")
@@ -1,115 +1,144 @@
-import pandas as pd
+import argparse
 import sys
 from pathlib import Path
-from datetime import datetime
 from sqlalchemy.orm import Session
 
 # Add the backend directory to the path
 sys.path.append(str(Path(__file__).parent))
 
 from app.database import engine, SessionLocal
-from app.models.database_models import Sales, Base
+from app.models.database_models import Base
 from app.config import get_settings
+from app.services.data_version import bump_data_version, get_data_version, SALES_DATASET
+from app.services.rollups import refresh_rollups, ROLLUPS_DATASET
+from app.services.sales_loader import bulk_load_csv, insert_load_csv, count_sales
+from app.services.sales_ingest import ensure_ingest_schema, ingest_csv
 
 settings = get_settings()
 
 
-def load_csv_to_database(csv_path: str):
-    """Load supermarket sales data from CSV into PostgreSQL database"""
+def _print_progress(rows: int, seconds: float):
+    print(f"Loaded {rows:,} rows ({rows / seconds if seconds else 0:,.0f} rows/s)...")
+
+
+def load_csv_to_database(
+    csv_path: str,
+    replace: bool = False,
+    bulk: bool = True,
+    chunk_size: int = 100_000,
+    drop_indexes: bool = False
+):
+    """Load supermarket sales data from CSV into the database"""
     
     print(f"Loading data from: {csv_path}")
     
-    # Read CSV file
-    try:
-        df = pd.read_csv(csv_path)
-        print(f"Found {len(df)} rows in CSV file")
-        print(f"Columns: {df.columns.tolist()}")
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
-        return
-    
     # Create tables if they don't exist
     Base.metadata.create_all(bind=engine)
     print("Database tables created/verified")
     
-    # Create database session
-    db: Session = SessionLocal()
+    existing_count = count_sales(engine)
+    if existing_count > 0:
+        action = "Replacing" if replace else "Appending to"
+        print(f"{action} {existing_count} existing records")
     
     try:
-        # Clear existing data (optional - remove if you want to keep existing data)
-        existing_count = db.query(Sales).count()
-        if existing_count > 0:
-            response = input(f"Database has {existing_count} existing records. Delete them? (yes/no): ")
-            if response.lower() == 'yes':
-                db.query(Sales).delete()
-                db.commit()
-                print(f"Deleted {existing_count} existing records")
-        
-        # Process and insert data
-        records_added = 0
-        errors = 0
-        
-        for index, row in df.iterrows():
-            try:
-                # Parse date (handle different date formats)
-                date_str = str(row['Date'])
-                try:
-                    date_obj = pd.to_datetime(date_str).date()
-                except:
-                    date_obj = datetime.strptime(date_str, '%m/%d/%Y').date()
-                
-                # Calculate total
-                unit_price = float(row['Unit price'])
-                quantity = int(row['Quantity'])
-                total = unit_price * quantity
-                
-                # Create Sales record
-                sales_record = Sales(
-                    date=date_obj,
-                    branch=str(row['Branch']),
-                    customer_type=str(row['Customer type']),
-                    gender=str(row['Gender']),
-                    product_line=str(row['Product line']),
-                    unit_price=unit_price,
-                    quantity=quantity,
-                    payment=str(row['Payment']),
-                    rating=float(row['Rating']),
-                    total=total
-                )
-                
-                db.add(sales_record)
-                records_added += 1
-                
-                # Commit in batches of 100
-                if records_added % 100 == 0:
-                    db.commit()
-                    print(f"Processed {records_added} records...")
-                    
-            except Exception as e:
-                errors += 1
-                print(f"Error processing row {index}: {e}")
-                continue
-        
-        # Final commit
-        db.commit()
-        
-        print(f"\n✓ Successfully loaded {records_added} records into the database")
-        if errors > 0:
-            print(f"✗ {errors} records failed to load")
-        
-        # Verify data
-        total_records = db.query(Sales).count()
-        print(f"Total records in database: {total_records}")
-        
+        # COPY is PostgreSQL only; other databases get multi-row INSERTs
+        if bulk and engine.dialect.name == "postgresql":
+            stats = bulk_load_csv(
+                engine,
+                csv_path,
+                chunk_size=chunk_size,
+                replace=replace,
+                drop_indexes=drop_indexes,
+                progress=_print_progress
+            )
+        else:
+            stats = insert_load_csv(
+                engine,
+                csv_path,
+                chunk_size=chunk_size,
+                replace=replace,
+                progress=_print_progress
+            )
     except Exception as e:
         print(f"Error during import: {e}")
-        db.rollback()
+        return None
+    
+    db: Session = SessionLocal()
+    try:
+        # Invalidate caches built on the sales table and rebuild the rollups
+        data_version = bump_data_version(db)
+        refresh_rollups(db, data_version)
+        print("Refreshed sales rollup tables")
     finally:
         db.close()
+    
+    print(f"\n✓ Successfully loaded {stats['rows']} records in {stats['seconds']}s ({stats['rows_per_second']:,} rows/s)")
+    if stats["indexes_rebuilt"]:
+        print(f"  Rebuilt {stats['indexes_rebuilt']} indexes")
+    if stats["errors"] > 0:
+        print(f"✗ {stats['errors']} records failed to load")
+    
+    # Verify data
+    print(f"Total records in database: {count_sales(engine)}")
+    return stats
 
 
-if __name__ == "__main__":
-    # Path to CSV file (relative to backend directory)
+def ingest_csv_incrementally(
+    csv_path: str,
+    source: str = None,
+    chunk_size: int = 100_000,
+    full_scan: bool = False
+):
+    """Upsert only the new or changed rows of a CSV export"""
+    
+    print(f"Ingesting changes from: {csv_path}")
+    
+    Base.metadata.create_all(bind=engine)
+    ensure_ingest_schema(engine)
+    
+    # Rollups can only be patched if they were current before this run
+    rollups_current = get_data_version(engine, ROLLUPS_DATASET) == get_data_version(engine, SALES_DATASET)
+    
+    try:
+        stats = ingest_csv(
+            engine,
+            csv_path,
+            source=source,
+            chunk_size=chunk_size,
+            full_scan=full_scan,
+            progress=_print_progress
+        )
+    except Exception as e:
+        print(f"Error during ingestion: {e}")
+        return None
+    
+    print(
+        f"\n✓ {stats['mode'].capitalize()} scan of {stats['source']}: read {stats['rows_read']} rows in {stats['seconds']}s, "
+        f"{stats['inserted']} inserted, {stats['updated']} updated, {stats['deleted']} deleted, {stats['unchanged']} unchanged"
+    )
+    if stats["errors"] > 0:
+        print(f"✗ {stats['errors']} records failed to parse")
+    
+    if not stats["changed"]:
+        # Nothing changed, so caches and rollups stay valid
+        print("No changes, caches and rollups left as they are")
+        return stats
+    
+    db: Session = SessionLocal()
+    try:
+        data_version = bump_data_version(db)
+        date_range = stats["date_range"] if rollups_current else None
+        refresh_rollups(db, data_version, date_range=date_range)
+        scope = f"{date_range[0]} to {date_range[1]}" if date_range else "all dates"
+        print(f"Refreshed sales rollup tables for {scope}")
+    finally:
+        db.close()
+    
+    return stats
+
+
+def _find_csv() -> Path:
     # Try multiple possible locations
     possible_paths = [
         Path(__file__).parent / "Supermarket_Sales.csv",  # Same directory as script
@@ -117,17 +146,44 @@ if __name__ == "__main__":
         Path("/app") / "Supermarket_Sales.csv",  # Docker root
     ]
     
-    csv_path = None
     for path in possible_paths:
         if path.exists():
-            csv_path = path
-            break
-    
-    if csv_path is None:
-        print(f"Error: CSV file not found in any of these locations:")
-        for path in possible_paths:
-            print(f"  - {path}")
-        print("\nPlease ensure Supermarket_Sales.csv is in the project root directory")
-        sys.exit(1)
+            return path
     
-    load_csv_to_database(str(csv_path))
+    print(f"Error: CSV file not found in any of these locations:")
+    for path in possible_paths:
+        print(f"  - {path}")
+    print("\nPlease ensure Supermarket_Sales.csv is in the project root directory")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load a supermarket sales CSV export into the sales table")
+    parser.add_argument("csv_path", nargs="?", help="CSV file (default: the bundled Supermarket_Sales.csv)")
+    parser.add_argument("--replace", action="store_true", help="Delete existing sales rows first (default: append)")
+    parser.add_argument("--no-bulk", action="store_true", help="Use INSERTs instead of PostgreSQL COPY")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Rows parsed and copied per chunk")
+    parser.add_argument("--drop-indexes", action="store_true", help="Drop secondary indexes during the load and rebuild them after")
+    parser.add_argument("--incremental", action="store_true", help="Upsert only new or changed rows, tracked per source file")
+    parser.add_argument("--source", help="Source name for --incremental (default: the file name)")
+    parser.add_argument("--full-scan", action="store_true", help="With --incremental, rehash the whole file instead of reading from the watermark")
+    args = parser.parse_args()
+    
+    csv_path = Path(args.csv_path) if args.csv_path else _find_csv()
+    if args.incremental:
+        stats = ingest_csv_incrementally(
+            str(csv_path),
+            source=args.source,
+            chunk_size=args.chunk_size,
+            full_scan=args.full_scan
+        )
+    else:
+        stats = load_csv_to_database(
+            str(csv_path),
+            replace=args.replace,
+            bulk=not args.no_bulk,
+            chunk_size=args.chunk_size,
+            drop_indexes=args.drop_indexes
+        )
+    if stats is None:
+        sys.exit(1)
@@ -11,9 +11,22 @@ CREATE TABLE IF NOT EXISTS sales (
     payment VARCHAR(50),
     rating DECIMAL(3, 1),
     total DECIMAL(10, 2),
+    -- Set by incremental ingestion: source file, data row number in it, content hash
+    source VARCHAR(255),
+    source_row INTEGER,
+    row_hash BIGINT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- How far each source file has been ingested incrementally
+CREATE TABLE IF NOT EXISTS ingest_watermarks (
+    source VARCHAR(255) PRIMARY KEY,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    byte_offset BIGINT NOT NULL DEFAULT 0,
+    tail_hash VARCHAR(32),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Insert sample data
 INSERT INTO sales (date, branch, customer_type, gender, product_line, unit_price, quantity, payment, rating, total) VALUES
 ('2024-01-15', 'A', 'Member', 'Female', 'Electronics', 299.99, 2, 'Credit card', 8.5, 599.98),
@@ -42,6 +55,8 @@ CREATE INDEX idx_sales_date ON sales(date);
 CREATE INDEX idx_sales_branch ON sales(branch);
 CREATE INDEX idx_sales_product_line ON sales(product_line);
 CREATE INDEX idx_sales_customer_type ON sales(customer_type);
+-- Identity of incrementally ingested rows (NULL for rows loaded otherwise)
+CREATE UNIQUE INDEX idx_sales_source_row ON sales(source, source_row);
 
 -- Grant permissions
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO postgres;